@@ -37,6 +37,7 @@ Script which installs packages on ARGO mon boxes.
 %install
 %{py3_install "--record=INSTALLED_FILES" }
 install --directory %{buildroot}/%{_localstatedir}/log/argo-poem-tools/
+install --directory %{buildroot}/%{_localstatedir}/cache/argo-poem-tools/
 
 
 %clean
@@ -50,6 +51,7 @@ rm -rf $RPM_BUILD_ROOT
 %{python3_sitelib}/%{underscore %{name}}/*.py
 
 %attr(0755,root,root) %dir %{_localstatedir}/log/argo-poem-tools/
+%attr(0755,root,root) %dir %{_localstatedir}/cache/argo-poem-tools/
 
 %changelog
 * Thu Apr 4 2024 Katarina Zailac <kzailac@srce.hr> - 0.2.7-1%{?dist}
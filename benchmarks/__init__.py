@@ -0,0 +1,18 @@
+import importlib.util
+import os
+import sys
+
+# the package is installed as argo_poem_tools, while in the source tree the
+# modules are in the modules/ directory
+if 'argo_poem_tools' not in sys.modules:
+    _path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'modules', '__init__.py'
+    )
+    _spec = importlib.util.spec_from_file_location(
+        'argo_poem_tools', _path,
+        submodule_search_locations=[os.path.dirname(_path)]
+    )
+    _module = importlib.util.module_from_spec(_spec)
+    sys.modules['argo_poem_tools'] = _module
+    _spec.loader.exec_module(_module)
@@ -0,0 +1,52 @@
+"""
+Compares the time needed by the subprocess and dnf backends to query
+available and installed packages. It has to be run on a host with yum/dnf
+configured:
+
+    python3 -m benchmarks.backends [-n RUNS] PACKAGE [PACKAGE ...]
+"""
+import argparse
+import time
+
+import benchmarks  # noqa: F401 - registers argo_poem_tools
+from argo_poem_tools.backends import DNFBackend, SubprocessBackend
+
+
+def _measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', dest='runs', type=int, default=5)
+    parser.add_argument('packages', nargs='+')
+    args = parser.parse_args()
+
+    backends = [SubprocessBackend()]
+    try:
+        backends.append(DNFBackend())
+
+    except ImportError:
+        print('dnf/rpm Python bindings not available, skipping dnf backend')
+
+    for backend in backends:
+        for query, func in [
+            # available() of subprocess backend is a generator, so it is
+            # consumed for yum to be actually run
+            ('available', lambda: list(backend.available(args.packages))),
+            ('installed', backend.installed)
+        ]:
+            best, mean = _measure(func, args.runs)
+            print('{:<12}{:<12}best {:8.3f} s    mean {:8.3f} s'.format(
+                backend.name, query, best, mean
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+Benchmarks of the stages of package resolution in Packages, with synthetic
+yum and rpm outputs at several scales. Subprocess calls are mocked, so the
+benchmarks can be run anywhere:
+
+    python3 -m benchmarks.resolution [--save-baseline] [--threshold 0.25]
+
+Results are compared to the baseline saved by a previous run with
+--save-baseline (benchmarks/baseline.json by default), and the exit status
+is 1 if any stage is slower than the baseline by more than the threshold.
+The baseline depends on the machine, so it is meant to be kept locally.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from unittest import mock
+
+import benchmarks  # noqa: F401 - registers argo_poem_tools
+from argo_poem_tools.packages import Packages, _evr_key, _version_key
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# name: (available entries, requested packages, installed packages)
+SCALES = {
+    'small': (100, 50, 500),
+    'medium': (10000, 500, 2000),
+    'large': (100000, 2000, 5000)
+}
+
+
+def _release(i, j):
+    return '{}.{:07x}.el7'.format(20200101000000 + j, i)
+
+
+def synthetic_data(n_requested):
+    """
+    POEM data with the given number of requested packages; every third one
+    is requested with a version which is not available.
+    """
+    packages = []
+    for i in range(n_requested):
+        if i % 3 == 0:
+            version = '9.9.9'
+
+        elif i % 3 == 1:
+            version = '1.{}.0'.format(i % 5)
+
+        else:
+            version = 'present'
+
+        packages.append({'name': 'argo-probe-{}'.format(i), 'version': version})
+
+    return {
+        'argo-devel': {
+            'content': '[argo-devel]\nname=ARGO\nenabled=1\n',
+            'packages': packages
+        }
+    }
+
+
+def synthetic_yum_list(n_available, n_requested):
+    """
+    Output of yum list available, with the available entries spread over
+    twice as many names as there are requested packages.
+    """
+    n_names = 2 * n_requested
+    n_versions = max(1, n_available // n_names)
+    lines = [
+        'Loaded plugins: fastestmirror, ovl, versionlock',
+        'Available Packages'
+    ]
+    for i in range(n_names):
+        name = 'argo-probe-{}.noarch'.format(i)
+        for j in range(n_versions):
+            vr = '1.{}.0-{}'.format(j, _release(i, j))
+            if i % 50 == 0:
+                # long names are wrapped by yum
+                lines.append(name)
+                lines.append('    {}    argo-devel'.format(vr))
+
+            else:
+                lines.append('{}    {}    argo-devel'.format(name, vr))
+
+    return '\n'.join(lines).encode('utf-8')
+
+
+def synthetic_rpm_qa(n_installed, n_requested):
+    """
+    Output of rpm -qa --qf with half of the requested packages installed,
+    and the rest of the packages unrelated.
+    """
+    lines = []
+    for i in range(0, n_requested, 2):
+        lines.append(
+            'argo-probe-{} 0 1.0.0 {} noarch'.format(i, _release(i, 0))
+        )
+
+    for i in range(n_installed - len(lines)):
+        lines.append('package-{} 0 {}.{}.{} {}.el7 x86_64'.format(
+            i, i % 7, i % 11, i % 13, i % 3
+        ))
+
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _popen(output):
+    def popen(*args, **kwargs):
+        proc = mock.MagicMock()
+        proc.stdout = io.BytesIO(output)
+        proc.stderr = io.BytesIO(b'')
+        proc.wait.return_value = 0
+        return proc
+
+    return popen
+
+
+class Scenario:
+    def __init__(self, n_available, n_requested, n_installed):
+        self.data = synthetic_data(n_requested)
+        self.yum_list = synthetic_yum_list(n_available, n_requested)
+        self.rpm_qa = synthetic_rpm_qa(n_installed, n_requested)
+        self.available = None
+        self.installed = None
+
+    def _packages(self):
+        pkgs = Packages(self.data)
+        pkgs.versions_unlocked = True
+        return pkgs
+
+    def _patches(self):
+        return [
+            mock.patch(
+                'argo_poem_tools.backends.subprocess.Popen',
+                side_effect=_popen(self.yum_list)
+            ),
+            mock.patch(
+                'argo_poem_tools.backends.subprocess.check_output',
+                return_value=self.rpm_qa
+            ),
+            mock.patch(
+                'argo_poem_tools.packages.rpmdb_cookie', return_value=None
+            )
+        ]
+
+    def available_packages(self):
+        pkgs = self._packages()
+        return lambda: list(pkgs._get_available_packages())
+
+    def installed_packages(self):
+        pkgs = self._packages()
+        return pkgs._get_installed_index
+
+    def exceptions(self):
+        pkgs = self._packages()
+        pkgs._get_available_packages = lambda: self.available
+        return pkgs._get_exceptions
+
+    def resolve(self):
+        pkgs = self._packages()
+        pkgs._get_available_packages = lambda: self.available
+        pkgs._get_exceptions()
+        pkgs._get_installed_packages = lambda: self.installed
+        return pkgs._get
+
+    def versions(self):
+        candidates = [
+            (pkg['name'], pkg['version'], pkg['release'])
+            for pkg in self.available
+        ]
+
+        def pick_max():
+            return max(candidates, key=lambda pkg: _evr_key(pkg[1], pkg[2]))
+
+        return pick_max
+
+    STAGES = [
+        'available_packages', 'installed_packages', 'exceptions', 'resolve',
+        'versions'
+    ]
+
+    def run(self, stage, repeat):
+        patches = self._patches()
+        for patch in patches:
+            patch.start()
+
+        try:
+            # parsed outputs, used as input of the later stages
+            if self.available is None:
+                self.available = list(
+                    self._packages()._get_available_packages()
+                )
+                self.installed = self._packages()._get_installed_packages()
+
+            best = None
+            for _ in range(repeat):
+                func = getattr(self, stage)()
+                # every stage is measured with empty version key cache, as in
+                # the first run of the tool
+                _evr_key.cache_clear()
+                _version_key.cache_clear()
+                start = time.perf_counter()
+                func()
+                duration = time.perf_counter() - start
+                best = duration if best is None else min(best, duration)
+
+            return best
+
+        finally:
+            for patch in patches:
+                patch.stop()
+
+
+def run(scales, repeat):
+    results = dict()
+    for scale in scales:
+        scenario = Scenario(*SCALES[scale])
+        results[scale] = dict(
+            (stage, scenario.run(stage, repeat)) for stage in Scenario.STAGES
+        )
+
+    return results
+
+
+def compare(results, baseline, threshold, min_delta=0.001):
+    """
+    Compare results to the baseline. Differences smaller than min_delta are
+    ignored, since they are within the noise for the fastest stages.
+    :return: list of descriptions of regressions
+    """
+    regressions = []
+    for scale, stages in results.items():
+        for stage, duration in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            if base and duration > base * (1 + threshold) and \
+                    duration - base > min_delta:
+                regressions.append(
+                    '{}/{}: {:.4f} s, baseline {:.4f} s (+{:.0f}%)'.format(
+                        scale, stage, duration, base,
+                        100 * (duration / base - 1)
+                    )
+                )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--scale', dest='scales', action='append', choices=sorted(SCALES),
+        help='scale to run, all of them by default'
+    )
+    parser.add_argument('--repeat', dest='repeat', type=int, default=5)
+    parser.add_argument('--baseline', dest='baseline', default=BASELINE)
+    parser.add_argument(
+        '--save-baseline', dest='save', action='store_true',
+        help='save the results as the new baseline'
+    )
+    parser.add_argument(
+        '--threshold', dest='threshold', type=float, default=0.25,
+        help='allowed slowdown relative to the baseline (default: 0.25)'
+    )
+    args = parser.parse_args()
+
+    scales = args.scales if args.scales else list(SCALES)
+    results = run(scales, args.repeat)
+
+    baseline = dict()
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    for scale in scales:
+        for stage, duration in results[scale].items():
+            base = baseline.get(scale, {}).get(stage)
+            print('{:<8}{:<22}{:10.4f} s{}'.format(
+                scale, stage, duration,
+                '   (baseline {:.4f} s)'.format(base) if base else ''
+            ))
+
+    if args.save:
+        for scale in scales:
+            baseline[scale] = results[scale]
+
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+        print('Baseline saved to ' + args.baseline)
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print('Regressions:')
+        for regression in regressions:
+            print('  ' + regression)
+
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Startup time of argo-poem-packages.py on the paths which do not contact
+POEM (--help and --check). Each path is run in a new interpreter, and its
+wall time is compared to the one of an empty interpreter:
+
+    python3 -m benchmarks.startup [--runs 10] [--budget 100]
+
+The exit status is 1 if the startup overhead of any of the paths exceeds
+the budget (in milliseconds), or if any of them imports requests. The
+slowest imports, as reported by python3 -X importtime, are listed for
+each path, except the ones already imported by an empty interpreter.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'exec', 'argo-poem-packages.py')
+
+# paths of the tool which are expected to start fast
+PATHS = [['--help'], ['--check']]
+
+# modules which must not be imported on those paths
+FORBIDDEN = ['requests', 'urllib3']
+
+
+def _run(args, env):
+    start = time.perf_counter()
+    subprocess.call(
+        [sys.executable] + args, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - start
+
+
+def measure(args, env, runs):
+    """
+    Best wall time of the given interpreter arguments in seconds.
+    """
+    return min(_run(args, env) for _ in range(runs))
+
+
+def import_times(args, env):
+    """
+    Cumulative import times reported by -X importtime.
+    :return: dict of module names and their cumulative import time in
+    seconds
+    """
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime'] + args, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    _, stderr = proc.communicate()
+
+    times = dict()
+    for line in stderr.decode('utf-8').split('\n'):
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', dest='runs', type=int, default=10)
+    parser.add_argument(
+        '--budget', dest='budget', type=float, default=100,
+        help='allowed startup overhead over an empty interpreter in '
+             'milliseconds (default: 100)'
+    )
+    parser.add_argument('--top', dest='top', type=int, default=5)
+    args = parser.parse_args()
+
+    status = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # in the source tree, the package is in the modules/ directory
+        os.symlink(
+            os.path.join(ROOT, 'modules'),
+            os.path.join(tmpdir, 'argo_poem_tools')
+        )
+        env = dict(os.environ, PYTHONPATH=tmpdir)
+
+        empty = measure(['-c', 'pass'], env, args.runs)
+        print('{:<12}{:10.1f} ms'.format('interpreter', 1000 * empty))
+        # modules imported by the interpreter itself (e.g. by site) are not
+        # counted
+        preloaded = set(import_times(['-c', 'pass'], env))
+
+        for path in PATHS:
+            duration = measure([SCRIPT] + path, env, args.runs)
+            overhead = 1000 * (duration - empty)
+            print('{:<12}{:10.1f} ms  (+{:.1f} ms, budget {:.0f} ms)'.format(
+                ' '.join(path), 1000 * duration, overhead, args.budget
+            ))
+            if overhead > args.budget:
+                print('  over budget')
+                status = 1
+
+            times = import_times([SCRIPT] + path, env)
+            times = dict(
+                (name, cumulative) for name, cumulative in times.items()
+                if name not in preloaded
+            )
+            forbidden = [name for name in FORBIDDEN if name in times]
+            if forbidden:
+                print('  imports ' + ', '.join(forbidden))
+                status = 1
+
+            slowest = sorted(times.items(), key=lambda item: -item[1])
+            for name, cumulative in slowest[:args.top]:
+                print('  {:<40}{:8.1f} ms'.format(name, 1000 * cumulative))
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
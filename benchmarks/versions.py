@@ -0,0 +1,109 @@
+"""
+Micro-benchmark of picking the newest of the available versions of packages:
+the pairwise comparison loop which used to be in Packages, re-splitting both
+strings on every comparison, against a single max() pass with the cached
+version sort keys. The keys are measured both with empty cache and with the
+cache filled, as it is when the same versions are compared again (when
+looking for exceptions and then for the packages to install).
+
+    python3 -m benchmarks.versions [-n NAMES] [-v VERSIONS]
+"""
+import argparse
+import time
+
+import benchmarks  # noqa: F401 - registers argo_poem_tools
+from argo_poem_tools.packages import _evr_key, _version_key
+
+
+def _legacy_compare_versions(v1, v2):
+    arr1 = [int(i) if i.isnumeric() else i for i in v1.split('.')]
+    arr2 = [int(i) if i.isnumeric() else i for i in v2.split('.')]
+    arr1.extend([0] * (len(arr2) - len(arr1)))
+    arr2.extend([0] * (len(arr1) - len(arr2)))
+
+    for i in range(len(arr1)):
+        if arr1[i] > arr2[i]:
+            return 1
+        elif arr2[i] > arr1[i]:
+            return -1
+
+    return 0
+
+
+def _legacy_compare_vr(vr1, vr2):
+    if vr1[0] == vr2[0]:
+        if vr1[1] == vr2[1]:
+            return 0
+
+        return _legacy_compare_versions(vr1[1], vr2[1])
+
+    return _legacy_compare_versions(vr1[0], vr2[0])
+
+
+def legacy_max(candidates):
+    max_version = candidates[0]
+    for version in candidates:
+        if _legacy_compare_vr(
+                (version[1], version[2]), (max_version[1], max_version[2])
+        ) > 0:
+            max_version = version
+
+    return max_version
+
+
+def keyed_max(candidates):
+    return max(candidates, key=lambda pkg: _evr_key(pkg[1], pkg[2]))
+
+
+def _available(n_names, n_versions):
+    return [
+        [
+            (
+                'argo-probe-{}'.format(i), '{}.{}.{}'.format(j % 3, j, i % 7),
+                '{}.{}.el7'.format(20200101000000 + j, i)
+            ) for j in range(n_versions)
+        ] for i in range(n_names)
+    ]
+
+
+def _measure(func, available, runs=5, warm=False):
+    best = None
+    for _ in range(runs):
+        if not warm:
+            _evr_key.cache_clear()
+            _version_key.cache_clear()
+
+        start = time.perf_counter()
+        for candidates in available:
+            func(candidates)
+
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', dest='names', type=int, default=2000)
+    parser.add_argument('-v', dest='versions', type=int, default=25)
+    args = parser.parse_args()
+
+    available = _available(args.names, args.versions)
+    for candidates in available:
+        assert legacy_max(candidates) == keyed_max(candidates)
+
+    legacy = _measure(legacy_max, available)
+    cold = _measure(keyed_max, available)
+    warm = _measure(keyed_max, available, warm=True)
+    print('pairwise comparison       {:8.3f} s'.format(legacy))
+    print('sort keys, empty cache    {:8.3f} s  ({:.1f}x)'.format(
+        cold, legacy / cold
+    ))
+    print('sort keys, warm cache     {:8.3f} s  ({:.1f}x)'.format(
+        warm, legacy / warm
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,16 +2,581 @@
 import argparse
 import configparser
 import logging
-import logging.handlers
-import subprocess
+import os
+import signal
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from argo_poem_tools import timing
+from argo_poem_tools.backends import BACKENDS, get_backend, \
+    installed_snapshot, rpmdb_cookie, yum_is_dnf
 from argo_poem_tools.config import Config
+from argo_poem_tools.lock import InstanceLock, LockTimeout, wait_for_yum
+from argo_poem_tools.metrics import collect
 from argo_poem_tools.packages import Packages, PackageException
-from argo_poem_tools.repos import YUMRepos
+from argo_poem_tools.plan import Plan, PlanException
+from argo_poem_tools.repos import REPOS_PATH, YUMRepos
+from argo_poem_tools.scheduler import Scheduler
+from argo_poem_tools.state import RunState, pinned
+from argo_poem_tools.versionlock import VersionLockManager
 
 LOGFILE = "/var/log/argo-poem-tools/argo-poem-tools.log"
+CACHE_DIR = "/var/cache/argo-poem-tools"
+PRIVATE_REPOSDIR = "/var/lib/argo-poem-tools/repos.d"
+
+# options which determine the outcome of a run; a run which has been waiting
+# for another one with the same options reuses its result
+RUN_OPTIONS = [
+    'noop', 'backup', 'private_reposdir', 'include_internal', 'force',
+    'backend', 'write_plan', 'apply_plan'
+]
+
+
+def request_errors():
+    """
+    Exceptions raised by requests. The module is imported only when POEM is
+    contacted, and if it has not been imported, none of its exceptions can
+    be raised.
+    :return: tuple of exception classes, empty if requests is not imported
+    """
+    requests = sys.modules.get('requests')
+    if requests is None:
+        return ()
+
+    return requests.exceptions.RequestException,
+
+
+class Agent:
+    """
+    Runs the synchronisation with POEM. The instance is kept between the
+    runs in daemon mode, so that the HTTP session, the cached POEM data and
+    the package backend are reused.
+    """
+    def __init__(self, args, logger):
+        self.args = args
+        self.logger = logger
+        self.repos = None
+        self.backend = None
+        self.state = RunState(CACHE_DIR)
+        self.lock = InstanceLock(timeout=args.lock_timeout)
+        self.changed = False
+        self.counts = dict()
+        self.installed = None
+
+    def _get_repos(self, config):
+        token = config.get_token()
+        hostname = config.get_hostname()
+        profiles = config.get_profiles()
+
+        # the same instance is used as long as the configuration is the same
+        if self.repos and self.repos.hostname == hostname and \
+                self.repos.token == token and self.repos.profiles == profiles:
+            return self.repos
+
+        self.repos = YUMRepos(
+            hostname=hostname, token=token, profiles=profiles,
+            override=not self.args.backup, cache_dir=CACHE_DIR,
+            private_reposdir=self.args.private_reposdir
+        )
+
+        return self.repos
+
+    def _get_backend(self):
+        if not self.backend:
+            self.backend = get_backend(self.args.backend)
+            if self.backend.name != self.args.backend:
+                self.logger.info(
+                    'Python bindings for {} backend not available, using '
+                    '{} backend'.format(self.args.backend, self.backend.name)
+                )
+
+        return self.backend
+
+    def _installed(self, backend):
+        """
+        Get snapshot of installed packages. The snapshot from the previous
+        call is reused as long as rpmdb has not been modified, so that the
+        daemon does not query all the installed packages in each run.
+        :param backend: backend used for the query
+        :return: tuple of rpmdb cookie and list of installed packages
+        """
+        cookie = rpmdb_cookie()
+        if self.installed is None or cookie is None or \
+                cookie != self.installed[0]:
+            self.installed = installed_snapshot(backend)
+
+        return self.installed
+
+    def _prefetched(self, stage, future):
+        """
+        Get result of the query run in the background. If it failed, None is
+        returned, and the query is repeated later by Packages, where the
+        errors are handled.
+        """
+        try:
+            return future.result()
+
+        except Exception as err:
+            self.logger.info('Querying {} failed: {}'.format(stage, err))
+            return None
+
+    def _log_timings(self):
+        self.logger.info('Timings: ' + timing.summary())
+        if self.args.timings:
+            print(timing.report())
+            trace = os.path.join(os.path.dirname(LOGFILE), 'timings.json')
+            try:
+                timing.write_trace(trace)
+
+            except OSError as err:
+                self.logger.warning(
+                    'Unable to write timings trace: ' + str(err)
+                )
+
+    def _write_metrics(self, status):
+        cache_hits = self.repos.cache_hits if self.repos else None
+        metrics = collect(
+            status, timing.elapsed(), timing.get_spans(), noop=self.args.noop,
+            counts=self.counts, cache_hits=cache_hits
+        )
+        try:
+            metrics.write(self.args.metrics)
+
+        except OSError as err:
+            self.logger.warning('Unable to write metrics: ' + str(err))
+
+    def _load_plan(self, backend):
+        """
+        Load the plan to be applied, and check that neither the host nor the
+        desired state has changed since it was written.
+        """
+        plan = Plan.load(self.args.apply_plan)
+        try:
+            installed = self._installed(backend)
+
+        except Exception as err:
+            raise PlanException(
+                'Unable to query installed packages: ' + str(err)
+            )
+
+        fingerprint = self.state.fingerprint(
+            *plan.desired_state, installed=installed[1]
+        )
+        if fingerprint != plan.fingerprint:
+            raise PlanException(
+                'Host has changed since the plan {} was written, run with '
+                '--noop --write-plan again'.format(self.args.apply_plan)
+            )
+
+        return plan, installed
+
+    def _write_plan(self, desired_state, resolved, backend):
+        try:
+            installed = self._installed(backend)
+            plan = Plan(
+                self.state.fingerprint(*desired_state, installed=installed[1]),
+                *desired_state, resolved=resolved
+            )
+            plan.save(self.args.write_plan)
+
+        except Exception as err:
+            raise PlanException('Unable to write plan {}: {}'.format(
+                self.args.write_plan, str(err)
+            ))
+
+        self.logger.info('Plan written to ' + self.args.write_plan)
+
+    def _save_state(self, desired_state, backend):
+        try:
+            installed = self._installed(backend)
+
+        except Exception as err:
+            self.logger.info('Querying installed packages failed: ' + str(err))
+            return
+
+        self.state.save(
+            self.state.fingerprint(*desired_state, installed=installed[1])
+        )
+
+    def run(self):
+        """
+        Run the synchronisation once.
+        :return: exit status
+        """
+        timing.reset()
+        status = 2
+        try:
+            status = self._locked_run()
+            return status
+
+        finally:
+            self._log_timings()
+            if self.args.metrics:
+                self._write_metrics(status)
+
+    def _run_key(self):
+        key = dict((name, getattr(self.args, name)) for name in RUN_OPTIONS)
+        try:
+            key['config'] = os.stat(Config().conf).st_mtime
+
+        except OSError:
+            key['config'] = None
+
+        return key
+
+    def _locked_run(self):
+        """
+        Run the synchronisation holding the instance lock. If another run is
+        holding the lock, the run waits for it, and if the other run had the
+        same inputs, its result is reused instead of repeating the run.
+        """
+        key = self._run_key()
+        since = time.time()
+        try:
+            with timing.span('wait for instance lock'):
+                waited = self.lock.acquire()
+
+        except LockTimeout as err:
+            self.logger.error(err)
+            return 2
+
+        except OSError as err:
+            self.logger.warning(
+                'Unable to take instance lock, running without it: ' +
+                str(err)
+            )
+            return self._run()
+
+        try:
+            if waited:
+                self.logger.info(
+                    'Waited {:.1f} s for another run to finish'.format(waited)
+                )
+                status = self.lock.get_result(key, since)
+                if status is not None:
+                    self.logger.info(
+                        'Reusing result of the run with the same options '
+                        'which finished in the meantime (exit status '
+                        '{})'.format(status)
+                    )
+                    return status
+
+            status = self._run()
+            self.lock.save_result(key, status)
+            return status
+
+        finally:
+            self.lock.release()
+
+    def _wait_for_yum(self):
+        with timing.span('wait for yum lock'):
+            waited = wait_for_yum(self.args.lock_timeout)
+
+        if waited:
+            self.logger.info('Waited {:.1f} s for yum lock'.format(waited))
+
+    def _run(self):
+        noop = self.args.noop
+        include_internal = self.args.include_internal
+        self.changed = False
+        self.counts = dict()
+
+        try:
+            repos = self._get_repos(Config())
+            backend = self._get_backend()
+            versionlock = VersionLockManager()
+            resolved = None
+
+            if self.args.apply_plan:
+                # the data and resolved packages are taken from the plan,
+                # instead of asking POEM and YUM again
+                self.logger.info('Applying plan ' + self.args.apply_plan)
+                with timing.span('plan'):
+                    plan, installed = self._load_plan(backend)
+
+                data, repos.missing_packages, include_internal = \
+                    plan.desired_state
+                repos.data = data
+                resolved = plan.resolved
+                desired_state = plan.desired_state
+
+            else:
+                self.logger.info(
+                    'Sending request for profile(s): ' +
+                    ', '.join(repos.profiles)
+                )
+
+                # installed packages do not depend on the data from POEM, so
+                # they are queried while waiting for the response
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    installed = executor.submit(
+                        timing.inherit(self._installed), backend
+                    )
+                    with timing.span('poem'):
+                        data = repos.get_data(
+                            include_internal=include_internal
+                        )
+
+                installed = self._prefetched('installed packages', installed)
+
+                if not data:
+                    self.logger.warning(
+                        'No data for given metric profile(s): ' +
+                        ', '.join(repos.profiles)
+                    )
+                    return 2
+
+                state = self.state
+                desired_state = (
+                    data, repos.missing_packages, include_internal
+                )
+                # the run cannot be skipped if there are packages requested
+                # as present, since newer versions may have been added to
+                # the repos in the meantime
+                fingerprint = None
+                if installed and pinned(data):
+                    fingerprint = state.fingerprint(
+                        *desired_state, installed=installed[1]
+                    )
+
+                # plan is written even if there is nothing to be done
+                if not self.args.force and not self.args.write_plan and \
+                        state.unchanged(fingerprint):
+                    self.logger.info(
+                        'Nothing changed since the last successful run, '
+                        'skipping (use --force to run anyway).'
+                    )
+                    return 0
+
+            self.changed = True
+
+            # yum would otherwise wait for the lock held by another process
+            # (e.g. puppet) for an unlimited time; nothing before this point
+            # runs yum
+            self._wait_for_yum()
+
+            # repo files backed up by create_file are restored even if the
+            # run fails once they have been written
+            try:
+                # versionlocks are needed only for installing, and they are
+                # queried while the repo files are being written
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    locked = None
+                    if not noop:
+                        locked = executor.submit(
+                            timing.inherit(versionlock.list)
+                        )
+
+                    self.logger.info('Creating YUM repo files...')
+
+                    with timing.span('repos'):
+                        files = repos.create_file(
+                            include_internal=include_internal
+                        )
+
+                    if repos.changed_files:
+                        self.logger.info(
+                            'Created files: ' + '; '.join(repos.changed_files)
+                        )
+
+                    if len(files) > len(repos.changed_files):
+                        self.logger.info('Unchanged files: ' + '; '.join(
+                            sorted(set(files) - set(repos.changed_files))
+                        ))
+
+                    if repos.changed_repos:
+                        self.logger.info(
+                            'Expiring YUM metadata for changed repos: ' +
+                            ', '.join(repos.changed_repos)
+                        )
+                        with timing.span('expire'):
+                            repos.expire_cache()
+
+                if locked:
+                    self._prefetched('versionlocks', locked)
+
+                # the lock may have been taken again while the repo files were
+                # being written
+                self._wait_for_yum()
+
+                # yum 3 holds a global lock, so the download could not
+                # overlap with the versionlock calls, and it would be just an
+                # extra pass
+                pkg = Packages(
+                    data, repo_ids=repos.repo_ids, backend=backend,
+                    versionlock=versionlock, installed=installed,
+                    reposdir=repos.reposdir, prefetch=yum_is_dnf()
+                )
+
+                with timing.span('packages'):
+                    if noop:
+                        info_msg, warn_msg = pkg.no_op()
+
+                    else:
+                        info_msg, warn_msg = pkg.install(resolved=resolved)
+
+                self.counts = pkg.counts
+
+                if self.args.write_plan:
+                    self._write_plan(desired_state, pkg.resolved, backend)
+
+            finally:
+                # if there were repo files backed up, now they are restored
+                repos.clean()
+
+            if info_msg:
+                for msg in info_msg:
+                    self.logger.info(msg)
+
+            if warn_msg:
+                for msg in warn_msg:
+                    self.logger.warning(msg)
+
+                return 1
+
+            else:
+                missing_packages_msg = ''
+                if repos.missing_packages:
+                    missing_packages_msg = \
+                        'Missing packages for given distro: ' + \
+                        ', '.join(repos.missing_packages)
+                    self.logger.warning(missing_packages_msg)
+
+                if not noop:
+                    if missing_packages_msg and not self.args.daemon:
+                        print('WARNING: ' + missing_packages_msg)
+
+                    self._save_state(desired_state, backend)
+
+                self.logger.info("The run finished successfully.")
+                return 0
+
+        # ConnectionError is also a subclass of RequestException
+        except request_errors() as err:
+            self.logger.error(err)
+            return 2
+
+        except configparser.ParsingError as err:
+            self.logger.error(err)
+            return 2
+
+        except configparser.NoSectionError as err:
+            self.logger.error(err)
+            return 2
+
+        except configparser.NoOptionError as err:
+            self.logger.error(err)
+            return 2
+
+        except PackageException as err:
+            self.logger.error(err)
+            return 2
+
+        except PlanException as err:
+            self.logger.error(err)
+            return 2
+
+        except LockTimeout as err:
+            self.logger.error(err)
+            return 2
+
+
+def check(args):
+    """
+    Compare the desired state cached in the last run with the installed
+    packages, without contacting POEM or calling yum, and print the result
+    in the format of Nagios plugins.
+    :return: Nagios status (0 OK, 1 WARNING, 2 CRITICAL, 3 UNKNOWN)
+    """
+    timing.reset()
+    try:
+        config = Config()
+        repos = YUMRepos(
+            hostname=config.get_hostname(), token=config.get_token(),
+            profiles=config.get_profiles(), cache_dir=CACHE_DIR
+        )
+        data = repos.get_cached_data(include_internal=args.include_internal)
+        if not data:
+            print(
+                'UNKNOWN - No cached data from POEM, the tool has not been '
+                'run yet'
+            )
+            return 3
+
+        pkg = Packages(data, backend=get_backend(args.backend))
+        install, upgrade, downgrade = pkg.check()
+
+    except Exception as err:
+        print('UNKNOWN - ' + str(err))
+        return 3
+
+    different_version = [
+        '{} -> {}'.format('-'.join(item[0]), '-'.join(item[1]))
+        for item in upgrade + downgrade
+    ]
+    perfdata = 'requested={} missing={} different_version={} ' \
+               'time={:.3f}s'.format(
+                   len(pkg.package_list), len(install),
+                   len(different_version), timing.elapsed()
+               )
+
+    messages = []
+    if install:
+        messages.append(
+            'Packages not installed: ' + '; '.join(
+                ['-'.join(item) for item in install]
+            )
+        )
+
+    if different_version:
+        messages.append(
+            'Packages with different version: ' + '; '.join(different_version)
+        )
+
+    if install:
+        status = 2
+        print('CRITICAL - ' + ' / '.join(messages) + '|' + perfdata)
+
+    elif different_version:
+        status = 1
+        print('WARNING - ' + ' / '.join(messages) + '|' + perfdata)
+
+    else:
+        status = 0
+        print(
+            'OK - All {} requested packages are installed|{}'.format(
+                len(pkg.package_list), perfdata
+            )
+        )
+
+    return status
+
+
+def daemon(agent, args, logger):
+    scheduler = Scheduler(
+        args.interval, max_interval=args.max_interval, watch=[Config().conf]
+    )
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+
+    logger.info(
+        'Running as daemon with interval of {} s'.format(args.interval)
+    )
+    while True:
+        try:
+            status = agent.run()
+
+        except Exception as err:
+            logger.exception(err)
+            status = 2
+
+        # failed runs are retried without backing off
+        scheduler.update(changed=agent.changed or status == 2)
+        if not scheduler.wait():
+            break
+
+    logger.info('Daemon stopped.')
 
 
 def main():
@@ -24,21 +589,109 @@ def main():
         '--backup-repos', action='store_true', dest='backup',
         help='backup/restore yum repos instead overriding them'
     )
+    parser.add_argument(
+        "--private-reposdir", dest="private_reposdir", nargs="?",
+        const=PRIVATE_REPOSDIR, metavar="DIR",
+        help="write repo files to a private directory (default: {}) instead "
+             "of /etc/yum.repos.d, and point yum to both directories only "
+             "when it is run by this tool".format(PRIVATE_REPOSDIR)
+    )
     parser.add_argument(
         "--include-internal", action="store_true", dest="include_internal",
         help="install probes for internal metrics as well as the ones in "
              "metric profiles"
     )
+    parser.add_argument(
+        "--force", action="store_true", dest="force",
+        help="run even if nothing has changed since the last successful run"
+    )
+    parser.add_argument(
+        "--backend", dest="backend", choices=sorted(BACKENDS.keys()),
+        default="subprocess",
+        help="backend used for querying available and installed packages; "
+             "dnf uses Python bindings and falls back to subprocess if they "
+             "are not available"
+    )
+    parser.add_argument(
+        "--daemon", action="store_true", dest="daemon",
+        help="keep running and repeat the run periodically, and whenever "
+             "the configuration file changes"
+    )
+    parser.add_argument(
+        "--interval", dest="interval", type=int, default=900,
+        help="interval between runs in daemon mode in seconds (default: 900)"
+    )
+    parser.add_argument(
+        "--max-interval", dest="max_interval", type=int, default=3600,
+        help="maximum interval between runs in daemon mode in seconds; the "
+             "interval is doubled up to this value after each run in which "
+             "nothing changed (default: 3600)"
+    )
+    parser.add_argument(
+        "--timings", action="store_true", dest="timings",
+        help="print time spent in each phase of the run, and write it as "
+             "JSON to timings.json next to the log file"
+    )
+    parser.add_argument(
+        "--metrics", dest="metrics", metavar="FILE",
+        help="write metrics of each run to the given file in the format of "
+             "node_exporter textfile collector (e.g. "
+             "/var/lib/node_exporter/textfile_collector/argo-poem-tools.prom)"
+    )
+    parser.add_argument(
+        "--write-plan", dest="write_plan", metavar="FILE",
+        help="together with --noop, write packages to be installed, "
+             "upgraded and downgraded to the given file, so that they can "
+             "be installed later with --apply-plan"
+    )
+    parser.add_argument(
+        "--apply-plan", dest="apply_plan", metavar="FILE",
+        help="install packages from the plan written with --write-plan, "
+             "without contacting POEM or resolving the packages again; the "
+             "run fails if the host has changed since the plan was written"
+    )
+    parser.add_argument(
+        "--lock-timeout", dest="lock_timeout", type=int, default=600,
+        help="maximum time in seconds to wait for another run of the tool, "
+             "and for yum locked by another process (default: 600)"
+    )
+    parser.add_argument(
+        "--check", action="store_true", dest="check",
+        help="check if the installed packages match the data from POEM "
+             "cached in the last run, without contacting POEM or calling "
+             "yum, and report the result as Nagios plugin"
+    )
     args = parser.parse_args()
-    noop = args.noop
-    backup_repos = args.backup
-    include_internal = args.include_internal
+
+    if args.backup and args.private_reposdir:
+        parser.error(
+            '--backup-repos cannot be used with --private-reposdir'
+        )
+
+    if args.private_reposdir and os.path.realpath(args.private_reposdir) == \
+            os.path.realpath(REPOS_PATH):
+        parser.error(
+            '--private-reposdir cannot be the system repo directory ' +
+            REPOS_PATH
+        )
+
+    if args.write_plan and not args.noop:
+        parser.error('--write-plan can only be used with --noop')
+
+    if args.apply_plan and (args.noop or args.daemon):
+        parser.error('--apply-plan cannot be used with --noop or --daemon')
+
+    if args.check:
+        sys.exit(check(args))
+
+    # imported only here, since it is not needed by --check
+    import logging.handlers
 
     logger = logging.getLogger("argo-poem-packages")
     logger.setLevel(logging.INFO)
 
     stdout = logging.StreamHandler()
-    if not noop:
+    if not args.noop:
         stdout.setLevel(logging.WARNING)
 
     stdout.setFormatter(
@@ -59,101 +712,13 @@ def main():
     # add the handler to the root logger
     logger.addHandler(logfile)
 
-    try:
-        subprocess.call(['yum', 'clean', 'all'])
-
-        config = Config()
-        token = config.get_token()
-        hostname = config.get_hostname()
-        profiles = config.get_profiles()
-
-        logger.info(
-            'Sending request for profile(s): ' + ', '.join(profiles)
-        )
-        if backup_repos:
-            repos = YUMRepos(
-                hostname=hostname, token=token, profiles=profiles,
-                override=False
-            )
-
-        else:
-            repos = YUMRepos(hostname=hostname, token=token, profiles=profiles)
-
-        data = repos.get_data(include_internal=include_internal)
-
-        if not data:
-            logger.warning(
-                'No data for given metric profile(s): ' +
-                ', '.join(profiles)
-            )
-            sys.exit(2)
-
-        else:
-            logger.info('Creating YUM repo files...')
-
-            files = repos.create_file(include_internal=include_internal)
-
-            logger.info('Created files: ' + '; '.join(files))
-
-            pkg = Packages(data)
-
-            if noop:
-                info_msg, warn_msg = pkg.no_op()
-
-            else:
-                info_msg, warn_msg = pkg.install()
-
-            # if there were repo files backed up, now they are restored
-            repos.clean()
-
-            if info_msg:
-                for msg in info_msg:
-                    logger.info(msg)
-
-            if warn_msg:
-                for msg in warn_msg:
-                    logger.warning(msg)
-
-                sys.exit(1)
-
-            else:
-                missing_packages_msg = ''
-                if repos.missing_packages:
-                    missing_packages_msg = \
-                        'Missing packages for given distro: ' + \
-                        ', '.join(repos.missing_packages)
-                    logger.warning(missing_packages_msg)
-
-                if not noop:
-                    if missing_packages_msg:
-                        print('WARNING: ' + missing_packages_msg)
-
-                logger.info("The run finished successfully.")
-                sys.exit(0)
-
-    except requests.exceptions.ConnectionError as err:
-        logger.error(err)
-        sys.exit(2)
-
-    except requests.exceptions.RequestException as err:
-        logger.error(err)
-        sys.exit(2)
-
-    except configparser.ParsingError as err:
-        logger.error(err)
-        sys.exit(2)
-
-    except configparser.NoSectionError as err:
-        logger.error(err)
-        sys.exit(2)
+    agent = Agent(args, logger)
 
-    except configparser.NoOptionError as err:
-        logger.error(err)
-        sys.exit(2)
+    if args.daemon:
+        daemon(agent, args, logger)
 
-    except PackageException as err:
-        logger.error(err)
-        sys.exit(2)
+    else:
+        sys.exit(agent.run())
 
 
 if __name__ == '__main__':
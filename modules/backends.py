@@ -0,0 +1,319 @@
+import os
+import shutil
+import subprocess
+import sys
+from functools import lru_cache
+
+from argo_poem_tools import timing
+
+
+_RPM_QF = '%{NAME} %{EPOCHNUM} %{VERSION} %{RELEASE} %{ARCH}\n'
+
+# files which are modified by rpm on every transaction, depending on the
+# rpmdb backend (bdb, sqlite, ndb)
+RPMDB_FILES = [
+    '/var/lib/rpm/Packages',
+    '/var/lib/rpm/rpmdb.sqlite',
+    '/var/lib/rpm/rpmdb.sqlite-wal',
+    '/var/lib/rpm/Packages.db'
+]
+
+# number of packages downloaded at once, if yum is dnf
+PARALLEL_DOWNLOADS = 10
+
+# error of yum list (both yum and dnf) if none of the packages is available
+NO_MATCHING_PACKAGES = 'No matching Packages to list'
+
+
+def _pop_arch(pkg_string):
+    """
+    Pop arch info from RPM package string.
+    :param pkg_string: string with arch info
+    :return: RPM package string without arch info
+    """
+    pkg_string_split = pkg_string.split('.')
+    pkg = '.'.join(pkg_string_split[:-1])
+    return pkg
+
+
+def rpmdb_cookie():
+    """
+    Get value which changes whenever rpmdb is modified.
+    :return: tuple of modification times and sizes of rpmdb files, None if
+    none of the files is found
+    """
+    cookie = []
+    for filename in RPMDB_FILES:
+        try:
+            st = os.stat(filename)
+            cookie.append((filename, st.st_mtime_ns, st.st_size))
+
+        except OSError:
+            continue
+
+    return tuple(cookie) if cookie else None
+
+
+def installed_snapshot(backend):
+    """
+    Get installed packages together with the state of rpmdb at the time they
+    were queried.
+    :param backend: backend used for the query
+    :return: tuple of rpmdb cookie and list of installed packages
+    """
+    cookie = rpmdb_cookie()
+    return cookie, backend.installed()
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+
+    return value
+
+
+def _parse_available(name_arch, version_release):
+    """
+    Parse fields of a package listed by yum list available.
+    :param name_arch: package name with arch info
+    :param version_release: package version and release
+    :return: dict with name, version and release
+    """
+    version, release = version_release.split('-')[:2]
+    return dict(name=_pop_arch(name_arch), version=version, release=release)
+
+
+def reposdir_options(reposdir):
+    """
+    Options pointing yum to the given directories with repo files.
+    :param reposdir: list of directories, default ones used if None
+    :return: list of command line options
+    """
+    if not reposdir:
+        return []
+
+    return ['--setopt=reposdir=' + ','.join(reposdir)]
+
+
+@lru_cache(maxsize=None)
+def yum_is_dnf():
+    """
+    Check if yum command is provided by dnf (as on EL8 and later).
+    """
+    path = shutil.which('yum')
+    if not path:
+        return False
+
+    return os.path.basename(os.path.realpath(path)).startswith('dnf')
+
+
+def parallel_download_options():
+    """
+    Options enabling parallel downloads, which are supported only by dnf.
+    :return: list of command line options
+    """
+    if not yum_is_dnf():
+        return []
+
+    return ['--setopt=max_parallel_downloads={}'.format(PARALLEL_DOWNLOADS)]
+
+
+class SubprocessBackend:
+    """
+    Queries available and installed packages by running yum and rpm, and
+    parsing their output.
+    """
+    name = 'subprocess'
+
+    @staticmethod
+    def available(names, repo_ids=None, reposdir=None):
+        """
+        Get available versions of the given packages. The output of yum is
+        parsed line by line while it is being read, and the packages are
+        yielded as soon as they are listed.
+        :param names: names of the packages
+        :param repo_ids: IDs of the repos to query, all enabled repos if None
+        :param reposdir: directories with repo files, default ones if None
+        :return: generator of dicts with name, version and release
+        """
+        # only the requested packages from the repos defined in POEM are
+        # listed, instead of all the packages from all the enabled repos;
+        # versionlock plugin is disabled, so that all the versions of locked
+        # packages are listed without unlocking them; metadata of the repos
+        # from POEM is refreshed, so that new versions are seen even if the
+        # repo files have not been changed
+        cmd = [
+            'yum', 'list', 'available', '--showduplicates',
+            '--disableplugin=versionlock'
+        ]
+        cmd.extend(reposdir_options(reposdir))
+        if repo_ids:
+            cmd.extend([
+                '--disablerepo=*', '--enablerepo=' + ','.join(repo_ids)
+            ])
+            cmd.extend(
+                '--setopt={}.metadata_expire=0'.format(repo_id)
+                for repo_id in repo_ids
+            )
+
+        cmd.extend(names)
+
+        with timing.span('yum list available', packages=len(names)):
+            proc = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            listing = False
+            fields = []
+            try:
+                for line in proc.stdout:
+                    line = line.decode('utf-8').strip()
+                    if not listing:
+                        listing = line == 'Available Packages'
+                        continue
+
+                    # if the package name is too long, yum wraps the line, so
+                    # the fields of a single package can span multiple lines
+                    fields.extend(line.split())
+                    while len(fields) >= 3:
+                        yield _parse_available(fields[0], fields[1])
+                        del fields[:3]
+
+            finally:
+                proc.stdout.close()
+                stderr = proc.stderr.read().decode('utf-8', 'replace')
+                proc.stderr.close()
+                returncode = proc.wait()
+
+        # yum exits with error if none of the packages is available, which is
+        # the only error ignored; others (e.g. unreachable repo) are raised
+        if returncode:
+            if returncode == 1 and not listing and \
+                    NO_MATCHING_PACKAGES in stderr:
+                return
+
+            sys.stderr.write(stderr)
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+    @staticmethod
+    def installed():
+        """
+        Get installed packages.
+        :return: list of dicts with name, epoch, version, release and arch
+        """
+        with timing.span('rpm -qa'):
+            output = subprocess.check_output(['rpm', '-qa', '--qf', _RPM_QF])
+
+        pkg_list = []
+        for line in output.decode('utf-8').split('\n'):
+            fields = line.split()
+            if len(fields) == 5:
+                pkg_list.append(dict(
+                    name=fields[0], epoch=int(fields[1]), version=fields[2],
+                    release=fields[3], arch=fields[4]
+                ))
+
+        return pkg_list
+
+
+class DNFBackend:
+    """
+    Queries available and installed packages in-process using dnf (hawkey)
+    and rpm Python bindings. The result is in the same format as the one of
+    SubprocessBackend. Plugins are not loaded, so versionlock does not hide
+    any of the available versions.
+    """
+    name = 'dnf'
+
+    def __init__(self):
+        import dnf
+        import rpm
+
+        self._dnf = dnf
+        self._rpm = rpm
+
+    def available(self, names, repo_ids=None, reposdir=None):
+        """
+        Get available versions of the given packages.
+        :param names: names of the packages
+        :param repo_ids: IDs of the repos to query, all enabled repos if None
+        :param reposdir: directories with repo files, default ones if None
+        :return: list of dicts with name, version and release
+        """
+        with timing.span('dnf query available', packages=len(names)):
+            base = self._dnf.Base()
+            try:
+                base.conf.read()
+                if reposdir:
+                    base.conf.reposdir = list(reposdir)
+
+                base.read_all_repos()
+                if repo_ids:
+                    for repo in base.repos.all():
+                        if repo.id in repo_ids:
+                            repo.enable()
+                            repo.metadata_expire = 0
+
+                        else:
+                            repo.disable()
+
+                base.fill_sack(load_system_repo=True)
+                query = base.sack.query()
+                installed = set(str(pkg) for pkg in query.installed())
+
+                pkgs_dicts = []
+                for pkg in query.available().filter(name=list(names)):
+                    # same as yum list available, installed packages are skipped
+                    if str(pkg) in installed:
+                        continue
+
+                    version = pkg.version
+                    if pkg.epoch:
+                        version = '{}:{}'.format(pkg.epoch, pkg.version)
+
+                    pkgs_dicts.append(dict(
+                        name=pkg.name, version=version, release=pkg.release
+                    ))
+
+                return pkgs_dicts
+
+            finally:
+                base.close()
+
+    def installed(self):
+        """
+        Get installed packages.
+        :return: list of dicts with name, epoch, version, release and arch
+        """
+        ts = self._rpm.TransactionSet()
+        pkg_list = []
+        with timing.span('rpmdb query'):
+            for hdr in ts.dbMatch():
+                pkg_list.append(dict(
+                    name=_decode(hdr['name']),
+                    epoch=hdr['epochnum'],
+                    version=_decode(hdr['version']),
+                    release=_decode(hdr['release']),
+                    arch=_decode(hdr['arch'])
+                ))
+
+        return pkg_list
+
+
+BACKENDS = {
+    SubprocessBackend.name: SubprocessBackend,
+    DNFBackend.name: DNFBackend
+}
+
+
+def get_backend(name=SubprocessBackend.name):
+    """
+    Get backend for querying packages. If the Python bindings needed by the
+    requested backend are not available, subprocess backend is used.
+    :param name: name of the backend
+    :return: backend instance
+    """
+    try:
+        return BACKENDS[name]()
+
+    except ImportError:
+        return SubprocessBackend()
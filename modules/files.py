@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+
+def write_atomic(filename, content):
+    """
+    Write file so that it is never seen partially written: content is
+    written to a temporary file in the same directory, which is synced to
+    disk and then replaces the file. The temporary file is hidden and ends
+    with .tmp, so it is ignored by the readers of the directory in the
+    meantime (e.g. yum or node_exporter textfile collector). Permissions of
+    the existing file are kept.
+    :param filename: name of the file
+    :param content: content of the file
+    """
+    try:
+        mode = os.stat(filename).st_mode & 0o7777
+
+    except OSError:
+        mode = 0o644
+
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(filename) or '.',
+        prefix='.' + os.path.basename(filename) + '.', suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.chmod(tmp, mode)
+        os.replace(tmp, filename)
+
+    except BaseException:
+        os.unlink(tmp)
+        raise
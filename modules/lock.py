@@ -0,0 +1,183 @@
+import fcntl
+import json
+import os
+import time
+
+from argo_poem_tools.files import write_atomic
+
+LOCK_DIR = '/run/argo-poem-tools'
+
+# files holding PID of the process which holds the lock of yum, or the
+# rpmdb and metadata locks of dnf (in its persistdir and cachedir)
+YUM_PID_FILES = [
+    '/var/run/yum.pid',
+    '/var/lib/dnf/rpmdb_lock.pid',
+    '/var/cache/dnf/metadata_lock.pid'
+]
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class InstanceLock:
+    """
+    Lock which allows only one run of the tool at a time. The lock is taken
+    with flock(), so it is released by the kernel if the process holding it
+    dies. Exit status of each run is stored next to the lock together with
+    the key describing the inputs of the run, so that a run which has been
+    waiting for another one can reuse its result (see get_result).
+    """
+    def __init__(self, directory=LOCK_DIR, timeout=600, poll=0.5):
+        self.filename = os.path.join(directory, 'argo-poem-tools.lock')
+        self.result_file = os.path.join(directory, 'last-run.json')
+        self.timeout = timeout
+        self.poll = poll
+        self.fd = None
+        self.waited = 0.
+
+    def _holder(self):
+        try:
+            with open(self.filename, 'r') as f:
+                return f.read().strip()
+
+        except OSError:
+            return ''
+
+    def acquire(self):
+        """
+        Take the lock, waiting for the run holding it for at most timeout
+        seconds.
+        :return: time spent waiting in seconds, 0 if the lock was free
+        """
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        start = time.monotonic()
+        self.waited = 0.
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+
+            except BlockingIOError:
+                if time.monotonic() - start >= self.timeout:
+                    holder = self._holder()
+                    os.close(fd)
+                    raise LockTimeout(
+                        'Another run{} has been holding lock {} for more '
+                        'than {} s'.format(
+                            ' (PID {})'.format(holder) if holder else '',
+                            self.filename, self.timeout
+                        )
+                    )
+
+                time.sleep(self.poll)
+                self.waited = time.monotonic() - start
+
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode('utf-8'))
+        self.fd = fd
+
+        return self.waited
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    def save_result(self, key, status):
+        """
+        Store exit status of the run.
+        :param key: JSON serializable description of the inputs of the run
+        :param status: exit status
+        """
+        result = {'key': key, 'status': status, 'finished': time.time()}
+        try:
+            write_atomic(self.result_file, json.dumps(result))
+
+        except OSError:
+            pass
+
+    def get_result(self, key, since):
+        """
+        Get exit status of the last run, if it had the same inputs and it
+        finished after the given time, i.e. while the caller was waiting.
+        :param key: JSON serializable description of the inputs of the run
+        :param since: UNIX timestamp
+        :return: exit status, None if the result cannot be reused
+        """
+        try:
+            with open(self.result_file, 'r') as f:
+                result = json.load(f)
+
+            if result['key'] == json.loads(json.dumps(key)) and \
+                    result['finished'] >= since:
+                return result['status']
+
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+
+    except ProcessLookupError:
+        return False
+
+    # PermissionError means the process exists, but is owned by another user
+    except PermissionError:
+        pass
+
+    return True
+
+
+def yum_lock_holder(pid_files=None):
+    """
+    Get PID of the process holding the lock of yum. Stale PID files, left
+    by processes which are no longer running, are ignored.
+    :param pid_files: list of PID files, YUM_PID_FILES if not given
+    :return: PID, None if yum is not locked
+    """
+    for filename in pid_files if pid_files else YUM_PID_FILES:
+        try:
+            with open(filename, 'r') as f:
+                pid = int(f.read().strip())
+
+        except (OSError, ValueError):
+            continue
+
+        if pid != os.getpid() and _pid_alive(pid):
+            return pid
+
+    return None
+
+
+def wait_for_yum(timeout, poll=1., pid_files=None):
+    """
+    Wait until yum is not locked by another process (e.g. puppet), instead
+    of letting yum block on the lock for an unlimited time.
+    :param timeout: maximum wait in seconds
+    :param poll: interval between checks in seconds
+    :param pid_files: list of PID files, YUM_PID_FILES if not given
+    :return: time spent waiting in seconds, 0 if yum was not locked
+    """
+    start = time.monotonic()
+    waited = 0.
+    while True:
+        pid = yum_lock_holder(pid_files)
+        if pid is None:
+            return waited
+
+        if waited >= timeout:
+            raise LockTimeout(
+                'yum has been locked by process {} for more than {} s'.format(
+                    pid, timeout
+                )
+            )
+
+        time.sleep(poll)
+        waited = time.monotonic() - start
@@ -0,0 +1,175 @@
+import time
+
+from argo_poem_tools.files import write_atomic
+
+PREFIX = 'argo_poem_tools'
+
+# upper bounds of the buckets of duration histograms, in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+
+        return repr(value)
+
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"'
+    )
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(key, _escape(value)) for key, value in labels
+    ) + '}'
+
+
+class Metrics:
+    """
+    Metrics in the format of node_exporter textfile collector. The file is
+    rewritten after every run, so the metrics describe the last run: counts
+    are exposed as gauges, and durations of the phases as histograms of the
+    spans recorded in the run.
+    """
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.metrics = dict()
+
+    def _add(self, name, metric_type, description, samples):
+        name = '{}_{}'.format(self.prefix, name)
+        if name not in self.metrics:
+            self.metrics[name] = (metric_type, description, [])
+
+        self.metrics[name][2].extend(samples)
+
+    def gauge(self, name, description, value, labels=None):
+        """
+        Add a gauge sample.
+        :param name: name of the metric without the prefix
+        :param description: help text of the metric
+        :param value: value of the sample
+        :param labels: dict of labels of the sample
+        """
+        labels = sorted(labels.items()) if labels else []
+        self._add(name, 'gauge', description, [('', labels, value)])
+
+    def histogram(self, name, description, values, labels=None,
+                  buckets=BUCKETS):
+        """
+        Add a histogram of the given values.
+        :param name: name of the metric without the prefix
+        :param description: help text of the metric
+        :param values: list of observed values
+        :param labels: dict of labels of the histogram
+        :param buckets: upper bounds of the buckets
+        """
+        labels = sorted(labels.items()) if labels else []
+        samples = []
+        for bound in list(buckets) + [float('inf')]:
+            samples.append((
+                '_bucket', labels + [('le', _format_value(float(bound)))],
+                len([value for value in values if value <= bound])
+            ))
+
+        samples.append(('_sum', labels, float(sum(values))))
+        samples.append(('_count', labels, len(values)))
+        self._add(name, 'histogram', description, samples)
+
+    def render(self):
+        """
+        Render the metrics in the text exposition format.
+        :return: string with all the metrics
+        """
+        lines = []
+        for name, (metric_type, description, samples) in self.metrics.items():
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for suffix, labels, value in samples:
+                lines.append('{}{}{} {}'.format(
+                    name, suffix, _format_labels(labels), _format_value(value)
+                ))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        """
+        Write the metrics to the file. The file is replaced at once, so that
+        the collector never reads a partially written file.
+        :param filename: name of the file
+        """
+        write_atomic(filename, self.render())
+
+
+def collect(status, duration, spans, noop=False, counts=None,
+            cache_hits=None):
+    """
+    Collect metrics of a run.
+    :param status: exit status of the run
+    :param duration: duration of the run in seconds
+    :param spans: list of timing spans recorded in the run
+    :param noop: True if the run was without installing
+    :param counts: dict with number of packages in each outcome
+    :param cache_hits: dict of POEM requests, True if the cached response
+    has been reused
+    :return: Metrics instance
+    """
+    metrics = Metrics()
+    metrics.gauge(
+        'last_run_timestamp_seconds', 'Time when the last run finished.',
+        time.time()
+    )
+    metrics.gauge('exit_status', 'Exit status of the last run.', status)
+    metrics.gauge(
+        'noop', '1 if the last run was without installing packages.',
+        int(noop)
+    )
+    metrics.gauge(
+        'run_duration_seconds', 'Duration of the last run.', float(duration)
+    )
+    metrics.gauge(
+        'yum_calls', 'Number of yum invocations in the last run.',
+        len([span for span in spans if span['name'].startswith('yum ')])
+    )
+
+    for result, count in sorted((counts or dict()).items()):
+        metrics.gauge(
+            'packages', 'Number of packages by outcome of the last run; '
+                        'planned outcome if the run was without installing.',
+            count, labels={'result': result}
+        )
+
+    if cache_hits:
+        hits = len([hit for hit in cache_hits.values() if hit])
+        metrics.gauge(
+            'poem_requests', 'Number of requests to POEM in the last run.',
+            len(cache_hits)
+        )
+        metrics.gauge(
+            'poem_cache_hit_ratio',
+            'Ratio of POEM requests answered from the local cache.',
+            hits / len(cache_hits)
+        )
+
+    durations = dict()
+    for span in spans:
+        if span['duration'] is not None:
+            durations.setdefault(span['name'], []).append(span['duration'])
+
+    for phase, values in durations.items():
+        metrics.histogram(
+            'phase_duration_seconds',
+            'Duration of the phases of the last run, including every POEM '
+            'request and every yum and rpm call.',
+            values, labels={'phase': phase}
+        )
+
+    return metrics
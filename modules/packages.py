@@ -1,51 +1,80 @@
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from re import compile
 
+from argo_poem_tools import timing
+from argo_poem_tools.backends import SubprocessBackend, installed_snapshot, \
+    parallel_download_options, reposdir_options, rpmdb_cookie
+from argo_poem_tools.versionlock import VersionLockManager
 
-_rpm_re = compile('(\S+)-(?:(\d*):)?(.*)-(~?\w+[\w.]*)')
 
+# segments compared by rpmvercmp; everything else is a separator
+_segment_re = compile(r'~|\^|[0-9]+|[a-zA-Z]+')
 
-def _pop_arch(pkg_string):
+# ordering of the segment types, as in rpmvercmp: tilde sorts before
+# everything, even the end of the string, caret sorts after the end of the
+# string, but before any other segment, and numeric segments are newer than
+# alphabetic ones
+_SEPARATORS = {'~': (0,), '^': (2,)}
+_END = (1,)
+_ALPHA = 3
+_NUMERIC = 4
+
+
+@lru_cache(maxsize=None)
+def _version_key(version):
     """
-    Pop arch info from RPM package string.
-    :param pkg_string: string with arch info
-    :return: RPM package string without arch info
+    Calculates sort key of RPM version (or release) string; comparing the keys
+    of two strings gives the same result as rpmvercmp.
+    :param version: version string
+    :return: tuple usable as sort key
     """
-    pkg_string_split = pkg_string.split('.')
-    pkg = '.'.join(pkg_string_split[:-1])
-    return pkg
+    key = []
+    for segment in _segment_re.findall(version):
+        if segment.isdigit():
+            key.append((_NUMERIC, int(segment)))
 
+        elif segment in _SEPARATORS:
+            key.append(_SEPARATORS[segment])
 
-def _compare_versions(v1, v2):
+        else:
+            key.append((_ALPHA, segment))
+
+    key.append(_END)
+
+    return tuple(key)
+
+
+@lru_cache(maxsize=None)
+def _evr_key(version, release):
     """
-    Compares two RPM version strings.
-    :param v1: first string version
-    :param v2: second string version
-    :return: 1 if v1 is newer, 0 if they are equal, -1 if v2 is newer
+    Calculates sort key of RPM package version and release. Epoch, if any,
+    is expected as the prefix of the version (epoch:version).
+    :param version: version string, optionally with epoch
+    :param release: release string
+    :return: tuple usable as sort key
     """
-    arr1 = v1.split('.')
-    arr2 = v2.split('.')
+    epoch = 0
+    if ':' in version:
+        epoch, version = version.split(':', 1)
+        epoch = int(epoch) if epoch.isdigit() else 0
 
-    arr1 = [int(i) if i.isnumeric() else i for i in arr1]
-    arr2 = [int(i) if i.isnumeric() else i for i in arr2]
+    return epoch, _version_key(version), _version_key(release)
 
-    n = len(arr1)
-    m = len(arr2)
 
-    if n > m:
-        for i in range(m, n):
-            arr2.append(0)
-    elif m > n:
-        for i in range(n, m):
-            arr1.append(0)
+def _compare_keys(key1, key2):
+    return (key1 > key2) - (key1 < key2)
 
-    for i in range(len(arr1)):
-        if arr1[i] > arr2[i]:
-            return 1
-        elif arr2[i] > arr1[i]:
-            return -1
 
-    return 0
+def _compare_versions(v1, v2):
+    """
+    Compares two RPM version strings.
+    :param v1: first string version
+    :param v2: second string version
+    :return: 1 if v1 is newer, 0 if they are equal, -1 if v2 is newer
+    """
+    return _compare_keys(_version_key(v1), _version_key(v2))
 
 
 def _compare_vr(vr1, vr2):
@@ -55,18 +84,7 @@ def _compare_vr(vr1, vr2):
     :param vr2: second (version, release) tuple
     :return: 1 if vr1 is newer, 0 if equal, -1 if vr2 is newer
     """
-    v1, r1 = vr1
-    v2, r2 = vr2
-
-    if v1 == v2:
-        if r1 == r2:
-            return 0
-
-        else:
-            return _compare_versions(r1, r2)
-
-    else:
-        return _compare_versions(v1, v2)
+    return _compare_keys(_evr_key(*vr1), _evr_key(*vr2))
 
 
 class PackageException(Exception):
@@ -74,8 +92,16 @@ class PackageException(Exception):
 
 
 class Packages:
-    def __init__(self, data):
+    def __init__(
+            self, data, repo_ids=None, backend=None, versionlock=None,
+            installed=None, reposdir=None, prefetch=False
+    ):
         self.data = data
+        self.repo_ids = repo_ids
+        self.reposdir = reposdir
+        # download packages in the background, while versions are unlocked
+        self.prefetch = prefetch
+        self.backend = backend if backend else SubprocessBackend()
         self.package_list = self._list()
         self.versions_unlocked = False
         self.initially_locked_versions = []
@@ -83,6 +109,19 @@ class Packages:
         self.packages_different_version = None
         self.packages_not_found = None
         self.available_packages = None
+        self.available_index = None
+        self.installed_packages = None
+        self.installed_index = None
+        self.rpmdb_cookie = None
+        # number of packages in each outcome of the last install() or
+        # no_op(), failed ones are only known after install()
+        self.counts = dict()
+        # packages resolved by the last install() or no_op()
+        self.resolved = None
+        if installed:
+            self.rpmdb_cookie, self.installed_packages = installed
+
+        self.versionlock = versionlock if versionlock else VersionLockManager()
 
     def _list(self):
         list_packages = []
@@ -99,28 +138,16 @@ class Packages:
         """
         Get list of packages with locked versions among the packages requested.
         """
-        output = subprocess.check_output(['yum', 'versionlock', 'list']).decode(
-            'utf-8'
-        )
-        locked_versions = [
-            item[0] for item in self._list() if item[0] in output
+        locked = self.versionlock.list()
+        self.locked_versions = [
+            item[0] for item in self.package_list if item[0] in locked
         ]
-        self.locked_versions = locked_versions
 
     def _failsafe_lock_versions(self):
         """
         Locking the packages that have already been locked in case of exception.
         """
-        warn = []
-        for item in self.initially_locked_versions:
-            try:
-                subprocess.call(
-                    ['yum', 'versionlock', 'add', item],
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                )
-
-            except subprocess.CalledProcessError:
-                warn.append(item)
+        warn = self.versionlock.add(self.initially_locked_versions)
 
         if warn:
             return 'Packages not locked: {}'.format(', '.join(warn))
@@ -133,50 +160,21 @@ class Packages:
             self._get_locked_versions()
 
         if len(self.locked_versions) > 0:
-            for item in self.locked_versions:
-                try:
-                    subprocess.call(
-                        ['yum', 'versionlock', 'delete', item],
-                        stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                    )
-                    self.initially_locked_versions.append(item)
-
-                except subprocess.CalledProcessError:
-                    continue
+            failed = self.versionlock.delete(self.locked_versions)
+            self.initially_locked_versions.extend(
+                [item for item in self.locked_versions if item not in failed]
+            )
 
             self.versions_unlocked = True
 
     def _get_available_packages(self):
-        if not self.versions_unlocked:
-            self._unlock_versions()
-
-        output = subprocess.check_output(
-            ['yum', 'list', 'available', '--showduplicates']
+        # locked packages are listed with all their versions, since the
+        # versionlock plugin is disabled in the query; versions are unlocked
+        # only for the transactions
+        return self.backend.available(
+            sorted(set(item[0] for item in self.package_list)),
+            repo_ids=self.repo_ids, reposdir=self.reposdir
         )
-        output_list = output.decode('utf-8').split('\n')
-        pkg_index = output_list.index('Available Packages') + 1
-        pkgs = output_list[pkg_index:]
-        pkgs = ' '.join(pkgs)
-        pkg_list = list(filter(None, pkgs.split(' ')))
-
-        formatted_pkgs = []
-        for i in range(0, len(pkg_list), 3):
-            formatted_pkgs.append(pkg_list[i:i + 3])
-
-        pkgs_dicts = []
-        for pkg in formatted_pkgs:
-            pkg_list_split = pkg[1].split('-')
-            version = pkg_list_split[0]
-            release = pkg_list_split[1]
-            pkgs_dicts.append(
-                dict(
-                    name=_pop_arch(pkg[0]),
-                    version=version,
-                    release=release
-                )
-            )
-
-        return pkgs_dicts
 
     def _get_exceptions(self):
         """
@@ -184,116 +182,109 @@ class Packages:
         them are found with different version and which one are not found at
         all.
         """
-        pkgs = self._get_available_packages()
-        self.available_packages = [
-            (pkg['name'], pkg['version'], pkg['release']) for pkg in pkgs
-        ]
-        available_vr = [(pkg['name'], pkg['version']) for pkg in pkgs]
+        with timing.span('available packages'):
+            pkgs = self._get_available_packages()
+            self.available_packages = [
+                (pkg['name'], pkg['version'], pkg['release']) for pkg in pkgs
+            ]
+
+        # index of available packages by name, and set of available
+        # (name, version) pairs, built once for all the requested packages
+        available = dict()
+        available_vr = set()
+        for pkg in self.available_packages:
+            available.setdefault(pkg[0], []).append(pkg)
+            available_vr.add(pkg[:2])
+
+        self.available_index = available
 
         wrong_version = []
         not_found = []
         for item in self.package_list:
-            if len(item) > 1 and item not in available_vr and \
-                    item[0] in [a[0] for a in self.available_packages]:
-                avail_versions = \
-                    [a for a in self.available_packages if a[0] == item[0]]
-                if len(avail_versions) > 1:
-                    max_version = avail_versions[0]
-                    for version in avail_versions:
-                        if _compare_vr(
-                                (version[1], 'mock'),
-                                (max_version[1], 'mock')
-                        ) > 0:
-                            max_version = version
+            if item[0] not in available:
+                not_found.append(item)
 
-                    wrong_version.append(max_version)
+            elif len(item) > 1 and item not in available_vr:
+                avail_versions = available[item[0]]
+                if len(avail_versions) > 1:
+                    wrong_version.append(max(
+                        avail_versions, key=lambda pkg: _evr_key(pkg[1], '')
+                    ))
 
                 else:
-                    wrong_version.append(
-                        [(a[0], a[1]) for a in self.available_packages if
-                         a[0] == item[0]][0]
-                    )
-
-            if item[0] not in [a[0] for a in self.available_packages]:
-                not_found.append(item)
+                    wrong_version.append(avail_versions[0][:2])
 
         self.packages_different_version = wrong_version
         self.packages_not_found = not_found
 
-    @staticmethod
-    def _get_installed_packages():
-        output = subprocess.check_output(['rpm', '-qa'])
-        output_list = output.decode('utf-8').split('\n')
-        pkg_list = []
-        for item in output_list:
-            if item:
-                try:
-                    n, e, v, r = _rpm_re.match(_pop_arch(item.strip())).groups()
-                    pkg_list.append(dict(name=n, version=v, release=r))
+    def _get_installed_packages(self):
+        """
+        Get snapshot of installed packages. It is taken again only if rpmdb
+        has changed since the last one, or after a yum transaction.
+        :return: list of dicts with name, epoch, version, release and arch
+        """
+        cookie = rpmdb_cookie()
+        if self.installed_packages is None or cookie is None or \
+                cookie != self.rpmdb_cookie:
+            self.rpmdb_cookie, self.installed_packages = \
+                installed_snapshot(self.backend)
+            self.installed_index = None
 
-                except AttributeError:
-                    continue
+        return self.installed_packages
 
-        return pkg_list
+    def _get_installed_index(self):
+        """
+        Get installed packages indexed by name; if there are multiple versions
+        of the same package installed, the first one is taken into account.
+        :return: dict of installed packages
+        """
+        pkgs = self._get_installed_packages()
+        if self.installed_index is None or pkgs is not self.installed_packages:
+            index = dict()
+            for pkg in pkgs:
+                index.setdefault(pkg['name'], pkg)
+
+            self.installed_index = index
+
+        return self.installed_index
 
     @staticmethod
     def _get_max_version(available_packages):
-        max_version = available_packages[0]
-        for version in available_packages:
-            if _compare_vr(
-                    (version[1], version[2]),
-                    (max_version[1], max_version[2])
-            ) > 0:
-                max_version = version
-
-        return max_version
+        return max(
+            available_packages, key=lambda pkg: _evr_key(pkg[1], pkg[2])
+        )
 
     def _get(self):
         if not self.packages_different_version:
             self._get_exceptions()
 
-        pkgs = self._get_installed_packages()
-        installed_packages = [
-            (pkg['name'], pkg['version'], pkg['release']) for pkg in pkgs
-        ]
-
-        # list of installed packages' name
-        installed_names = [pkg[0] for pkg in installed_packages]
+        installed_packages = self._get_installed_index()
 
-        # list of packages which are available with different version
-        diff_versions_names = [p[0] for p in self.packages_different_version]
+        # names of packages which are available with different version
+        diff_versions_names = set(p[0] for p in self.packages_different_version)
 
-        # list of packages which are available in repos (both name and version)
-        installable_packages = [
-            pkg for pkg in self.package_list if
-            pkg not in self.packages_not_found and
-            pkg[0] not in diff_versions_names
-        ]
+        not_found_packages = set(self.packages_not_found)
 
         install = []
         upgrade = []
         downgrade = []
-        for item in installable_packages:
-            if item[0] in installed_names:
-                installed_ver = installed_packages[
-                    installed_names.index(item[0])
-                ][1]
-                installed_release = installed_packages[
-                    installed_names.index(item[0])
-                ][2]
+        for item in self.package_list:
+            if item in not_found_packages or item[0] in diff_versions_names:
+                continue
+
+            if item[0] in installed_packages:
+                installed = installed_packages[item[0]]
+                installed_ver = installed['version']
 
                 # all the available packages with the given name and version
                 if len(item) > 1:
                     available_items = [
-                        pkg for pkg in self.available_packages
-                        if item[0] == pkg[0] and item[1] == pkg[1]
+                        pkg for pkg in self.available_index[item[0]]
+                        if item[1] == pkg[1]
                     ]
 
                 else:
-                    available_items = [
-                        pkg for pkg in self.available_packages
-                        if item[0] == pkg[0]
-                    ]
+                    available_items = self.available_index[item[0]]
 
                 max_version = self._get_max_version(available_items)
 
@@ -308,43 +299,193 @@ class Packages:
                 else:
                     change_tuple = (item,)
 
-                if _compare_vr(
-                        (max_version[1], max_version[2]),
-                        (installed_ver, installed_release)
-                ) > 0:
+                installed_evr = installed_ver
+                if installed.get('epoch'):
+                    installed_evr = '{}:{}'.format(
+                        installed['epoch'], installed_ver
+                    )
+
+                comparison = _compare_keys(
+                    _evr_key(max_version[1], max_version[2]),
+                    _evr_key(installed_evr, installed['release'])
+                )
+                if comparison > 0:
                     upgrade.append(change_tuple)
 
-                elif _compare_vr(
-                        (max_version[1], max_version[2]),
-                        (installed_ver, installed_release)
-                ) < 0:
+                elif comparison < 0:
                     downgrade.append(change_tuple)
 
-                else:
-                    continue
-
             else:
                 install.append(item)
 
-        diff_ver = []
-        for item in self.packages_different_version:
-            orig_item = self.package_list[
-                [p[0] for p in self.package_list].index(item[0])
-            ]
-            diff_ver.append('-'.join(orig_item))
+        # requested packages by name, first one is used if there are duplicates
+        requested = dict()
+        for item in self.package_list:
+            requested.setdefault(item[0], item)
 
-        not_found = []
-        for item in self.packages_not_found:
-            if len(item) > 1:
-                not_found.append('-'.join(item))
-            else:
-                not_found.append(item[0])
+        diff_ver = [
+            '-'.join(requested[item[0]])
+            for item in self.packages_different_version
+        ]
+
+        not_found = ['-'.join(item) for item in self.packages_not_found]
 
         return install, upgrade, downgrade, diff_ver, not_found
 
-    def install(self):
+    def check(self):
+        """
+        Compare requested packages with the installed ones, without querying
+        available packages: packages requested with version are expected to
+        be installed with that version, and the rest of them just installed.
+        :return: lists of packages to be installed, upgraded and downgraded
+        in the same format as returned by _get()
+        """
+        installed_packages = self._get_installed_index()
+
+        install = []
+        upgrade = []
+        downgrade = []
+        for item in self.package_list:
+            installed = installed_packages.get(item[0])
+            if not installed:
+                install.append(item)
+
+            elif len(item) > 1 and item[1] != installed['version']:
+                change_tuple = ((item[0], installed['version']), item)
+                if _compare_versions(item[1], installed['version']) > 0:
+                    upgrade.append(change_tuple)
+
+                else:
+                    downgrade.append(change_tuple)
+
+        return install, upgrade, downgrade
+
+    def _download(self, action, items):
+        """
+        Downloads packages of the yum transaction to the yum cache, without
+        installing them. Versionlock plugin is disabled, so that the
+        packages can be downloaded before their versions are unlocked.
+        :param action: yum command ('install' or 'downgrade')
+        :param items: list of (name,) or (name, version) tuples
+        :return: True if all the packages were downloaded
+        """
+        if not items:
+            return True
+
+        cmd = ['yum', '-y', '--downloadonly', '--disableplugin=versionlock']
+        cmd.extend(reposdir_options(self.reposdir))
+        cmd.extend(parallel_download_options())
+        cmd.append(action)
+        cmd.extend(['-'.join(item) for item in items])
+        try:
+            with timing.span('yum download', packages=len(items)):
+                return subprocess.call(
+                    cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                ) == 0
+
+        except OSError:
+            return False
+
+    def _prefetch(self, install, downgrade):
+        """
+        Downloads packages of both transactions.
+        :return: True if all the packages were downloaded
+        """
+        # both downloads are attempted, even if the first one fails
+        results = [
+            self._download('install', install),
+            self._download('downgrade', downgrade)
+        ]
+
+        return all(results)
+
+    def _transaction(self, action, items, cacheonly=False):
+        """
+        Runs single yum transaction for all the given packages. If the
+        transaction fails, packages are processed one by one, so that the
+        failures can be reported for each package separately.
+        :param action: yum command ('install' or 'downgrade')
+        :param items: list of (name,) or (name, version) tuples
+        :param cacheonly: run the transaction from the yum cache, when the
+        packages have already been downloaded
+        :return: list of items which were not installed
+        """
+        if not items:
+            return []
+
+        # rpmdb is changed by the transaction, even if it fails
+        self.installed_packages = None
+        options = reposdir_options(self.reposdir)
+        cmd = ['yum', '-y'] + options + [action]
+        batch_cmd = ['yum', '-y', '-C'] + options + [action] if cacheonly \
+            else cmd
+        try:
+            with timing.span('yum ' + action, packages=len(items)):
+                subprocess.check_call(
+                    batch_cmd + ['-'.join(item) for item in items]
+                )
+
+        except subprocess.CalledProcessError:
+            # packages are processed one by one without the cache only mode,
+            # in case the transaction failed because of the cache (e.g. the
+            # download was incomplete); a single package is retried only then
+            failed = []
+            if len(items) > 1 or cacheonly:
+                for item in items:
+                    try:
+                        with timing.span('yum ' + action, packages=1):
+                            subprocess.check_call(cmd + ['-'.join(item)])
+
+                    except subprocess.CalledProcessError:
+                        failed.append(item)
+
+            else:
+                failed = list(items)
+
+            return failed
+
+        # yum does not necessarily fail the whole transaction if some of the
+        # packages are missing, so the result is checked in rpmdb
+        installed = set()
+        for pkg in self._get_installed_packages():
+            installed.add((pkg['name'],))
+            installed.add((pkg['name'], pkg['version']))
+
+        return [item for item in items if tuple(item) not in installed]
+
+    def install(self, resolved=None):
+        """
+        Install, upgrade and downgrade packages, and lock their versions.
+        :param resolved: packages resolved earlier, as stored in plan; if
+        not given, they are resolved now
+        :return: lists of info and warning messages
+        """
         try:
-            install, upgrade, downgrade, diff_ver, not_found = self._get()
+            if not resolved:
+                resolved = self._get()
+
+            self.resolved = resolved
+            install, upgrade, downgrade, diff_ver, not_found = resolved
+            to_install = list(install) + [pkg[-1] for pkg in upgrade]
+            to_downgrade = [pkg[1] for pkg in downgrade]
+
+            # packages are downloaded while the versions are being unlocked,
+            # and the transactions are then run from the yum cache
+            downloaded = False
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                prefetch = None
+                if self.prefetch and (to_install or to_downgrade):
+                    prefetch = executor.submit(
+                        timing.inherit(self._prefetch), to_install,
+                        to_downgrade
+                    )
+
+                if not self.versions_unlocked:
+                    self._unlock_versions()
+
+                if prefetch:
+                    downloaded = prefetch.result()
+
             installed = []
             not_installed = []
             upgraded = []
@@ -352,59 +493,49 @@ class Packages:
             downgraded = []
             not_downgraded = []
             not_locked = []
-            if install:
-                for pkg in install:
-                    if len(pkg) == 2:
-                        pkgi = '-'.join(pkg)
-                    else:
-                        pkgi = pkg[0]
-
-                    try:
-                        subprocess.check_call(['yum', '-y', 'install', pkgi])
-                        installed.append(pkgi)
+            failed = self._transaction(
+                'install', to_install, cacheonly=downloaded
+            )
+            for pkg in install:
+                if pkg in failed:
+                    not_installed.append('-'.join(pkg))
 
-                    except subprocess.CalledProcessError:
-                        not_installed.append(pkgi)
+                else:
+                    installed.append('-'.join(pkg))
 
-            if upgrade:
-                for pkg in upgrade:
-                    try:
-                        if len(pkg) == 2:
-                            subprocess.check_call(
-                                ['yum', '-y', 'install', '-'.join(pkg[1])]
-                            )
-                            upgraded.append(
-                                '{} -> {}'.format(
-                                    '-'.join(pkg[0]), '-'.join(pkg[1])
-                                )
-                            )
+            for pkg in upgrade:
+                if pkg[-1] in failed:
+                    not_upgraded.append('-'.join(pkg[0]))
 
-                        else:
-                            subprocess.check_call(
-                                ['yum', '-y', 'install', '-'.join(pkg[0])]
-                            )
-                            upgraded.append('-'.join(pkg[0]))
+                elif len(pkg) == 2:
+                    upgraded.append(
+                        '{} -> {}'.format('-'.join(pkg[0]), '-'.join(pkg[1]))
+                    )
 
-                    except subprocess.CalledProcessError:
-                        not_upgraded.append('-'.join(pkg[0]))
+                else:
+                    upgraded.append('-'.join(pkg[0]))
 
-            if downgrade:
-                for pkg in downgrade:
-                    try:
-                        subprocess.check_call(
-                            ['yum', '-y', 'downgrade', '-'.join(pkg[1])]
-                        )
-                        downgraded.append(
-                            '{} -> {}'.format(
-                                '-'.join(pkg[0]), '-'.join(pkg[1])
-                            )
-                        )
+            failed = self._transaction(
+                'downgrade', to_downgrade, cacheonly=downloaded
+            )
+            for pkg in downgrade:
+                if pkg[1] in failed:
+                    not_downgraded.append('-'.join(pkg[0]))
 
-                    except subprocess.CalledProcessError:
-                        not_downgraded.append('-'.join(pkg[0]))
+                else:
+                    downgraded.append(
+                        '{} -> {}'.format('-'.join(pkg[0]), '-'.join(pkg[1]))
+                    )
 
             lock_msg = self._lock_versions()
 
+            self.counts = dict(
+                install=len(installed), upgrade=len(upgraded),
+                downgrade=len(downgraded), different_version=len(diff_ver),
+                not_found=len(not_found),
+                failed=len(not_installed + not_upgraded + not_downgraded)
+            )
+
             info_msg = []
             warn_msg = []
             if installed:
@@ -461,9 +592,16 @@ class Packages:
 
     def no_op(self):
         try:
-            install, upgrade0, downgrade0, diff_ver, not_found = self._get()
-
-            self._lock_versions()
+            # nothing is changed on the host: versions are neither unlocked
+            # nor locked
+            self.resolved = self._get()
+            install, upgrade0, downgrade0, diff_ver, not_found = self.resolved
+
+            self.counts = dict(
+                install=len(install), upgrade=len(upgrade0),
+                downgrade=len(downgrade0), different_version=len(diff_ver),
+                not_found=len(not_found), failed=0
+            )
 
             info_msg = []
             warn_msg = []
@@ -527,21 +665,13 @@ class Packages:
     def _lock_versions(self):
         self._get_locked_versions()
 
-        installed_pkgs = self._get_installed_packages()
-        installed_names = [pkg['name'] for pkg in installed_pkgs]
-
-        warn = []
-        for item in self._list():
-            if len(item) > 1 and item[0] in installed_names and \
-                    not item[0] in self.locked_versions:
-                try:
-                    subprocess.call(
-                        ['yum', 'versionlock', 'add', item[0]],
-                        stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                    )
+        installed_names = self._get_installed_index()
 
-                except subprocess.CalledProcessError:
-                    warn.append(item[0])
+        warn = self.versionlock.add([
+            item[0] for item in self.package_list
+            if len(item) > 1 and item[0] in installed_names and
+            item[0] not in self.locked_versions
+        ])
 
         if warn:
             return 'Packages not locked: {}'.format(', '.join(warn))
@@ -0,0 +1,93 @@
+import json
+import time
+
+from argo_poem_tools.files import write_atomic
+
+PLAN_VERSION = 1
+
+
+class PlanException(Exception):
+    pass
+
+
+class Plan:
+    """
+    Execution plan resolved in a run without installing. It holds the data
+    fetched from POEM and the packages to be installed, upgraded and
+    downgraded, together with the fingerprint of the host at the time, so
+    that it can be applied later without resolving the packages again, as
+    long as neither the host nor the desired state has changed.
+    """
+    def __init__(
+            self, fingerprint, data, missing_packages, include_internal,
+            resolved, created=None
+    ):
+        self.fingerprint = fingerprint
+        self.data = data
+        self.missing_packages = missing_packages
+        self.include_internal = include_internal
+        self.resolved = resolved
+        self.created = created if created else time.time()
+
+    @property
+    def desired_state(self):
+        return self.data, self.missing_packages, self.include_internal
+
+    def save(self, filename):
+        install, upgrade, downgrade, diff_ver, not_found = self.resolved
+        plan = {
+            'version': PLAN_VERSION,
+            'created': self.created,
+            'fingerprint': self.fingerprint,
+            'include_internal': self.include_internal,
+            'missing_packages': self.missing_packages,
+            'install': install,
+            'upgrade': upgrade,
+            'downgrade': downgrade,
+            'different_version': diff_ver,
+            'not_found': not_found,
+            'data': self.data
+        }
+        write_atomic(filename, json.dumps(plan, indent=2))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read plan from the file.
+        :param filename: name of the file
+        :return: Plan instance
+        """
+        try:
+            with open(filename, 'r') as f:
+                plan = json.load(f)
+
+            if plan.get('version') != PLAN_VERSION:
+                raise PlanException(
+                    'Unsupported version of plan {}: {}'.format(
+                        filename, plan.get('version')
+                    )
+                )
+
+            # JSON has no tuples, and packages are compared as tuples
+            resolved = (
+                [tuple(item) for item in plan['install']],
+                [tuple(tuple(pkg) for pkg in item) for item in plan['upgrade']],
+                [
+                    tuple(tuple(pkg) for pkg in item)
+                    for item in plan['downgrade']
+                ],
+                plan['different_version'],
+                plan['not_found']
+            )
+
+            return cls(
+                fingerprint=plan['fingerprint'], data=plan['data'],
+                missing_packages=plan['missing_packages'],
+                include_internal=plan['include_internal'], resolved=resolved,
+                created=plan['created']
+            )
+
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            raise PlanException(
+                'Unable to read plan {}: {}'.format(filename, str(err))
+            )
@@ -1,105 +1,335 @@
+import hashlib
+import json
 import os
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from re import compile, MULTILINE
 
-import requests
+from argo_poem_tools import timing
+from argo_poem_tools.backends import reposdir_options, yum_is_dnf
+from argo_poem_tools.files import write_atomic
+
+_section_re = compile(r'^\s*\[([^\]]+)\]', MULTILINE)
+
+REPOS_PATH = '/etc/yum.repos.d'
+
+# list of repo files written by the tool to the private reposdir
+MANIFEST = '.argo-poem-tools.manifest'
+
+
+def _repo_ids(content):
+    """
+    Get IDs of repos defined in the YUM repo file.
+    :param content: content of the repo file
+    :return: list of repo IDs
+    """
+    return [
+        repo_id.strip() for repo_id in _section_re.findall(content)
+        if repo_id.strip() != 'main'
+    ]
+
+
+def _digest(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
 
 class YUMRepos:
+    """
+    Fetches repo definitions and packages from POEM, and writes the repo
+    files. If private reposdir is given, repo files are written there
+    instead of repos_path, which is left untouched, and yum is pointed to
+    both directories only in the commands run by the tool (see reposdir).
+    """
     def __init__(
-            self, hostname, token, profiles, repos_path='/etc/yum.repos.d',
-            override=True
+            self, hostname, token, profiles, repos_path=REPOS_PATH,
+            override=True, cache_dir=None, private_reposdir=None
     ):
         self.hostname = hostname
         self.token = token
         self.profiles = profiles
         self.path = repos_path
         self.override = override
+        self.reposdir = None
+        if private_reposdir:
+            # repo files from POEM take precedence over the system ones
+            self.path = private_reposdir
+            self.override = True
+            self.reposdir = [private_reposdir, repos_path]
+        self.cache_dir = cache_dir
         self.data = None
         self.missing_packages = None
-
-    def get_data(self, include_internal=False):
-        headers = {
-            'x-api-key': self.token,
-            'profiles': self._refine_list_of_profiles()
+        self.session = None
+        self.repo_ids = []
+        self.changed_repos = []
+        self.changed_files = []
+        # for each URL requested in the last get_data(), True if the cached
+        # response has been reused
+        self.cache_hits = dict()
+
+    def _cache_file(self, url, headers):
+        key = hashlib.sha256(
+            json.dumps([url, headers.get('profiles')]).encode('utf-8')
+        ).hexdigest()
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def _read_cache(self, url, headers):
+        if not self.cache_dir:
+            return None
+
+        try:
+            with open(self._cache_file(url, headers), 'r') as f:
+                return json.load(f)
+
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, url, headers, response, body):
+        if not self.cache_dir:
+            return
+
+        # response is cached even if it cannot be validated by POEM, since
+        # it is still used by get_cached_data()
+        cached = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body': body
         }
-        response = requests.get(self._build_url(), headers=headers, timeout=180)
-
-        data_internal = None
-        missing_packages_internal = list()
-        if include_internal:
-            response_internal = requests.get(
-                self._build_url(include_internal=True),
-                headers={"x-api-key": self.token},
-                timeout=180
+        filename = self._cache_file(url, headers)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write_atomic(filename, json.dumps(cached))
+
+        except OSError:
+            pass
+
+    def _fetch(self, url, headers):
+        """
+        Fetch JSON from POEM. If there is a cached response for the same
+        request, it is reused when POEM responds it has not been modified.
+        :param url: URL of the request
+        :param headers: headers of the request
+        :return: JSON of the response
+        """
+        cached = self._read_cache(url, headers)
+        request_headers = headers
+        if cached:
+            request_headers = dict(headers)
+            if cached['etag']:
+                request_headers['If-None-Match'] = cached['etag']
+
+            if cached['last_modified']:
+                request_headers['If-Modified-Since'] = cached['last_modified']
+
+        with timing.span('poem request', url=url):
+            response = self.session.get(
+                url, headers=request_headers, timeout=180
             )
 
-            if response_internal.status_code == 200:
-                internal_json = response_internal.json()
-                data_internal = internal_json["data"]
-                missing_packages_internal = internal_json["missing_packages"]
-
-            else:
-                try:
-                    msg = response_internal.json()["detail"]
-
-                except (ValueError, TypeError, KeyError):
-                    msg = f"{response_internal.status_code} " \
-                          f"{response_internal.reason}"
-
-                raise requests.exceptions.RequestException(msg)
-
-        if response.status_code == 200:
-            data_json = response.json()
-            data = data_json["data"]
-            if data_internal:
-                for name, info in data_internal.items():
-                    if name in data:
-                        p = data[name]["packages"] + info["packages"]
-                        packages = dict((v["name"], v) for v in p).values()
-                        data[name]["packages"] = sorted(
-                            packages, key=lambda k: k["name"]
-                        )
-
-            self.missing_packages = sorted(
-                list(set(
-                    data_json['missing_packages'] + missing_packages_internal
-                ))
-            )
+        if response.status_code == 304 and cached:
+            self.cache_hits[url] = True
+            return cached['body']
 
-            return data
+        elif response.status_code == 200:
+            self.cache_hits[url] = False
+            body = response.json()
+            self._write_cache(url, headers, response, body)
+            return body
 
         else:
+            from requests.exceptions import RequestException
             try:
                 msg = response.json()['detail']
 
             except (ValueError, TypeError, KeyError):
                 msg = '%s %s' % (response.status_code, response.reason)
 
-            raise requests.exceptions.RequestException(msg)
+            raise RequestException(msg)
+
+    def _merge(self, data_json, internal_json=None):
+        data = data_json["data"]
+        missing_packages_internal = list()
+        if internal_json:
+            missing_packages_internal = internal_json["missing_packages"]
+            for name, info in internal_json["data"].items():
+                if name in data:
+                    p = data[name]["packages"] + info["packages"]
+                    packages = dict((v["name"], v) for v in p).values()
+                    data[name]["packages"] = sorted(
+                        packages, key=lambda k: k["name"]
+                    )
+
+        self.missing_packages = sorted(
+            list(set(
+                data_json['missing_packages'] + missing_packages_internal
+            ))
+        )
+
+        return data
+
+    def _queries(self, include_internal=False):
+        queries = [(
+            self._build_url(),
+            {
+                'x-api-key': self.token,
+                'profiles': self._refine_list_of_profiles()
+            }
+        )]
+        if include_internal:
+            queries.append((
+                self._build_url(include_internal=True),
+                {"x-api-key": self.token}
+            ))
+
+        return queries
+
+    def get_data(self, include_internal=False):
+        if not self.session:
+            # requests is imported only when POEM is contacted, since it
+            # takes more time than the rest of the tool's startup
+            import requests
+            self.session = requests.Session()
+
+        self.cache_hits = dict()
+
+        # requests for public and internal metrics' packages are sent
+        # concurrently over the same session
+        queries = self._queries(include_internal=include_internal)
+
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            futures = [
+                executor.submit(timing.inherit(self._fetch), url, headers)
+                for url, headers in queries
+            ]
+            results = [future.result() for future in futures]
+
+        self.data = self._merge(*results)
+
+        return self.data
+
+    def get_cached_data(self, include_internal=False):
+        """
+        Get data from the responses cached in the previous runs, without
+        contacting POEM.
+        :param include_internal: include internal metrics' packages
+        :return: data, None if any of the responses is not cached
+        """
+        results = []
+        for url, headers in self._queries(include_internal=include_internal):
+            cached = self._read_cache(url, headers)
+            if not cached:
+                return None
+
+            results.append(cached['body'])
+
+        self.data = self._merge(*results)
+
+        return self.data
 
     def create_file(self, include_internal=False):
+        """
+        Write repo files with the content from POEM. Files whose content has
+        not changed are left intact; IDs of repos defined in the changed
+        files are kept in changed_repos.
+        :param include_internal: include internal metrics' packages
+        :return: sorted list of all the repo files
+        """
         if not self.data:
             self.data = self.get_data(include_internal=include_internal)
 
         files = []
+        changed_files = []
+        repo_ids = set()
+        changed_repos = set()
+        if self.reposdir:
+            os.makedirs(self.path, exist_ok=True)
+
         for key, value in self.data.items():
             title = key
             filename = os.path.join(self.path, title + '.repo')
             content = value['content']
 
             files.append(filename)
+            repo_ids.update(_repo_ids(content))
+
+            old_content = None
+            if os.path.exists(filename):
+                with open(filename, 'r') as f:
+                    old_content = f.read()
+
+            # unchanged files are not touched, so that their mtime (and
+            # the metadata cached by yum) stays valid
+            if old_content is not None and \
+                    _digest(old_content) == _digest(content):
+                continue
+
+            changed_files.append(filename)
+            changed_repos.update(_repo_ids(content))
+            if old_content:
+                changed_repos.update(_repo_ids(old_content))
 
             if not self.override:
                 os.makedirs('/tmp' + self.path, exist_ok=True)
                 if os.path.isfile(filename):
                     shutil.copyfile(filename, '/tmp' + filename)
 
-            with open(filename, 'w') as f:
-                f.write(content)
+            write_atomic(filename, content)
+
+        if self.reposdir:
+            self._remove_stale_files(files)
+
+        self.repo_ids = sorted(repo_ids)
+        self.changed_repos = sorted(changed_repos)
+        self.changed_files = sorted(changed_files)
 
         return sorted(files)
 
+    def _remove_stale_files(self, files):
+        """
+        Remove repo files which are no longer defined in POEM from the
+        private reposdir. Only the files written by the tool, as listed in
+        the manifest, are removed; the manifest is then replaced with the
+        current list of files.
+        :param files: list of the current repo files
+        """
+        manifest = os.path.join(self.path, MANIFEST)
+        names = [os.path.basename(filename) for filename in files]
+        try:
+            with open(manifest, 'r') as f:
+                written = f.read().split()
+
+        except OSError:
+            written = []
+
+        for name in written:
+            filename = os.path.join(self.path, name)
+            if name not in names and os.path.isfile(filename):
+                os.remove(filename)
+
+        write_atomic(manifest, ''.join(name + '\n' for name in sorted(names)))
+
+    def expire_cache(self):
+        """
+        Remove YUM metadata only for the repos whose definition has been
+        changed, the cache of other repos is left intact. dnf ignores the
+        repo selection when cleaning the cache and would remove metadata of
+        all the repos, so there the changed repos are refreshed instead.
+        """
+        if self.changed_repos:
+            repo_options = reposdir_options(self.reposdir) + [
+                '--disablerepo=*',
+                '--enablerepo=' + ','.join(self.changed_repos)
+            ]
+            if yum_is_dnf():
+                with timing.span('yum makecache'):
+                    subprocess.call(
+                        ['yum', 'makecache', '--refresh'] + repo_options
+                    )
+
+            else:
+                with timing.span('yum clean metadata'):
+                    subprocess.call(['yum', 'clean', 'metadata'] + repo_options)
+
     def clean(self):
         if not self.override:
             tmp_dir = '/tmp' + self.path
@@ -112,7 +342,8 @@ class YUMRepos:
 
                 shutil.rmtree(tmp_dir)
 
-        subprocess.call(['yum', 'clean', 'all'])
+                # the restored repo files differ from the ones used in the run
+                self.expire_cache()
 
     @classmethod
     def _get_centos_version(cls):
@@ -0,0 +1,79 @@
+import os
+import time
+
+
+class Scheduler:
+    """
+    Schedules runs of the tool in daemon mode. Runs are repeated with the
+    given interval, which is doubled (up to the maximum interval) after
+    each run in which nothing has changed, and reset after a run which
+    changed something or failed. Run is triggered immediately if any of the
+    watched files is modified.
+    """
+    def __init__(self, interval, max_interval=None, watch=None, poll=1.0):
+        self.interval = interval
+        self.max_interval = max(max_interval or interval, interval)
+        self.current_interval = interval
+        self.watch = list(watch) if watch else []
+        self.poll = poll
+        self.stopped = False
+        self.mtimes = self._get_mtimes()
+
+    def _get_mtimes(self):
+        mtimes = dict()
+        for filename in self.watch:
+            try:
+                mtimes[filename] = os.stat(filename).st_mtime_ns
+
+            except OSError:
+                mtimes[filename] = None
+
+        return mtimes
+
+    def watched_changed(self):
+        """
+        Check if any of the watched files has been modified since the last
+        check.
+        :return: True if any of the files has been modified
+        """
+        mtimes = self._get_mtimes()
+        changed = mtimes != self.mtimes
+        self.mtimes = mtimes
+
+        return changed
+
+    def update(self, changed):
+        """
+        Adapt the interval to the result of the last run.
+        :param changed: True if the run has changed anything or failed
+        """
+        if changed:
+            self.current_interval = self.interval
+
+        else:
+            self.current_interval = min(
+                self.current_interval * 2, self.max_interval
+            )
+
+    def stop(self, *args):
+        self.stopped = True
+
+    def wait(self):
+        """
+        Wait until the next run is due.
+        :return: True if the next run should be started, False if the
+        scheduler has been stopped
+        """
+        deadline = time.monotonic() + self.current_interval
+        while not self.stopped:
+            if self.watched_changed():
+                self.current_interval = self.interval
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+
+            time.sleep(min(self.poll, remaining))
+
+        return False
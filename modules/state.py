@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+
+from argo_poem_tools.files import write_atomic
+from argo_poem_tools.versionlock import VERSIONLOCK_LISTS
+
+
+def pinned(data):
+    """
+    Check if all the packages in the data from POEM are requested with
+    version. Packages requested as present are upgraded whenever a newer
+    version appears in the repos, which is not covered by the fingerprint.
+    :param data: data from POEM
+    :return: True if none of the packages is requested as present
+    """
+    return all(
+        pkg['version'] != 'present'
+        for value in data.values() for pkg in value['packages']
+    )
+
+
+class RunState:
+    """
+    Fingerprint of the desired state fetched from POEM together with the
+    state of the host (installed packages and versionlocks). It is stored
+    after a successful run, so that the following runs can tell when there
+    is nothing to be done.
+    """
+    def __init__(self, cache_dir):
+        self.filename = os.path.join(cache_dir, 'fingerprint')
+
+    @staticmethod
+    def fingerprint(*desired, installed):
+        """
+        Calculate fingerprint of the desired state and the state of the host.
+        :param desired: JSON serializable description of the desired state
+        :param installed: list of installed packages as returned by package
+        backend
+        :return: hex digest of the fingerprint
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(desired, sort_keys=True).encode('utf-8'))
+        digest.update(json.dumps(
+            sorted(
+                [pkg['name'], pkg.get('epoch', 0), pkg['version'],
+                 pkg['release'], pkg.get('arch')] for pkg in installed
+            )
+        ).encode('utf-8'))
+
+        for filename in VERSIONLOCK_LISTS:
+            if os.path.isfile(filename):
+                with open(filename, 'rb') as f:
+                    digest.update(f.read())
+
+        return digest.hexdigest()
+
+    def unchanged(self, fingerprint):
+        """
+        Check if the fingerprint is the same as the one stored after the last
+        successful run.
+        :param fingerprint: hex digest of the fingerprint
+        :return: True if the fingerprint matches the stored one
+        """
+        if not fingerprint:
+            return False
+
+        try:
+            with open(self.filename, 'r') as f:
+                return f.read().strip() == fingerprint
+
+        except OSError:
+            return False
+
+    def save(self, fingerprint):
+        if not fingerprint:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            write_atomic(self.filename, fingerprint + '\n')
+
+        except OSError:
+            pass
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from argo_poem_tools.files import write_atomic
+
+_lock = threading.Lock()
+_local = threading.local()
+_spans = []
+_origin = time.monotonic()
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+
+    return _local.stack
+
+
+def reset():
+    """
+    Remove all the recorded spans and start measuring time from now.
+    """
+    global _origin
+    with _lock:
+        del _spans[:]
+        _origin = time.monotonic()
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Record duration of the code run within the context.
+    :param name: name of the span
+    :param attrs: additional information stored with the span
+    """
+    stack = _stack()
+    record = dict(
+        name=name,
+        start=time.monotonic() - _origin,
+        duration=None,
+        depth=len(stack),
+        parent=stack[-1]['name'] if stack else None,
+        thread=threading.current_thread().name
+    )
+    if attrs:
+        record['attrs'] = attrs
+
+    with _lock:
+        _spans.append(record)
+
+    stack.append(record)
+    try:
+        yield record
+
+    finally:
+        record['duration'] = time.monotonic() - _origin - record['start']
+        # span in a generator might not be closed in order
+        if record in stack:
+            stack.remove(record)
+
+
+def inherit(func):
+    """
+    Wrap function which is going to be run in another thread, so that the
+    spans recorded in it are nested in the current span.
+    :param func: function to be wrapped
+    :return: wrapped function
+    """
+    parent = list(_stack())
+
+    def wrapper(*args, **kwargs):
+        _local.stack = list(parent)
+        try:
+            return func(*args, **kwargs)
+
+        finally:
+            _local.stack = []
+
+    return wrapper
+
+
+def get_spans():
+    with _lock:
+        return [dict(record) for record in _spans]
+
+
+def elapsed():
+    return time.monotonic() - _origin
+
+
+def summary():
+    """
+    Summary of the top level spans; durations of the spans with the same
+    name are added up.
+    :return: one line summary
+    """
+    totals = dict()
+    for record in get_spans():
+        if record['depth'] == 0 and record['duration'] is not None:
+            totals[record['name']] = \
+                totals.get(record['name'], 0) + record['duration']
+
+    return 'total {:.2f} s; '.format(elapsed()) + ', '.join(
+        '{} {:.2f} s'.format(name, duration)
+        for name, duration in totals.items()
+    )
+
+
+def report():
+    """
+    Breakdown of all the recorded spans, nested spans are indented.
+    :return: multiline report
+    """
+    lines = ['{:>10}  {:>10}  {}'.format('start (s)', 'time (s)', 'phase')]
+    for record in get_spans():
+        duration = record['duration']
+        lines.append('{:>10}  {:>10}  {}{}'.format(
+            '{:.3f}'.format(record['start']),
+            '{:.3f}'.format(duration) if duration is not None else '-',
+            '  ' * record['depth'], record['name']
+        ))
+
+    lines.append('Total: {:.3f} s'.format(elapsed()))
+
+    return '\n'.join(lines)
+
+
+def write_trace(filename):
+    """
+    Write all the recorded spans as JSON.
+    :param filename: name of the file
+    """
+    # the trace from the previous run is replaced at once
+    write_atomic(
+        filename,
+        json.dumps({'total': elapsed(), 'spans': get_spans()}, indent=2)
+    )
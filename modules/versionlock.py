@@ -0,0 +1,115 @@
+import subprocess
+from re import compile
+
+from argo_poem_tools import timing
+
+# locations of the versionlock plugin list for yum and dnf respectively
+VERSIONLOCK_LISTS = [
+    '/etc/yum/pluginconf.d/versionlock.list',
+    '/etc/dnf/plugins/versionlock.list'
+]
+
+# both yum (0:name-version-release.*) and dnf (name-0:version-release.*)
+# formats of 'yum versionlock list' entries
+_lock_re = compile(r'^(?:\d+:)?(\S+)-(?:\d+:)?[^-:\s]+-[^-\s]+?(?:\.\*)?$')
+
+
+def _parse_locked_names(output):
+    """
+    Parse names of locked packages from 'yum versionlock list' output.
+    :param output: string output of 'yum versionlock list'
+    :return: set of names of locked packages
+    """
+    names = set()
+    for line in output.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('!'):
+            continue
+
+        match = _lock_re.match(line)
+        if match:
+            names.add(match.group(1))
+
+    return names
+
+
+class VersionLockManager:
+    """
+    Keeps track of yum versionlocks. The list of locked packages is read
+    only once, and locks are added and deleted with a single yum call for
+    all the packages.
+    """
+    def __init__(self):
+        self.locked = None
+
+    def list(self):
+        """
+        Get names of locked packages, 'yum versionlock list' is called only
+        the first time.
+        :return: set of names of locked packages
+        """
+        if self.locked is None:
+            with timing.span('yum versionlock list'):
+                output = subprocess.check_output(
+                    ['yum', 'versionlock', 'list']
+                ).decode('utf-8')
+
+            self.locked = _parse_locked_names(output)
+
+        return self.locked
+
+    def _call(self, action, names):
+        try:
+            with timing.span('yum versionlock ' + action, packages=len(names)):
+                returncode = subprocess.call(
+                    ['yum', 'versionlock', action] + names,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+
+        except OSError:
+            return names
+
+        if returncode:
+            return names
+
+        return []
+
+    def add(self, names):
+        """
+        Lock versions of the given packages. Packages which are already
+        known to be locked are skipped.
+        :param names: list of package names
+        :return: list of packages which were not locked
+        """
+        names = [
+            name for name in names
+            if self.locked is None or name not in self.locked
+        ]
+        if not names:
+            return []
+
+        failed = self._call('add', names)
+        if self.locked is not None:
+            self.locked.update(set(names) - set(failed))
+
+        return failed
+
+    def delete(self, names):
+        """
+        Delete version locks of the given packages. Packages which are known
+        not to be locked are skipped.
+        :param names: list of package names
+        :return: list of packages which were not unlocked
+        """
+        names = [
+            name for name in names
+            if self.locked is None or name in self.locked
+        ]
+        if not names:
+            return []
+
+        failed = self._call('delete', names)
+        if self.locked is not None:
+            self.locked.difference_update(set(names) - set(failed))
+
+        return failed
@@ -23,6 +23,9 @@ setup(
     url='https://github.com/ARGOeu/argo-poem-tools',
     package_dir={'argo_poem_tools': 'modules'},
     packages=['argo_poem_tools'],
-    data_files=[('/etc/argo-poem-tools/', ['config/argo-poem-tools.conf'])],
+    data_files=[
+        ('/etc/argo-poem-tools/', ['config/argo-poem-tools.conf']),
+        ('/usr/lib/systemd/system/', ['config/argo-poem-tools.service'])
+    ],
     scripts=['exec/argo-poem-packages.py']
 )
@@ -0,0 +1,536 @@
+import argparse
+import configparser
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from argo_poem_tools.repos import YUMRepos
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'exec', 'argo-poem-packages.py'
+)
+
+spec = importlib.util.spec_from_file_location('argo_poem_packages', SCRIPT)
+script = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(script)
+
+mock_data = {
+    "data": {
+        "argo-devel": {
+            "content": "[argo-devel]\n"
+                       "name=ARGO Product Repository\n"
+                       "baseurl=http://rpm-repo.argo.grnet.gr/ARGO/"
+                       "devel/rocky9/\n"
+                       "gpgcheck=0\n"
+                       "enabled=1\n",
+            "packages": [
+                {
+                    "name": "nagios-plugins-argo",
+                    "version": "0.1.12"
+                },
+                {
+                    "name": "nagios-plugins-http",
+                    "version": "present"
+                }
+            ]
+        }
+    },
+    "missing_packages": []
+}
+
+mock_data_pinned = {
+    "argo-devel": dict(
+        mock_data["data"]["argo-devel"],
+        packages=[
+            {"name": "nagios-plugins-argo", "version": "0.1.12"},
+            {"name": "nagios-plugins-http", "version": "2.3.3"}
+        ]
+    )
+}
+
+mock_installed = [
+    dict(name='nagios-plugins-argo', epoch=0, version='0.1.12',
+         release='20200716071827.00f2ce3.el9', arch='noarch'),
+    dict(name='nagios-plugins-http', epoch=0, version='2.3.3',
+         release='2.el9', arch='x86_64')
+]
+
+
+class MockConfig:
+    conf = '/etc/argo-poem-tools/argo-poem-tools.conf'
+
+    def get_hostname(self):
+        return 'mock.url.com'
+
+    def get_token(self):
+        return 'some-token-1234'
+
+    def get_profiles(self):
+        return ['ARGO-MON', 'MON-TEST']
+
+
+@mock.patch(
+    'argo_poem_tools.repos.YUMRepos._get_centos_version',
+    mock.Mock(return_value='rocky9')
+)
+@mock.patch('argo_poem_tools.packages.rpmdb_cookie', mock.Mock())
+@mock.patch.object(script, 'Config', MockConfig)
+class CheckTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.args = argparse.Namespace(
+            include_internal=False, backend='subprocess'
+        )
+        patcher = mock.patch.object(script, 'CACHE_DIR', self.tmpdir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _cache(self, body):
+        config = MockConfig()
+        repos = YUMRepos(
+            hostname=config.get_hostname(), token=config.get_token(),
+            profiles=config.get_profiles(), cache_dir=self.tmpdir.name
+        )
+        for url, headers in repos._queries():
+            with open(repos._cache_file(url, headers), 'w') as f:
+                json.dump(
+                    {'etag': '"1234"', 'last_modified': None, 'body': body}, f
+                )
+
+    def _check(self, installed):
+        with mock.patch(
+            'argo_poem_tools.packages.installed_snapshot'
+        ) as mock_snapshot, mock.patch.object(
+            script.timing, 'elapsed', return_value=0.0123
+        ), mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            mock_snapshot.return_value = (None, installed)
+            status = script.check(self.args)
+
+        return status, stdout.getvalue()
+
+    def test_ok(self):
+        self._cache(mock_data)
+        self.assertEqual(
+            self._check(mock_installed),
+            (
+                0,
+                'OK - All 2 requested packages are installed|requested=2 '
+                'missing=0 different_version=0 time=0.012s\n'
+            )
+        )
+
+    def test_warning(self):
+        self._cache(mock_data)
+        installed = [
+            dict(mock_installed[0], version='0.1.11'), mock_installed[1]
+        ]
+        self.assertEqual(
+            self._check(installed),
+            (
+                1,
+                'WARNING - Packages with different version: '
+                'nagios-plugins-argo-0.1.11 -> nagios-plugins-argo-0.1.12'
+                '|requested=2 missing=0 different_version=1 time=0.012s\n'
+            )
+        )
+
+    def test_critical(self):
+        self._cache(mock_data)
+        installed = [dict(mock_installed[0], version='0.1.13')]
+        self.assertEqual(
+            self._check(installed),
+            (
+                2,
+                'CRITICAL - Packages not installed: nagios-plugins-http / '
+                'Packages with different version: '
+                'nagios-plugins-argo-0.1.13 -> nagios-plugins-argo-0.1.12'
+                '|requested=2 missing=1 different_version=1 time=0.012s\n'
+            )
+        )
+
+    def test_unknown_without_cache(self):
+        self.assertEqual(
+            self._check(mock_installed),
+            (
+                3,
+                'UNKNOWN - No cached data from POEM, the tool has not been '
+                'run yet\n'
+            )
+        )
+
+    def test_unknown_if_error(self):
+        self._cache(mock_data)
+        with mock.patch.object(MockConfig, 'get_profiles') as mock_profiles:
+            mock_profiles.side_effect = configparser.NoSectionError(
+                'PROFILES'
+            )
+            status, output = self._check(mock_installed)
+
+        self.assertEqual(status, 3)
+        self.assertEqual(output, "UNKNOWN - No section: 'PROFILES'\n")
+
+
+@mock.patch.object(script, 'Config', MockConfig)
+class AgentTests(unittest.TestCase):
+    def setUp(self):
+        self.args = argparse.Namespace(
+            noop=False, backup=False, private_reposdir=None,
+            include_internal=False, force=False, backend='subprocess',
+            daemon=False, timings=False, metrics=None, write_plan=None,
+            apply_plan=None, lock_timeout=600
+        )
+        self.agent = script.Agent(self.args, mock.Mock())
+        self.agent.state = mock.Mock()
+        self.agent.state.unchanged.return_value = False
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # snapshots of installed packages are not reused between the runs
+        patcher = mock.patch.object(script, 'rpmdb_cookie', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def _mock_run(mock_repos, mock_backend, mock_snapshot, data=None):
+        mock_backend.return_value.name = 'subprocess'
+        mock_snapshot.return_value = (None, mock_installed)
+        repos = mock_repos.return_value
+        repos.get_data.return_value = data if data else mock_data['data']
+        repos.missing_packages = []
+        repos.changed_files = []
+        repos.changed_repos = []
+        repos.create_file.return_value = []
+        return repos
+
+    def _plan(self, fingerprint):
+        resolved = (
+            [('nagios-plugins-http', '2.3.3', '2.el9')], [], [], [], []
+        )
+        plan = script.Plan(
+            fingerprint, mock_data['data'], [], False, resolved=resolved
+        )
+        self.args.apply_plan = os.path.join(self.tmpdir.name, 'plan.json')
+        plan.save(self.args.apply_plan)
+        return resolved
+
+    @mock.patch.object(script, 'yum_is_dnf')
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_wait_for_yum_before_calling_yum(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages, mock_dnf
+    ):
+        calls = mock.Mock()
+        calls.attach_mock(mock_wait, 'wait_for_yum')
+        calls.attach_mock(mock_versionlock.return_value.list, 'list')
+        calls.attach_mock(mock_repos.return_value.expire_cache, 'expire')
+        calls.attach_mock(mock_packages.return_value.install, 'install')
+        mock_wait.return_value = 0
+        mock_dnf.return_value = True
+        mock_backend.return_value.name = 'subprocess'
+        mock_snapshot.return_value = (None, mock_installed)
+        repos = mock_repos.return_value
+        repos.get_data.return_value = mock_data['data']
+        repos.missing_packages = []
+        repos.changed_files = []
+        repos.changed_repos = ['argo-devel']
+        repos.create_file.return_value = ['/etc/yum.repos.d/argo-devel.repo']
+        mock_packages.return_value.install.return_value = ([], [])
+        self.assertEqual(self.agent._run(), 0)
+        self.assertEqual(
+            [call[0] for call in calls.mock_calls],
+            ['wait_for_yum', 'list', 'expire', 'wait_for_yum', 'install']
+        )
+        mock_wait.assert_called_with(600)
+        # packages are prefetched only if yum is dnf
+        self.assertTrue(mock_packages.call_args[1]['prefetch'])
+        mock_dnf.return_value = False
+        self.agent._run()
+        self.assertFalse(mock_packages.call_args[1]['prefetch'])
+
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_yum_locked_too_long(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock
+    ):
+        mock_wait.side_effect = script.LockTimeout(
+            'yum has been locked by process 1234 for more than 600 s'
+        )
+        mock_backend.return_value.name = 'subprocess'
+        mock_snapshot.return_value = (None, mock_installed)
+        mock_repos.return_value.get_data.return_value = mock_data['data']
+        mock_repos.return_value.missing_packages = []
+        self.assertEqual(self.agent._run(), 2)
+        self.assertFalse(mock_versionlock.return_value.list.called)
+        self.assertFalse(mock_repos.return_value.create_file.called)
+
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_restore_repo_files_if_yum_locked_after_writing_them(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages
+    ):
+        mock_wait.side_effect = [
+            0, script.LockTimeout(
+                'yum has been locked by process 1234 for more than 600 s'
+            )
+        ]
+        mock_backend.return_value.name = 'subprocess'
+        mock_snapshot.return_value = (None, mock_installed)
+        repos = mock_repos.return_value
+        repos.get_data.return_value = mock_data['data']
+        repos.missing_packages = []
+        repos.changed_files = []
+        repos.changed_repos = []
+        repos.create_file.return_value = []
+        self.assertEqual(self.agent._run(), 2)
+        self.assertTrue(repos.create_file.called)
+        self.assertFalse(mock_packages.called)
+        repos.clean.assert_called_once_with()
+
+    @mock.patch.object(script, 'yum_is_dnf', mock.Mock(return_value=False))
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_apply_plan(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages
+    ):
+        mock_wait.return_value = 0
+        repos = self._mock_run(mock_repos, mock_backend, mock_snapshot)
+        mock_packages.return_value.install.return_value = ([], [])
+        self.agent.state.fingerprint.return_value = 'abcd'
+        resolved = self._plan('abcd')
+        self.assertEqual(self.agent._run(), 0)
+        self.agent.state.fingerprint.assert_any_call(
+            mock_data['data'], [], False, installed=mock_installed
+        )
+        # neither POEM nor yum is asked again
+        self.assertFalse(repos.get_data.called)
+        self.assertFalse(mock_backend.return_value.available.called)
+        self.assertFalse(mock_packages.return_value.no_op.called)
+        mock_packages.return_value.install.assert_called_once_with(
+            resolved=resolved
+        )
+
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_apply_plan_if_host_changed(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages
+    ):
+        mock_wait.return_value = 0
+        repos = self._mock_run(mock_repos, mock_backend, mock_snapshot)
+        self.agent.state.fingerprint.return_value = 'abcd'
+        self._plan('dcba')
+        self.assertEqual(self.agent._run(), 2)
+        self.assertFalse(repos.get_data.called)
+        self.assertFalse(repos.create_file.called)
+        self.assertFalse(mock_packages.return_value.install.called)
+        self.assertFalse(self.agent.state.save.called)
+
+    def _unchanged_since_last_run(self, data):
+        self.agent.state = script.RunState(self.tmpdir.name)
+        self.agent.state.save(self.agent.state.fingerprint(
+            data, [], False, installed=mock_installed
+        ))
+
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_skip_if_nothing_changed(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages
+    ):
+        repos = self._mock_run(
+            mock_repos, mock_backend, mock_snapshot, mock_data_pinned
+        )
+        self._unchanged_since_last_run(mock_data_pinned)
+        self.assertEqual(self.agent._run(), 0)
+        self.assertFalse(self.agent.changed)
+        self.assertFalse(mock_wait.called)
+        self.assertFalse(repos.create_file.called)
+        self.assertFalse(mock_packages.called)
+
+    @mock.patch.object(script, 'yum_is_dnf', mock.Mock(return_value=False))
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_do_not_skip_if_forced(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages
+    ):
+        mock_wait.return_value = 0
+        repos = self._mock_run(
+            mock_repos, mock_backend, mock_snapshot, mock_data_pinned
+        )
+        mock_packages.return_value.install.return_value = ([], [])
+        self._unchanged_since_last_run(mock_data_pinned)
+        self.args.force = True
+        self.assertEqual(self.agent._run(), 0)
+        self.assertTrue(self.agent.changed)
+        self.assertTrue(mock_wait.called)
+        self.assertTrue(repos.create_file.called)
+        self.assertTrue(mock_packages.return_value.install.called)
+
+    @mock.patch.object(script, 'yum_is_dnf', mock.Mock(return_value=False))
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_do_not_skip_if_packages_requested_as_present(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages
+    ):
+        mock_wait.return_value = 0
+        self._mock_run(mock_repos, mock_backend, mock_snapshot)
+        mock_packages.return_value.install.return_value = ([], [])
+        self._unchanged_since_last_run(mock_data['data'])
+        self.assertEqual(self.agent._run(), 0)
+        self.assertTrue(self.agent.changed)
+        self.assertTrue(mock_packages.return_value.install.called)
+
+    @mock.patch.object(script, 'yum_is_dnf', mock.Mock(return_value=False))
+    @mock.patch.object(script, 'Packages')
+    @mock.patch.object(script, 'VersionLockManager')
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'get_backend')
+    @mock.patch.object(script, 'YUMRepos')
+    @mock.patch.object(script, 'wait_for_yum')
+    def test_noop_does_not_save_state(
+            self, mock_wait, mock_repos, mock_backend, mock_snapshot,
+            mock_versionlock, mock_packages
+    ):
+        mock_wait.return_value = 0
+        self._mock_run(
+            mock_repos, mock_backend, mock_snapshot, mock_data_pinned
+        )
+        mock_packages.return_value.no_op.return_value = ([], [])
+        self.agent.state = script.RunState(self.tmpdir.name)
+        self.args.noop = True
+        self.assertEqual(self.agent._run(), 0)
+        self.assertTrue(mock_packages.return_value.no_op.called)
+        self.assertFalse(mock_packages.return_value.install.called)
+        self.assertFalse(os.path.exists(self.agent.state.filename))
+
+        # the following run is not skipped
+        self.assertEqual(self.agent._run(), 0)
+        self.assertEqual(mock_packages.return_value.no_op.call_count, 2)
+
+    @mock.patch.object(script, 'installed_snapshot')
+    @mock.patch.object(script, 'rpmdb_cookie')
+    def test_reuse_installed_snapshot(self, mock_cookie, mock_snapshot):
+        backend = mock.Mock()
+        snapshot1 = ((1, 1234), mock_installed)
+        snapshot2 = ((2, 1234), mock_installed[:1])
+        mock_snapshot.side_effect = [snapshot1, snapshot2, snapshot2]
+        mock_cookie.side_effect = [(1, 1234), (1, 1234), (2, 1234), None]
+        self.assertEqual(self.agent._installed(backend), snapshot1)
+        # rpmdb has not been modified
+        self.assertEqual(self.agent._installed(backend), snapshot1)
+        self.assertEqual(mock_snapshot.call_count, 1)
+        self.assertEqual(self.agent._installed(backend), snapshot2)
+        self.assertEqual(mock_snapshot.call_count, 2)
+        # rpmdb files not found, the snapshot cannot be reused
+        self.assertEqual(self.agent._installed(backend), snapshot2)
+        self.assertEqual(mock_snapshot.call_count, 3)
+        mock_snapshot.assert_called_with(backend)
+
+
+@mock.patch.object(script, 'Config', MockConfig)
+@mock.patch.object(script.signal, 'signal')
+@mock.patch.object(script, 'Scheduler')
+class DaemonTests(unittest.TestCase):
+    def setUp(self):
+        self.args = argparse.Namespace(interval=900, max_interval=3600)
+        self.logger = mock.Mock()
+        self.agent = mock.Mock()
+        self.agent.changed = False
+
+    def _runs(self, results):
+        results = list(results)
+
+        def run():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+
+            self.agent.changed = result[1]
+            return result[0]
+
+        return run
+
+    def test_daemon(self, mock_scheduler, mock_signal):
+        scheduler = mock_scheduler.return_value
+        scheduler.wait.side_effect = [True, True, True, False]
+        error = Exception('Something went wrong')
+        self.agent.run.side_effect = self._runs(
+            [(0, False), (2, False), error, (0, True)]
+        )
+        script.daemon(self.agent, self.args, self.logger)
+        mock_scheduler.assert_called_once_with(
+            900, max_interval=3600, watch=[MockConfig.conf]
+        )
+        self.assertEqual(
+            mock_signal.call_args_list,
+            [
+                mock.call(script.signal.SIGTERM, scheduler.stop),
+                mock.call(script.signal.SIGINT, scheduler.stop)
+            ]
+        )
+        self.assertEqual(self.agent.run.call_count, 4)
+        # backs off only after the run which has changed nothing
+        self.assertEqual(
+            scheduler.update.call_args_list,
+            [
+                mock.call(changed=False), mock.call(changed=True),
+                mock.call(changed=True), mock.call(changed=True)
+            ]
+        )
+        self.logger.exception.assert_called_once_with(error)
+        self.logger.info.assert_called_with('Daemon stopped.')
+
+    def test_daemon_stopped(self, mock_scheduler, mock_signal):
+        scheduler = mock_scheduler.return_value
+        scheduler.wait.return_value = False
+        self.agent.run.return_value = 0
+        script.daemon(self.agent, self.args, self.logger)
+        self.assertEqual(self.agent.run.call_count, 1)
+        scheduler.update.assert_called_once_with(changed=False)
+        self.assertFalse(self.logger.exception.called)
@@ -0,0 +1,178 @@
+import sys
+import unittest
+from unittest import mock
+
+from argo_poem_tools.backends import DNFBackend, SubprocessBackend, \
+    get_backend, parallel_download_options, yum_is_dnf
+
+
+class MockPackage:
+    def __init__(self, name, epoch, version, release, arch='noarch'):
+        self.name = name
+        self.epoch = epoch
+        self.version = version
+        self.release = release
+        self.arch = arch
+
+    def __str__(self):
+        if self.epoch:
+            return '{}-{}:{}-{}.{}'.format(
+                self.name, self.epoch, self.version, self.release, self.arch
+            )
+
+        return '{}-{}-{}.{}'.format(
+            self.name, self.version, self.release, self.arch
+        )
+
+
+mock_installed = [
+    MockPackage('argo-probe-oidc', 0, '0.1.0', '1.el9'),
+    MockPackage('NetworkManager', 1, '1.42.2', '1.el9', arch='x86_64')
+]
+
+mock_available = [
+    MockPackage('argo-probe-oidc', 0, '0.1.0', '1.el9'),
+    MockPackage('argo-probe-oidc', 0, '0.2.0', '1.el9'),
+    MockPackage('NetworkManager', 1, '1.42.2', '6.el9', arch='x86_64')
+]
+
+mock_headers = [
+    {'name': b'argo-probe-oidc', 'epochnum': 0, 'version': b'0.1.0',
+     'release': b'1.el9', 'arch': b'noarch'},
+    {'name': 'NetworkManager', 'epochnum': 1, 'version': '1.42.2',
+     'release': '1.el9', 'arch': 'x86_64'}
+]
+
+
+class MockRepo:
+    def __init__(self, repo_id):
+        self.id = repo_id
+        self.enabled = True
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+
+def mock_dnf_module(repos):
+    query = mock.MagicMock()
+    query.installed.return_value = mock_installed
+    query.available.return_value.filter.side_effect = \
+        lambda name: [pkg for pkg in mock_available if pkg.name in name]
+
+    base = mock.MagicMock()
+    base.repos.all.return_value = repos
+    base.sack.query.return_value = query
+
+    dnf = mock.MagicMock()
+    dnf.Base.return_value = base
+
+    return dnf
+
+
+def mock_rpm_module():
+    rpm = mock.MagicMock()
+    rpm.TransactionSet.return_value.dbMatch.return_value = mock_headers
+
+    return rpm
+
+
+class BackendTests(unittest.TestCase):
+    def tearDown(self):
+        yum_is_dnf.cache_clear()
+
+    @mock.patch('argo_poem_tools.backends.os.path.realpath')
+    @mock.patch('argo_poem_tools.backends.shutil.which')
+    def test_parallel_download_options_with_dnf(self, mock_which, mock_path):
+        mock_which.return_value = '/usr/bin/yum'
+        mock_path.return_value = '/usr/bin/dnf-3'
+        self.assertEqual(
+            parallel_download_options(),
+            ['--setopt=max_parallel_downloads=10']
+        )
+        mock_path.assert_called_once_with('/usr/bin/yum')
+
+    @mock.patch('argo_poem_tools.backends.os.path.realpath')
+    @mock.patch('argo_poem_tools.backends.shutil.which')
+    def test_parallel_download_options_with_yum(self, mock_which, mock_path):
+        mock_which.return_value = '/usr/bin/yum'
+        mock_path.return_value = '/usr/bin/yum'
+        self.assertEqual(parallel_download_options(), [])
+
+        yum_is_dnf.cache_clear()
+        mock_which.return_value = None
+        self.assertEqual(parallel_download_options(), [])
+
+    def test_get_subprocess_backend(self):
+        self.assertIsInstance(get_backend(), SubprocessBackend)
+        self.assertIsInstance(get_backend('subprocess'), SubprocessBackend)
+
+    def test_get_dnf_backend(self):
+        modules = {'dnf': mock_dnf_module([]), 'rpm': mock_rpm_module()}
+        with mock.patch.dict(sys.modules, modules):
+            self.assertIsInstance(get_backend('dnf'), DNFBackend)
+
+    def test_get_dnf_backend_if_bindings_missing(self):
+        with mock.patch.dict(sys.modules, {'dnf': None, 'rpm': None}):
+            backend = get_backend('dnf')
+
+        self.assertIsInstance(backend, SubprocessBackend)
+        self.assertEqual(backend.name, 'subprocess')
+
+    def test_dnf_available(self):
+        repos = [MockRepo('argo-devel'), MockRepo('baseos')]
+        dnf = mock_dnf_module(repos)
+        with mock.patch.dict(
+                sys.modules, {'dnf': dnf, 'rpm': mock_rpm_module()}
+        ):
+            backend = DNFBackend()
+            pkgs = backend.available(
+                ['argo-probe-oidc', 'NetworkManager'], repo_ids=['argo-devel']
+            )
+
+        self.assertEqual(
+            pkgs,
+            [
+                dict(name='argo-probe-oidc', version='0.2.0', release='1.el9'),
+                dict(
+                    name='NetworkManager', version='1:1.42.2', release='6.el9'
+                )
+            ]
+        )
+        self.assertTrue(repos[0].enabled)
+        self.assertFalse(repos[1].enabled)
+        self.assertEqual(repos[0].metadata_expire, 0)
+        self.assertFalse(hasattr(repos[1], 'metadata_expire'))
+        dnf.Base.return_value.fill_sack.assert_called_once_with(
+            load_system_repo=True
+        )
+        self.assertEqual(dnf.Base.return_value.close.call_count, 1)
+
+    def test_dnf_available_from_private_reposdir(self):
+        dnf = mock_dnf_module([MockRepo('argo-devel')])
+        reposdir = ['/var/lib/argo-poem-tools/repos.d', '/etc/yum.repos.d']
+        with mock.patch.dict(
+                sys.modules, {'dnf': dnf, 'rpm': mock_rpm_module()}
+        ):
+            backend = DNFBackend()
+            backend.available(['argo-probe-oidc'], reposdir=reposdir)
+
+        self.assertEqual(dnf.Base.return_value.conf.reposdir, reposdir)
+
+    def test_dnf_installed(self):
+        modules = {'dnf': mock_dnf_module([]), 'rpm': mock_rpm_module()}
+        with mock.patch.dict(sys.modules, modules):
+            backend = DNFBackend()
+            pkgs = backend.installed()
+
+        self.assertEqual(
+            pkgs,
+            [
+                dict(name='argo-probe-oidc', epoch=0, version='0.1.0',
+                     release='1.el9', arch='noarch'),
+                dict(name='NetworkManager', epoch=1, version='1.42.2',
+                     release='1.el9', arch='x86_64')
+            ]
+        )
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from argo_poem_tools.files import write_atomic
+
+
+class WriteAtomicTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'fingerprint')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_new_file(self):
+        write_atomic(self.filename, 'content\n')
+        with open(self.filename, 'r') as f:
+            self.assertEqual(f.read(), 'content\n')
+
+        self.assertEqual(os.listdir(self.tmpdir.name), ['fingerprint'])
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o644)
+
+    def test_replace_file_keeping_mode(self):
+        with open(self.filename, 'w') as f:
+            f.write('old')
+
+        os.chmod(self.filename, 0o600)
+        write_atomic(self.filename, 'new')
+        with open(self.filename, 'r') as f:
+            self.assertEqual(f.read(), 'new')
+
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o600)
+
+    @mock.patch('argo_poem_tools.files.os.replace')
+    def test_write_fails(self, mock_replace):
+        mock_replace.side_effect = OSError('No space left on device')
+        with open(self.filename, 'w') as f:
+            f.write('old')
+
+        with self.assertRaises(OSError):
+            write_atomic(self.filename, 'new')
+
+        with open(self.filename, 'r') as f:
+            self.assertEqual(f.read(), 'old')
+
+        self.assertEqual(os.listdir(self.tmpdir.name), ['fingerprint'])
@@ -0,0 +1,142 @@
+import fcntl
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from argo_poem_tools.lock import InstanceLock, LockTimeout, wait_for_yum, \
+    yum_lock_holder
+
+
+class InstanceLockTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, 'argo-poem-tools')
+        self.lock = InstanceLock(self.directory, timeout=0.2, poll=0.05)
+
+    def tearDown(self):
+        self.lock.release()
+        self.tmpdir.cleanup()
+
+    def test_acquire_free_lock(self):
+        self.assertEqual(self.lock.acquire(), 0)
+        with open(self.lock.filename, 'r') as f:
+            self.assertEqual(f.read(), str(os.getpid()))
+
+        self.lock.release()
+        self.assertIsNone(self.lock.fd)
+        self.assertEqual(self.lock.acquire(), 0)
+
+    def test_acquire_held_lock(self):
+        other = InstanceLock(self.directory, timeout=0.2, poll=0.05)
+        other.acquire()
+        try:
+            with self.assertRaises(LockTimeout) as context:
+                self.lock.acquire()
+
+        finally:
+            other.release()
+
+        self.assertIn(
+            '(PID {})'.format(os.getpid()), str(context.exception)
+        )
+        self.assertIsNone(self.lock.fd)
+        self.assertEqual(self.lock.acquire(), 0)
+
+    def test_acquire_after_wait(self):
+        real_flock = fcntl.flock
+        calls = []
+
+        def flock(fd, operation):
+            calls.append(operation)
+            if len(calls) < 3:
+                raise BlockingIOError
+
+            real_flock(fd, operation)
+
+        with mock.patch('argo_poem_tools.lock.fcntl.flock', side_effect=flock):
+            waited = self.lock.acquire()
+
+        self.assertGreater(waited, 0)
+        self.assertEqual(len(calls), 3)
+
+    def test_reuse_result(self):
+        os.makedirs(self.directory)
+        key = {'noop': True, 'backend': 'subprocess'}
+        since = time.time()
+        self.lock.save_result(key, 1)
+        self.assertEqual(self.lock.get_result(key, since), 1)
+        self.assertEqual(
+            os.listdir(self.directory), ['last-run.json']
+        )
+
+        # different options, or a run which finished before the wait
+        self.assertIsNone(
+            self.lock.get_result(
+                {'noop': False, 'backend': 'subprocess'}, since
+            )
+        )
+        self.assertIsNone(self.lock.get_result(key, time.time() + 1))
+
+    def test_get_result_without_previous_run(self):
+        self.assertIsNone(self.lock.get_result({'noop': True}, 0))
+
+
+class YUMLockTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pid_file = os.path.join(self.tmpdir.name, 'yum.pid')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write_pid(self, pid):
+        with open(self.pid_file, 'w') as f:
+            f.write(str(pid) + '\n')
+
+    def test_holder(self):
+        self.assertIsNone(yum_lock_holder([self.pid_file]))
+
+        # PID 1 is always running
+        self._write_pid(1)
+        self.assertEqual(yum_lock_holder([self.pid_file]), 1)
+
+        # lock held by the process itself is not waited for
+        self._write_pid(os.getpid())
+        self.assertIsNone(yum_lock_holder([self.pid_file]))
+
+    def test_holder_default_pid_files(self):
+        self._write_pid(1)
+        with mock.patch(
+            'argo_poem_tools.lock.YUM_PID_FILES',
+            [os.path.join(self.tmpdir.name, 'nonexisting.pid'), self.pid_file]
+        ):
+            self.assertEqual(yum_lock_holder(), 1)
+
+    @mock.patch('argo_poem_tools.lock.os.kill')
+    def test_holder_stale_pid_file(self, mock_kill):
+        mock_kill.side_effect = ProcessLookupError
+        self._write_pid(12345)
+        self.assertIsNone(yum_lock_holder([self.pid_file]))
+        mock_kill.assert_called_once_with(12345, 0)
+
+    @mock.patch('argo_poem_tools.lock.yum_lock_holder')
+    def test_wait_for_yum(self, mock_holder):
+        mock_holder.return_value = None
+        self.assertEqual(wait_for_yum(1, poll=0.01), 0)
+
+        mock_holder.side_effect = [1234, 1234, None]
+        self.assertGreater(wait_for_yum(1, poll=0.01), 0)
+        self.assertEqual(mock_holder.call_count, 4)
+
+    @mock.patch('argo_poem_tools.lock.yum_lock_holder')
+    def test_wait_for_yum_timeout(self, mock_holder):
+        mock_holder.return_value = 1234
+        with self.assertRaises(LockTimeout) as context:
+            wait_for_yum(0.05, poll=0.01)
+
+        self.assertEqual(
+            str(context.exception),
+            'yum has been locked by process 1234 for more than 0.05 s'
+        )
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from argo_poem_tools.metrics import Metrics, collect
+
+mock_spans = [
+    {
+        'name': 'poem', 'start': 0., 'duration': 0.3, 'depth': 0,
+        'parent': None, 'thread': 'MainThread'
+    },
+    {
+        'name': 'poem request', 'start': 0.01, 'duration': 0.28, 'depth': 1,
+        'parent': 'poem', 'thread': 'ThreadPoolExecutor-0_0',
+        'attrs': {'url': 'https://mock.url.com/api/v2/repos/rocky9'}
+    },
+    {
+        'name': 'packages', 'start': 0.4, 'duration': 42., 'depth': 0,
+        'parent': None, 'thread': 'MainThread'
+    },
+    {
+        'name': 'yum list available', 'start': 0.5, 'duration': 8.,
+        'depth': 1, 'parent': 'packages', 'thread': 'MainThread'
+    },
+    {
+        'name': 'yum install', 'start': 9., 'duration': 20., 'depth': 1,
+        'parent': 'packages', 'thread': 'MainThread'
+    },
+    {
+        'name': 'yum install', 'start': 29., 'duration': 13., 'depth': 1,
+        'parent': 'packages', 'thread': 'MainThread'
+    },
+    {
+        'name': 'rpm -qa', 'start': 42., 'duration': None, 'depth': 1,
+        'parent': 'packages', 'thread': 'MainThread'
+    }
+]
+
+
+class MetricsTests(unittest.TestCase):
+    def test_render_gauge(self):
+        metrics = Metrics()
+        metrics.gauge('packages', 'Number of packages.', 2, {'result': 'a'})
+        metrics.gauge('packages', 'Number of packages.', 0, {'result': 'b"'})
+        metrics.gauge('run_duration_seconds', 'Duration.', 1.5)
+        self.assertEqual(
+            metrics.render(),
+            '# HELP argo_poem_tools_packages Number of packages.\n'
+            '# TYPE argo_poem_tools_packages gauge\n'
+            'argo_poem_tools_packages{result="a"} 2\n'
+            'argo_poem_tools_packages{result="b\\""} 0\n'
+            '# HELP argo_poem_tools_run_duration_seconds Duration.\n'
+            '# TYPE argo_poem_tools_run_duration_seconds gauge\n'
+            'argo_poem_tools_run_duration_seconds 1.5\n'
+        )
+
+    def test_render_histogram(self):
+        metrics = Metrics()
+        metrics.histogram(
+            'phase_duration_seconds', 'Duration.', [0.5, 2., 20.],
+            labels={'phase': 'yum install'}, buckets=(1, 10)
+        )
+        self.assertEqual(
+            metrics.render(),
+            '# HELP argo_poem_tools_phase_duration_seconds Duration.\n'
+            '# TYPE argo_poem_tools_phase_duration_seconds histogram\n'
+            'argo_poem_tools_phase_duration_seconds_bucket'
+            '{phase="yum install",le="1.0"} 1\n'
+            'argo_poem_tools_phase_duration_seconds_bucket'
+            '{phase="yum install",le="10.0"} 2\n'
+            'argo_poem_tools_phase_duration_seconds_bucket'
+            '{phase="yum install",le="+Inf"} 3\n'
+            'argo_poem_tools_phase_duration_seconds_sum'
+            '{phase="yum install"} 22.5\n'
+            'argo_poem_tools_phase_duration_seconds_count'
+            '{phase="yum install"} 3\n'
+        )
+
+    @mock.patch('argo_poem_tools.metrics.time.time')
+    def test_collect(self, mock_time):
+        mock_time.return_value = 1700000000.
+        metrics = collect(
+            1, 43.5, mock_spans,
+            counts={'install': 2, 'not_found': 1},
+            cache_hits={'url1': True, 'url2': False}
+        )
+        lines = metrics.render().split('\n')
+        for line in [
+            'argo_poem_tools_last_run_timestamp_seconds 1700000000.0',
+            'argo_poem_tools_exit_status 1',
+            'argo_poem_tools_noop 0',
+            'argo_poem_tools_run_duration_seconds 43.5',
+            'argo_poem_tools_yum_calls 3',
+            'argo_poem_tools_packages{result="install"} 2',
+            'argo_poem_tools_packages{result="not_found"} 1',
+            'argo_poem_tools_poem_requests 2',
+            'argo_poem_tools_poem_cache_hit_ratio 0.5',
+            'argo_poem_tools_phase_duration_seconds_count{phase="poem"} 1',
+            'argo_poem_tools_phase_duration_seconds_sum'
+            '{phase="poem request"} 0.28',
+            'argo_poem_tools_phase_duration_seconds_count'
+            '{phase="yum install"} 2',
+            'argo_poem_tools_phase_duration_seconds_sum'
+            '{phase="yum install"} 33.0'
+        ]:
+            self.assertIn(line, lines)
+
+        # unfinished spans are skipped
+        self.assertFalse([line for line in lines if 'rpm -qa' in line])
+
+    def test_collect_without_results(self):
+        metrics = collect(2, 0.1, [], noop=True)
+        rendered = metrics.render()
+        self.assertIn('argo_poem_tools_noop 1\n', rendered)
+        self.assertIn('argo_poem_tools_yum_calls 0\n', rendered)
+        self.assertNotIn('argo_poem_tools_packages', rendered)
+        self.assertNotIn('argo_poem_tools_poem_requests', rendered)
+
+    def test_write(self):
+        metrics = Metrics()
+        metrics.gauge('exit_status', 'Exit status.', 0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'argo-poem-tools.prom')
+            metrics.write(filename)
+            self.assertEqual(os.listdir(tmpdir), ['argo-poem-tools.prom'])
+            with open(filename, 'r') as f:
+                self.assertEqual(f.read(), metrics.render())
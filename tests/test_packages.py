@@ -1,9 +1,14 @@
+import io
+import random
+import string
 import subprocess
+import time
 import unittest
 from unittest import mock
 
 from argo_poem_tools.packages import Packages, _compare_versions, _compare_vr, \
-    PackageException
+    PackageException, _evr_key, _version_key
+from argo_poem_tools.versionlock import VersionLockManager
 
 data = {
     "argo-devel": {
@@ -78,18 +83,28 @@ NetworkManager-dispatcher-routing-rules.noarch
 
 mock_rpm_qa = \
 """
-nagios-plugins-2.3.3-2.el7.x86_64
-nagios-plugins-file_age-2.3.3-2.el7.x86_64
-nagios-plugins-argo-0.1.13-20200901060701.5869b94.el7.noarch
-nagios-plugins-fedcloud-0.5.2-20200511071632.05e2501.el7.noarch
-nagios-plugins-igtf-1.4.0-20200713050846.f6ca58d.el7.noarch
-nagios-plugins-dummy-2.3.3-2.el7.x86_64
-nagios-common-4.4.5-7.el7.x86_64
-nagios-plugins-perl-2.3.3-2.el7.x86_64
-nagios-plugins-http-2.3.3-2.el7.x86_64
+nagios-plugins 0 2.3.3 2.el7 x86_64
+nagios-plugins-file_age 0 2.3.3 2.el7 x86_64
+nagios-plugins-argo 0 0.1.13 20200901060701.5869b94.el7 noarch
+nagios-plugins-fedcloud 0 0.5.2 20200511071632.05e2501.el7 noarch
+nagios-plugins-igtf 0 1.4.0 20200713050846.f6ca58d.el7 noarch
+nagios-plugins-dummy 0 2.3.3 2.el7 x86_64
+nagios-common 0 4.4.5 7.el7 x86_64
+nagios-plugins-perl 0 2.3.3 2.el7 x86_64
+nagios-plugins-http 0 2.3.3 2.el7 x86_64
+NetworkManager 1 1.18.4 3.el7 x86_64
 
 """.encode('utf-8')
 
+mock_installed_after_transaction = [
+    dict(name='nagios-plugins-http', version='2.3.3', release='2.el7'),
+    dict(name='nagios-plugins-fedcloud', version='0.5.0',
+         release='20191003144427.7acfd49.el7'),
+    dict(name='nagios-plugins-argo', version='0.1.12',
+         release='20200716071827.5b8b5d6.el7'),
+    dict(name='nagios-plugins-igtf', version='1.4.0', release='3.el7')
+]
+
 mock_yum_versionlock_list = \
 """
 Loaded plugins: fastestmirror, ovl, versionlock
@@ -109,6 +124,19 @@ def mock_func(*args, **kwargs):
     pass
 
 
+def mock_popen(output, returncode=0, stderr=b''):
+    proc = mock.MagicMock()
+    proc.stdout = io.BytesIO(output)
+    proc.stderr = io.BytesIO(stderr)
+    proc.wait.return_value = returncode
+    return proc
+
+
+def mock_transaction_failure(*args, **kwargs):
+    if len(args[0]) > 4 or args[0][-1] == 'nagios-plugins-fedcloud-0.5.0':
+        raise subprocess.CalledProcessError(1, args[0])
+
+
 def mock_func_exception(*args, **kwargs):
     if args and args[0] == ['yum', 'versionlock', 'add', 'nagios-plugins-igtf']:
         raise subprocess.CalledProcessError(None, None)
@@ -117,7 +145,185 @@ def mock_func_exception(*args, **kwargs):
         raise Exception('An error.')
 
 
+# test cases from rpm's own test suite (tests/rpmvercmp.at)
+rpmvercmp_cases = [
+    ('1.0', '1.0', 0), ('1.0', '2.0', -1), ('2.0', '1.0', 1),
+    ('2.0.1', '2.0.1', 0), ('2.0', '2.0.1', -1), ('2.0.1', '2.0', 1),
+    ('2.0.1a', '2.0.1a', 0), ('2.0.1a', '2.0.1', 1), ('2.0.1', '2.0.1a', -1),
+    ('5.5p1', '5.5p1', 0), ('5.5p1', '5.5p2', -1), ('5.5p2', '5.5p1', 1),
+    ('5.5p10', '5.5p10', 0), ('5.5p1', '5.5p10', -1), ('5.5p10', '5.5p1', 1),
+    ('10xyz', '10.1xyz', -1), ('10.1xyz', '10xyz', 1), ('xyz10', 'xyz10', 0),
+    ('xyz10', 'xyz10.1', -1), ('xyz10.1', 'xyz10', 1), ('xyz.4', 'xyz.4', 0),
+    ('xyz.4', '8', -1), ('8', 'xyz.4', 1), ('xyz.4', '2', -1),
+    ('2', 'xyz.4', 1), ('5.5p2', '5.6p1', -1), ('5.6p1', '5.5p2', 1),
+    ('5.6p1', '6.5p1', -1), ('6.5p1', '5.6p1', 1), ('6.0.rc1', '6.0', 1),
+    ('6.0', '6.0.rc1', -1), ('10b2', '10a1', 1), ('10a2', '10b2', -1),
+    ('1.0aa', '1.0aa', 0), ('1.0a', '1.0aa', -1), ('1.0aa', '1.0a', 1),
+    ('10.0001', '10.0001', 0), ('10.0001', '10.1', 0), ('10.1', '10.0001', 0),
+    ('10.0001', '10.0039', -1), ('10.0039', '10.0001', 1),
+    ('4.999.9', '5.0', -1), ('5.0', '4.999.9', 1),
+    ('20101121', '20101121', 0), ('20101121', '20101122', -1),
+    ('20101122', '20101121', 1), ('2_0', '2_0', 0), ('2.0', '2_0', 0),
+    ('2_0', '2.0', 0), ('a', 'a', 0), ('a+', 'a+', 0), ('a+', 'a_', 0),
+    ('a_', 'a+', 0), ('+a', '+a', 0), ('+a', '_a', 0), ('_a', '+a', 0),
+    ('+_', '+_', 0), ('_+', '+_', 0), ('_+', '_+', 0), ('+', '_', 0),
+    ('_', '+', 0), ('1.0~rc1', '1.0~rc1', 0), ('1.0~rc1', '1.0', -1),
+    ('1.0', '1.0~rc1', 1), ('1.0~rc1', '1.0~rc2', -1),
+    ('1.0~rc2', '1.0~rc1', 1), ('1.0~rc1~git123', '1.0~rc1~git123', 0),
+    ('1.0~rc1~git123', '1.0~rc1', -1), ('1.0~rc1', '1.0~rc1~git123', 1),
+    ('1.0^', '1.0^', 0), ('1.0^', '1.0', 1), ('1.0', '1.0^', -1),
+    ('1.0^git1', '1.0^git1', 0), ('1.0^git1', '1.0', 1),
+    ('1.0', '1.0^git1', -1), ('1.0^git1', '1.0^git2', -1),
+    ('1.0^git2', '1.0^git1', 1), ('1.0^git1', '1.01', -1),
+    ('1.01', '1.0^git1', 1), ('1.0^20160101', '1.0^20160101', 0),
+    ('1.0^20160101', '1.0.1', -1), ('1.0.1', '1.0^20160101', 1),
+    ('1.0^20160101^git1', '1.0^20160101^git1', 0),
+    ('1.0^20160102', '1.0^20160101^git1', 1),
+    ('1.0^20160101^git1', '1.0^20160102', -1),
+    ('1.0~rc1^git1', '1.0~rc1^git1', 0), ('1.0~rc1^git1', '1.0~rc1', 1),
+    ('1.0~rc1', '1.0~rc1^git1', -1), ('1.0^git1~pre', '1.0^git1~pre', 0),
+    ('1.0^git1', '1.0^git1~pre', 1), ('1.0^git1~pre', '1.0^git1', -1),
+    ('1b.fc17', '1b.fc17', 0), ('1b.fc17', '1.fc17', -1),
+    ('1.fc17', '1b.fc17', 1), ('1g.fc17', '1g.fc17', 0),
+    ('1g.fc17', '1.fc17', 1), ('1.fc17', '1g.fc17', -1)
+]
+
+
+def rpmvercmp(a, b):
+    """
+    Straightforward port of rpmvercmp() from rpm's lib/rpmvercmp.c, used as
+    reference implementation.
+    """
+    def isalnum(c):
+        return c in string.ascii_letters or c in string.digits
+
+    if a == b:
+        return 0
+
+    i = j = 0
+    while i < len(a) or j < len(b):
+        while i < len(a) and not isalnum(a[i]) and a[i] not in '~^':
+            i += 1
+
+        while j < len(b) and not isalnum(b[j]) and b[j] not in '~^':
+            j += 1
+
+        one = a[i] if i < len(a) else ''
+        two = b[j] if j < len(b) else ''
+        if one == '~' or two == '~':
+            if one != '~':
+                return 1
+
+            if two != '~':
+                return -1
+
+            i += 1
+            j += 1
+            continue
+
+        if one == '^' or two == '^':
+            if not one:
+                return -1
+
+            if not two:
+                return 1
+
+            if one != '^':
+                return 1
+
+            if two != '^':
+                return -1
+
+            i += 1
+            j += 1
+            continue
+
+        if not (one and two):
+            break
+
+        if one in string.digits:
+            chars, isnum = string.digits, True
+
+        else:
+            chars, isnum = string.ascii_letters, False
+
+        start1, start2 = i, j
+        while i < len(a) and a[i] in chars:
+            i += 1
+
+        while j < len(b) and b[j] in chars:
+            j += 1
+
+        seg1 = a[start1:i]
+        seg2 = b[start2:j]
+        if not seg2:
+            return 1 if isnum else -1
+
+        if isnum:
+            seg1 = seg1.lstrip('0')
+            seg2 = seg2.lstrip('0')
+            if len(seg1) != len(seg2):
+                return 1 if len(seg1) > len(seg2) else -1
+
+        if seg1 != seg2:
+            return 1 if seg1 > seg2 else -1
+
+    one = a[i] if i < len(a) else ''
+    two = b[j] if j < len(b) else ''
+    if not one and not two:
+        return 0
+
+    return -1 if not one else 1
+
+
+def random_version(rnd):
+    return ''.join(
+        rnd.choice(['0', '1', '2', '10', '007', 'a', 'b', 'rc', 'git', 'el7',
+                    '.', '.', '-', '_', '+', '~', '^'])
+        for _ in range(rnd.randint(0, 8))
+    )
+
+
 class RPMTests(unittest.TestCase):
+    def test_version_key_rpmvercmp_cases(self):
+        for v1, v2, result in rpmvercmp_cases:
+            self.assertEqual(
+                _compare_versions(v1, v2), result, msg='{} {}'.format(v1, v2)
+            )
+
+    def test_version_key_equivalent_to_rpmvercmp(self):
+        rnd = random.Random(42)
+        versions = [random_version(rnd) for _ in range(600)]
+        versions.extend(v for case in rpmvercmp_cases for v in case[:2])
+        for v1 in versions:
+            for v2 in rnd.sample(versions, 50):
+                key1 = _version_key(v1)
+                key2 = _version_key(v2)
+                self.assertEqual(
+                    (key1 > key2) - (key1 < key2), rpmvercmp(v1, v2),
+                    msg='{!r} {!r}'.format(v1, v2)
+                )
+
+    def test_compare_versions_numeric_and_alphabetic_segment(self):
+        self.assertEqual(_compare_versions('1.0a', '1.0.1'), -1)
+        self.assertEqual(_compare_versions('1.0.1', '1.0a'), 1)
+        self.assertEqual(_compare_versions('1.0.rc1', '1.0.1'), -1)
+
+    def test_evr_key(self):
+        self.assertEqual(_evr_key('1:1.0', '1.el7'), _evr_key('1:1.0', '1.el7'))
+        self.assertGreater(_evr_key('1:1.0', '1.el7'), _evr_key('2.0', '1.el7'))
+        self.assertEqual(_evr_key('0:2.0', '1.el7'), _evr_key('2.0', '1.el7'))
+        self.assertEqual(
+            _compare_vr(('1:1.18.4', '3.el7'), ('1.18.4', '3.el7')), 1
+        )
+        self.assertEqual(
+            max(
+                [('1.0', '2.el7'), ('1.0', '10.el7'), ('0.9', '11.el7')],
+                key=lambda vr: _evr_key(*vr)
+            ),
+            ('1.0', '10.el7')
+        )
+
     def test_compare_versions(self):
         self.assertEqual(_compare_versions('1.0.0', '1.0.0'), 0)
         self.assertEqual(_compare_versions('2.0.0', '1.0.0'), 1)
@@ -187,12 +393,12 @@ class PackageTests(unittest.TestCase):
             }
         )
 
-    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
     def test_get_available_packages(self, mock_yumdb):
         self.pkgs.versions_unlocked = True
-        mock_yumdb.return_value = mock_yum_list_available
+        mock_yumdb.return_value = mock_popen(mock_yum_list_available)
         self.assertEqual(
-            self.pkgs._get_available_packages(),
+            list(self.pkgs._get_available_packages()),
             [
                 dict(name='nagios', version='4.4.5', release='7.el7'),
                 dict(name='nagios-contrib', version='4.4.5', release='7.el7'),
@@ -211,15 +417,132 @@ class PackageTests(unittest.TestCase):
                      version='1:1.18.4', release='3.el7')
             ]
         )
+        mock_yumdb.assert_called_once_with(
+            [
+                'yum', 'list', 'available', '--showduplicates',
+                '--disableplugin=versionlock',
+                'nagios-plugins-argo', 'nagios-plugins-fedcloud',
+                'nagios-plugins-globus', 'nagios-plugins-http',
+                'nagios-plugins-igtf'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_available_packages_only_from_poem_repos(self, mock_yumdb):
+        pkgs = Packages(data, repo_ids=['argo-devel', 'epel'])
+        pkgs.versions_unlocked = True
+        mock_yumdb.return_value = mock_popen(mock_yum_list_available)
+        self.assertEqual(len(list(pkgs._get_available_packages())), 9)
+        mock_yumdb.assert_called_once_with(
+            [
+                'yum', 'list', 'available', '--showduplicates',
+                '--disableplugin=versionlock',
+                '--disablerepo=*', '--enablerepo=argo-devel,epel',
+                '--setopt=argo-devel.metadata_expire=0',
+                '--setopt=epel.metadata_expire=0',
+                'nagios-plugins-argo', 'nagios-plugins-fedcloud',
+                'nagios-plugins-globus', 'nagios-plugins-http',
+                'nagios-plugins-igtf'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_available_packages_from_private_reposdir(self, mock_yumdb):
+        pkgs = Packages(
+            data, repo_ids=['argo-devel'],
+            reposdir=['/var/lib/argo-poem-tools/repos.d', '/etc/yum.repos.d']
+        )
+        pkgs.versions_unlocked = True
+        mock_yumdb.return_value = mock_popen(mock_yum_list_available)
+        list(pkgs._get_available_packages())
+        mock_yumdb.assert_called_once_with(
+            [
+                'yum', 'list', 'available', '--showduplicates',
+                '--disableplugin=versionlock',
+                '--setopt=reposdir=/var/lib/argo-poem-tools/repos.d,'
+                '/etc/yum.repos.d',
+                '--disablerepo=*', '--enablerepo=argo-devel',
+                '--setopt=argo-devel.metadata_expire=0',
+                'nagios-plugins-argo', 'nagios-plugins-fedcloud',
+                'nagios-plugins-globus', 'nagios-plugins-http',
+                'nagios-plugins-igtf'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_available_packages_if_none_available(self, mock_yumdb):
+        self.pkgs.versions_unlocked = True
+        mock_yumdb.return_value = mock_popen(
+            b'Loaded plugins: fastestmirror, ovl\n', returncode=1,
+            stderr=b'Error: No matching Packages to list\n'
+        )
+        self.assertEqual(list(self.pkgs._get_available_packages()), [])
+
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_available_packages_if_repo_unreachable(self, mock_yumdb):
+        self.pkgs.versions_unlocked = True
+        mock_yumdb.return_value = mock_popen(
+            b'Loaded plugins: fastestmirror, ovl\n', returncode=1,
+            stderr=b'Error: Failed to download metadata for repo '
+                   b'\'argo-devel\': Cannot download repomd.xml\n'
+        )
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            with self.assertRaises(subprocess.CalledProcessError) as context:
+                list(self.pkgs._get_available_packages())
+
+        self.assertIn('Cannot download repomd.xml', context.exception.stderr)
+        self.assertIn('Cannot download repomd.xml', stderr.getvalue())
+
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_available_packages_with_wrapped_lines(self, mock_yumdb):
+        self.pkgs.versions_unlocked = True
+        mock_yumdb.return_value = mock_popen(
+            b'Available Packages\n'
+            b'nagios-plugins-a-very-long-package-name-for-yum-output.noarch\n'
+            b'                           0.1.5-1.el7    argo-devel\n'
+            b'nagios-plugins-globus.noarch    '
+            b'0.1.5-20200713050450.eb1e7d8.el7.with.a.very.long.release\n'
+            b'                                         argo-devel\n'
+            b'nagios-plugins-gocdb.noarch    1.0.0-1.el7    argo-devel\n'
+        )
+        self.assertEqual(
+            list(self.pkgs._get_available_packages()),
+            [
+                dict(
+                    name='nagios-plugins-a-very-long-package-name-for-yum-'
+                         'output',
+                    version='0.1.5', release='1.el7'
+                ),
+                dict(
+                    name='nagios-plugins-globus', version='0.1.5',
+                    release='20200713050450.eb1e7d8.el7.with.a.very.long.'
+                            'release'
+                ),
+                dict(name='nagios-plugins-gocdb', version='1.0.0',
+                     release='1.el7')
+            ]
+        )
+
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_available_packages_if_yum_fails(self, mock_yumdb):
+        self.pkgs.versions_unlocked = True
+        mock_yumdb.return_value = mock_popen(
+            mock_yum_list_available, returncode=1
+        )
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(self.pkgs._get_available_packages())
 
     @mock.patch('argo_poem_tools.packages.Packages._unlock_versions')
-    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
-    def test_get_available_packages_if_versions_locked(
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_available_packages_without_unlocking_versions(
             self, mock_yumdb, mock_unlock
     ):
-        mock_yumdb.return_value = mock_yum_list_available
+        mock_yumdb.return_value = mock_popen(mock_yum_list_available)
         self.assertEqual(
-            self.pkgs._get_available_packages(),
+            list(self.pkgs._get_available_packages()),
             [
                 dict(name='nagios', version='4.4.5', release='7.el7'),
                 dict(name='nagios-contrib', version='4.4.5', release='7.el7'),
@@ -238,7 +561,16 @@ class PackageTests(unittest.TestCase):
                      version='1:1.18.4', release='3.el7')
             ]
         )
-        self.assertEqual(mock_unlock.call_count, 1)
+        self.assertFalse(mock_unlock.called)
+
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    def test_get_locked_versions_prefetched(self, mock_versionlock):
+        versionlock = VersionLockManager()
+        versionlock.locked = {'nagios-plugins-argo', 'nagios-plugins-dummy'}
+        pkgs = Packages(data, versionlock=versionlock)
+        pkgs._get_locked_versions()
+        self.assertEqual(pkgs.locked_versions, ['nagios-plugins-argo'])
+        self.assertFalse(mock_versionlock.called)
 
     @mock.patch('argo_poem_tools.packages.subprocess.check_output')
     def test_get_locked_versions(self, mock_versionlock):
@@ -257,21 +589,51 @@ class PackageTests(unittest.TestCase):
         self.assertEqual(self.pkgs.initially_locked_versions, [])
         mock_call.side_effect = mock_func
         self.pkgs._unlock_versions()
+        mock_call.assert_called_once_with(
+            [
+                'yum', 'versionlock', 'delete', 'nagios-plugins-argo',
+                'nagios-plugins-fedcloud'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self.assertEqual(
+            self.pkgs.initially_locked_versions,
+            ['nagios-plugins-argo', 'nagios-plugins-fedcloud']
+        )
+        self.assertTrue(self.pkgs.versions_unlocked)
+
+    @mock.patch('argo_poem_tools.packages.subprocess.call')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    def test_unlock_and_lock_versions_read_versionlock_list_once(
+            self, mock_subprocess, mock_call
+    ):
+        mock_subprocess.side_effect = [mock_yum_versionlock_list, mock_rpm_qa]
+        mock_call.side_effect = mock_func
+        self.pkgs._unlock_versions()
+        warn = self.pkgs._lock_versions()
+        self.assertFalse(warn)
+        self.assertEqual(mock_subprocess.call_count, 2)
+        mock_subprocess.assert_has_calls([
+            mock.call(['yum', 'versionlock', 'list']),
+            mock.call(['rpm', '-qa', '--qf', mock.ANY])
+        ])
         self.assertEqual(mock_call.call_count, 2)
         mock_call.assert_has_calls([
             mock.call(
-                ['yum', 'versionlock', 'delete', 'nagios-plugins-argo'],
+                [
+                    'yum', 'versionlock', 'delete', 'nagios-plugins-fedcloud',
+                    'nagios-plugins-argo'
+                ],
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE
             ),
             mock.call(
-                ['yum', 'versionlock', 'delete', 'nagios-plugins-fedcloud'],
+                [
+                    'yum', 'versionlock', 'add', 'nagios-plugins-fedcloud',
+                    'nagios-plugins-igtf', 'nagios-plugins-argo'
+                ],
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE
             )
-        ], any_order=True)
-        self.assertEqual(
-            self.pkgs.initially_locked_versions,
-            ['nagios-plugins-argo', 'nagios-plugins-fedcloud']
-        )
+        ])
 
     @mock.patch('argo_poem_tools.packages.subprocess.call')
     def test_failsafe_lock_versions(self, mock_call):
@@ -282,22 +644,23 @@ class PackageTests(unittest.TestCase):
         ]
         self.pkgs.locked_versions = ['nagios-plugins-argo']
         self.pkgs._failsafe_lock_versions()
-        self.assertEqual(mock_call.call_count, 3)
-        mock_call.assert_has_calls(
+        mock_call.assert_called_once_with(
             [
-                mock.call(
-                    ['yum', 'versionlock', 'add', 'nagios-plugins-argo'],
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                ),
-                mock.call(
-                    ['yum', 'versionlock', 'add', 'nagios-plugins-fedcloud'],
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                ),
-                mock.call(
-                    ['yum', 'versionlock', 'add', 'nagios-plugins-globus'],
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                )
-            ], any_order=True
+                'yum', 'versionlock', 'add', 'nagios-plugins-argo',
+                'nagios-plugins-fedcloud', 'nagios-plugins-globus'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    @mock.patch('argo_poem_tools.packages.subprocess.call')
+    def test_failsafe_lock_versions_failure(self, mock_call):
+        mock_call.return_value = 1
+        self.pkgs.initially_locked_versions = [
+            'nagios-plugins-argo', 'nagios-plugins-fedcloud'
+        ]
+        self.assertEqual(
+            self.pkgs._failsafe_lock_versions(),
+            'Packages not locked: nagios-plugins-argo, nagios-plugins-fedcloud'
         )
 
     @mock.patch('argo_poem_tools.packages.subprocess.check_output')
@@ -337,24 +700,117 @@ class PackageTests(unittest.TestCase):
         self.assertEqual(
             self.pkgs._get_installed_packages(),
             [
-                dict(name='nagios-plugins', version='2.3.3', release='2.el7'),
-                dict(name='nagios-plugins-file_age', version='2.3.3',
-                     release='2.el7'),
-                dict(name='nagios-plugins-argo', version='0.1.13',
-                     release='20200901060701.5869b94.el7'),
-                dict(name='nagios-plugins-fedcloud', version='0.5.2',
-                     release='20200511071632.05e2501.el7'),
-                dict(name='nagios-plugins-igtf', version='1.4.0',
-                     release='20200713050846.f6ca58d.el7'),
-                dict(name='nagios-plugins-dummy', version='2.3.3',
-                     release='2.el7'),
-                dict(name='nagios-common', version='4.4.5', release='7.el7'),
-                dict(name='nagios-plugins-perl', version='2.3.3',
-                     release='2.el7'),
-                dict(name='nagios-plugins-http', version='2.3.3',
-                     release='2.el7')
+                dict(name='nagios-plugins', epoch=0, version='2.3.3',
+                     release='2.el7', arch='x86_64'),
+                dict(name='nagios-plugins-file_age', epoch=0, version='2.3.3',
+                     release='2.el7', arch='x86_64'),
+                dict(name='nagios-plugins-argo', epoch=0, version='0.1.13',
+                     release='20200901060701.5869b94.el7', arch='noarch'),
+                dict(name='nagios-plugins-fedcloud', epoch=0, version='0.5.2',
+                     release='20200511071632.05e2501.el7', arch='noarch'),
+                dict(name='nagios-plugins-igtf', epoch=0, version='1.4.0',
+                     release='20200713050846.f6ca58d.el7', arch='noarch'),
+                dict(name='nagios-plugins-dummy', epoch=0, version='2.3.3',
+                     release='2.el7', arch='x86_64'),
+                dict(name='nagios-common', epoch=0, version='4.4.5',
+                     release='7.el7', arch='x86_64'),
+                dict(name='nagios-plugins-perl', epoch=0, version='2.3.3',
+                     release='2.el7', arch='x86_64'),
+                dict(name='nagios-plugins-http', epoch=0, version='2.3.3',
+                     release='2.el7', arch='x86_64'),
+                dict(name='NetworkManager', epoch=1, version='1.18.4',
+                     release='3.el7', arch='x86_64')
             ]
         )
+        mock_rpm.assert_called_once_with([
+            'rpm', '-qa', '--qf',
+            '%{NAME} %{EPOCHNUM} %{VERSION} %{RELEASE} %{ARCH}\n'
+        ])
+
+    @mock.patch('argo_poem_tools.backends.rpmdb_cookie')
+    @mock.patch('argo_poem_tools.packages.rpmdb_cookie')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    def test_get_installed_packages_if_rpmdb_unchanged(
+            self, mock_rpm, mock_cookie, mock_snapshot_cookie
+    ):
+        mock_rpm.return_value = mock_rpm_qa
+        mock_cookie.return_value = (('/var/lib/rpm/rpmdb.sqlite', 1, 2),)
+        mock_snapshot_cookie.side_effect = lambda: mock_cookie.return_value
+        pkgs = self.pkgs._get_installed_packages()
+        self.assertIs(self.pkgs._get_installed_packages(), pkgs)
+        self.assertEqual(
+            self.pkgs._get_installed_index()['NetworkManager']['epoch'], 1
+        )
+        self.assertEqual(mock_rpm.call_count, 1)
+        mock_cookie.return_value = (('/var/lib/rpm/rpmdb.sqlite', 3, 2),)
+        self.pkgs._get_installed_packages()
+        self.assertEqual(mock_rpm.call_count, 2)
+
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    @mock.patch('argo_poem_tools.backends.rpmdb_cookie')
+    @mock.patch('argo_poem_tools.packages.rpmdb_cookie')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    def test_get_installed_packages_after_transaction(
+            self, mock_rpm, mock_cookie, mock_snapshot_cookie, mock_check_call
+    ):
+        mock_rpm.return_value = mock_rpm_qa
+        mock_cookie.return_value = (('/var/lib/rpm/rpmdb.sqlite', 1, 2),)
+        mock_snapshot_cookie.return_value = mock_cookie.return_value
+        mock_check_call.side_effect = mock_func
+        self.pkgs._get_installed_packages()
+        failed = self.pkgs._transaction(
+            'install', [('nagios-plugins-igtf', '1.4.0')]
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(mock_rpm.call_count, 2)
+
+    @mock.patch('argo_poem_tools.packages.rpmdb_cookie')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    def test_get_installed_packages_prefetched(self, mock_rpm, mock_cookie):
+        mock_cookie.return_value = (('/var/lib/rpm/rpmdb.sqlite', 1, 2),)
+        installed = [
+            dict(name='nagios-plugins-igtf', epoch=0, version='1.4.0',
+                 release='3.el7', arch='noarch')
+        ]
+        pkgs = Packages(data, installed=(mock_cookie.return_value, installed))
+        self.assertIs(pkgs._get_installed_packages(), installed)
+        self.assertFalse(mock_rpm.called)
+        mock_cookie.return_value = (('/var/lib/rpm/rpmdb.sqlite', 3, 2),)
+        mock_rpm.return_value = mock_rpm_qa
+        self.assertEqual(len(pkgs._get_installed_packages()), 10)
+
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    def test_get_installed_packages_if_rpmdb_not_found(self, mock_rpm):
+        mock_rpm.return_value = mock_rpm_qa
+        with mock.patch(
+                'argo_poem_tools.backends.RPMDB_FILES', ['/nonexisting']
+        ):
+            self.pkgs._get_installed_packages()
+            self.pkgs._get_installed_packages()
+
+        self.assertEqual(mock_rpm.call_count, 2)
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_available_packages')
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    def test_get_packages_if_installed_with_epoch(self, mock_rpmdb, mock_yumdb):
+        pkgs = Packages({
+            'base': {
+                'content': '[base]\n',
+                'packages': [{'name': 'NetworkManager', 'version': 'present'}]
+            }
+        })
+        mock_rpmdb.return_value = [
+            dict(name='NetworkManager', epoch=1, version='1.18.4',
+                 release='3.el7', arch='x86_64')
+        ]
+        mock_yumdb.return_value = [
+            dict(name='NetworkManager', version='1:1.18.4', release='3.el7'),
+            dict(name='NetworkManager', version='1:1.18.8', release='1.el7')
+        ]
+        install, upgrade, downgrade, diff_ver, not_found = pkgs._get()
+        self.assertEqual(install, [])
+        self.assertEqual(upgrade, [(('NetworkManager',),)])
+        self.assertEqual(downgrade, [])
 
     @mock.patch('argo_poem_tools.packages.Packages._get_available_packages')
     @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
@@ -554,10 +1010,19 @@ class PackageTests(unittest.TestCase):
         self.assertEqual(diff_ver, ['nagios-plugins-globus-0.1.5'])
         self.assertEqual(not_found, [])
 
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
     @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
+    @mock.patch('argo_poem_tools.packages.Packages._unlock_versions')
     @mock.patch('argo_poem_tools.packages.subprocess.check_call')
     @mock.patch('argo_poem_tools.packages.Packages._get')
-    def test_install_packages(self, mock_get, mock_check_call, mock_lock):
+    def test_install_packages(
+            self, mock_get, mock_check_call, mock_unlock, mock_lock,
+            mock_rpmdb
+    ):
+        calls = mock.Mock()
+        calls.attach_mock(mock_get, 'get')
+        calls.attach_mock(mock_unlock, 'unlock')
+        calls.attach_mock(mock_check_call, 'check_call')
         mock_get.return_value = (
             [('nagios-plugins-http',)],
             [
@@ -578,16 +1043,21 @@ class PackageTests(unittest.TestCase):
         )
         mock_check_call.side_effect = mock_func
         mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
         info, warn = self.pkgs.install()
-        self.assertEqual(mock_check_call.call_count, 4)
+        self.assertEqual(mock_check_call.call_count, 2)
         mock_check_call.assert_has_calls([
-            mock.call(
-                ['yum', '-y', 'install', 'nagios-plugins-fedcloud-0.5.0']
-            ),
-            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0']),
-            mock.call(['yum', '-y', 'install', 'nagios-plugins-http']),
-            mock.call(['yum', '-y', 'install', 'nagios-plugins-argo-0.1.12']),
-        ], any_order=True)
+            mock.call([
+                'yum', '-y', 'install', 'nagios-plugins-http',
+                'nagios-plugins-fedcloud-0.5.0', 'nagios-plugins-argo-0.1.12'
+            ]),
+            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0'])
+        ])
+        # versions are unlocked after the resolution, only for transactions
+        self.assertEqual(
+            [call[0] for call in calls.mock_calls],
+            ['get', 'unlock', 'check_call', 'check_call']
+        )
         self.assertEqual(mock_lock.call_count, 1)
         self.assertEqual(
             info,
@@ -602,12 +1072,61 @@ class PackageTests(unittest.TestCase):
         )
         self.assertEqual(warn, [])
 
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
+    @mock.patch('argo_poem_tools.packages.Packages._unlock_versions')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    @mock.patch('argo_poem_tools.packages.Packages._get')
+    def test_install_resolved_packages(
+            self, mock_get, mock_check_call, mock_unlock, mock_lock,
+            mock_rpmdb
+    ):
+        resolved = (
+            [('nagios-plugins-http',)],
+            [(('nagios-plugins-argo', '0.1.12'),)],
+            [
+                (
+                    ('nagios-plugins-igtf', '1.5.0'),
+                    ('nagios-plugins-igtf', '1.4.0')
+                )
+            ],
+            [],
+            []
+        )
+        mock_check_call.side_effect = mock_func
+        mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        info, warn = self.pkgs.install(resolved=resolved)
+        self.assertFalse(mock_get.called)
+        mock_unlock.assert_called_once_with()
+        mock_check_call.assert_has_calls([
+            mock.call([
+                'yum', '-y', 'install', 'nagios-plugins-http',
+                'nagios-plugins-argo-0.1.12'
+            ]),
+            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0'])
+        ])
+        self.assertEqual(mock_lock.call_count, 1)
+        self.assertEqual(self.pkgs.resolved, resolved)
+        self.assertEqual(
+            info,
+            [
+                'Packages installed: nagios-plugins-http',
+                'Packages upgraded: nagios-plugins-argo-0.1.12',
+                'Packages downgraded: '
+                'nagios-plugins-igtf-1.5.0 -> nagios-plugins-igtf-1.4.0'
+            ]
+        )
+        self.assertEqual(warn, [])
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
     @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
     @mock.patch('argo_poem_tools.packages.subprocess.check_call')
     @mock.patch('argo_poem_tools.packages.Packages._get')
     def test_install_packages_if_installed_and_wrong_version_available(
-            self, mock_get, mock_check_call, mock_lock
+            self, mock_get, mock_check_call, mock_lock, mock_rpmdb
     ):
+        self.pkgs.versions_unlocked = True
         mock_get.return_value = (
             [('nagios-plugins-argo', '0.1.12')],
             [
@@ -628,17 +1147,17 @@ class PackageTests(unittest.TestCase):
         )
         mock_check_call.side_effect = mock_func
         mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
         info, warn = self.pkgs.install()
-        self.assertEqual(mock_check_call.call_count, 4)
+        self.assertEqual(mock_check_call.call_count, 2)
         self.assertEqual(mock_lock.call_count, 1)
         mock_check_call.assert_has_calls([
-            mock.call(
-                ['yum', '-y', 'install', 'nagios-plugins-fedcloud-0.5.0']
-            ),
-            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0']),
-            mock.call(['yum', '-y', 'install', 'nagios-plugins-http']),
-            mock.call(['yum', '-y', 'install', 'nagios-plugins-argo-0.1.12'])
-        ], any_order=True)
+            mock.call([
+                'yum', '-y', 'install', 'nagios-plugins-argo-0.1.12',
+                'nagios-plugins-fedcloud-0.5.0', 'nagios-plugins-http'
+            ]),
+            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0'])
+        ])
         self.assertEqual(
             info,
             [
@@ -658,12 +1177,14 @@ class PackageTests(unittest.TestCase):
             ]
         )
 
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
     @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
     @mock.patch('argo_poem_tools.packages.subprocess.check_call')
     @mock.patch('argo_poem_tools.packages.Packages._get')
     def test_install_if_packages_not_found(
-            self, mock_get, mock_check_call, mock_lock
+            self, mock_get, mock_check_call, mock_lock, mock_rpmdb
     ):
+        self.pkgs.versions_unlocked = True
         mock_get.return_value = (
             [('nagios-plugins-igtf', '1.4.0')],
             [],
@@ -674,12 +1195,13 @@ class PackageTests(unittest.TestCase):
         )
         mock_check_call.side_effect = mock_func
         mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
         info, warn = self.pkgs.install()
         self.assertEqual(mock_check_call.call_count, 1)
         self.assertEqual(mock_lock.call_count, 1)
-        mock_check_call.assert_has_calls([
-            mock.call(['yum', '-y', 'install', 'nagios-plugins-igtf-1.4.0']),
-        ], any_order=True)
+        mock_check_call.assert_called_once_with(
+            ['yum', '-y', 'install', 'nagios-plugins-igtf-1.4.0']
+        )
         self.assertEqual(
             info, ['Packages installed: nagios-plugins-igtf-1.4.0']
         )
@@ -694,12 +1216,14 @@ class PackageTests(unittest.TestCase):
             ]
         )
 
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
     @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
     @mock.patch('argo_poem_tools.packages.subprocess.check_call')
     @mock.patch('argo_poem_tools.packages.Packages._get')
     def test_install_if_packages_marked_for_upgrade_and_same_version_avail(
-            self, mock_get, mock_check_call, mock_lock
+            self, mock_get, mock_check_call, mock_lock, mock_rpmdb
     ):
+        self.pkgs.versions_unlocked = True
         mock_get.return_value = (
             [('nagios-plugins-http', )],
             [(('nagios-plugins-argo', '0.1.12'),)],
@@ -714,13 +1238,16 @@ class PackageTests(unittest.TestCase):
         )
         mock_check_call.side_effect = mock_func
         mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
         info, warn = self.pkgs.install()
-        self.assertEqual(mock_check_call.call_count, 3)
+        self.assertEqual(mock_check_call.call_count, 2)
         mock_check_call.assert_has_calls([
-            mock.call(['yum', '-y', 'install', 'nagios-plugins-http']),
-            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0']),
-            mock.call(['yum', '-y', 'install', 'nagios-plugins-argo-0.1.12'])
-        ], any_order=True)
+            mock.call([
+                'yum', '-y', 'install', 'nagios-plugins-http',
+                'nagios-plugins-argo-0.1.12'
+            ]),
+            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0'])
+        ])
         self.assertEqual(mock_lock.call_count, 1)
         self.assertEqual(
             info,
@@ -739,6 +1266,267 @@ class PackageTests(unittest.TestCase):
             ]
         )
 
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    @mock.patch('argo_poem_tools.packages.Packages._get')
+    def test_install_packages_one_by_one_if_transaction_fails(
+            self, mock_get, mock_check_call, mock_lock, mock_rpmdb
+    ):
+        self.pkgs.versions_unlocked = True
+        mock_get.return_value = (
+            [('nagios-plugins-http',)],
+            [
+                (
+                    ('nagios-plugins-fedcloud', '0.4.0'),
+                    ('nagios-plugins-fedcloud', '0.5.0'),
+                ),
+                (('nagios-plugins-argo', '0.1.12'),)
+            ],
+            [
+                (
+                    ('nagios-plugins-igtf', '1.5.0'),
+                    ('nagios-plugins-igtf', '1.4.0')
+                )
+            ],
+            [],
+            []
+        )
+        mock_check_call.side_effect = mock_transaction_failure
+        mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        info, warn = self.pkgs.install()
+        self.assertEqual(mock_check_call.call_count, 5)
+        mock_check_call.assert_has_calls([
+            mock.call([
+                'yum', '-y', 'install', 'nagios-plugins-http',
+                'nagios-plugins-fedcloud-0.5.0', 'nagios-plugins-argo-0.1.12'
+            ]),
+            mock.call(['yum', '-y', 'install', 'nagios-plugins-http']),
+            mock.call(
+                ['yum', '-y', 'install', 'nagios-plugins-fedcloud-0.5.0']
+            ),
+            mock.call(['yum', '-y', 'install', 'nagios-plugins-argo-0.1.12']),
+            mock.call(['yum', '-y', 'downgrade', 'nagios-plugins-igtf-1.4.0'])
+        ])
+        self.assertEqual(mock_rpmdb.call_count, 1)
+        self.assertEqual(mock_lock.call_count, 1)
+        self.assertEqual(
+            info,
+            [
+                'Packages installed: nagios-plugins-http',
+                'Packages upgraded: nagios-plugins-argo-0.1.12',
+                'Packages downgraded: '
+                'nagios-plugins-igtf-1.5.0 -> nagios-plugins-igtf-1.4.0'
+            ]
+        )
+        self.assertEqual(
+            warn, ['Packages not upgraded: nagios-plugins-fedcloud-0.4.0']
+        )
+        self.assertEqual(
+            self.pkgs.counts,
+            {
+                'install': 1, 'upgrade': 1, 'downgrade': 1,
+                'different_version': 0, 'not_found': 0, 'failed': 1
+            }
+        )
+
+    @mock.patch('argo_poem_tools.packages.parallel_download_options')
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
+    @mock.patch('argo_poem_tools.packages.Packages._unlock_versions')
+    @mock.patch('argo_poem_tools.packages.subprocess.call')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    @mock.patch('argo_poem_tools.packages.Packages._get')
+    def test_install_prefetched_packages(
+            self, mock_get, mock_check_call, mock_call, mock_unlock,
+            mock_lock, mock_rpmdb, mock_parallel
+    ):
+        self.pkgs.prefetch = True
+        mock_get.return_value = (
+            [('nagios-plugins-http',)],
+            [(('nagios-plugins-argo', '0.1.12'),)],
+            [
+                (
+                    ('nagios-plugins-igtf', '1.5.0'),
+                    ('nagios-plugins-igtf', '1.4.0')
+                )
+            ],
+            [],
+            []
+        )
+        mock_call.return_value = 0
+        mock_check_call.side_effect = mock_func
+        mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        mock_parallel.return_value = ['--setopt=max_parallel_downloads=10']
+        info, warn = self.pkgs.install()
+        mock_unlock.assert_called_once_with()
+        self.assertEqual(mock_call.call_count, 2)
+        mock_call.assert_has_calls([
+            mock.call(
+                [
+                    'yum', '-y', '--downloadonly',
+                    '--disableplugin=versionlock',
+                    '--setopt=max_parallel_downloads=10', 'install',
+                    'nagios-plugins-http', 'nagios-plugins-argo-0.1.12'
+                ],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ),
+            mock.call(
+                [
+                    'yum', '-y', '--downloadonly',
+                    '--disableplugin=versionlock',
+                    '--setopt=max_parallel_downloads=10', 'downgrade',
+                    'nagios-plugins-igtf-1.4.0'
+                ],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        ])
+        # transactions are run from the cache
+        self.assertEqual(mock_check_call.call_count, 2)
+        mock_check_call.assert_has_calls([
+            mock.call([
+                'yum', '-y', '-C', 'install', 'nagios-plugins-http',
+                'nagios-plugins-argo-0.1.12'
+            ]),
+            mock.call([
+                'yum', '-y', '-C', 'downgrade', 'nagios-plugins-igtf-1.4.0'
+            ])
+        ])
+        self.assertEqual(
+            info,
+            [
+                'Packages installed: nagios-plugins-http',
+                'Packages upgraded: nagios-plugins-argo-0.1.12',
+                'Packages downgraded: '
+                'nagios-plugins-igtf-1.5.0 -> nagios-plugins-igtf-1.4.0'
+            ]
+        )
+        self.assertEqual(warn, [])
+
+    @mock.patch('argo_poem_tools.packages.parallel_download_options')
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
+    @mock.patch('argo_poem_tools.packages.subprocess.call')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    @mock.patch('argo_poem_tools.packages.Packages._get')
+    def test_install_if_prefetch_fails(
+            self, mock_get, mock_check_call, mock_call, mock_lock,
+            mock_rpmdb, mock_parallel
+    ):
+        self.pkgs.prefetch = True
+        self.pkgs.versions_unlocked = True
+        mock_get.return_value = (
+            [('nagios-plugins-http',)], [], [], [], []
+        )
+        mock_call.return_value = 1
+        mock_check_call.side_effect = mock_func
+        mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        mock_parallel.return_value = []
+        info, warn = self.pkgs.install()
+        mock_call.assert_called_once_with(
+            [
+                'yum', '-y', '--downloadonly', '--disableplugin=versionlock',
+                'install', 'nagios-plugins-http'
+            ],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        # packages are downloaded by the transaction itself
+        mock_check_call.assert_called_once_with(
+            ['yum', '-y', 'install', 'nagios-plugins-http']
+        )
+        self.assertEqual(info, ['Packages installed: nagios-plugins-http'])
+        self.assertEqual(warn, [])
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    def test_transaction_from_cache_fails(self, mock_check_call, mock_rpmdb):
+        mock_check_call.side_effect = mock_transaction_failure
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        failed = self.pkgs._transaction(
+            'install',
+            [('nagios-plugins-http',), ('nagios-plugins-argo', '0.1.12')],
+            cacheonly=True
+        )
+        self.assertEqual(failed, [])
+        # packages are installed one by one without the cache only mode
+        self.assertEqual(mock_check_call.call_count, 3)
+        mock_check_call.assert_has_calls([
+            mock.call([
+                'yum', '-y', '-C', 'install', 'nagios-plugins-http',
+                'nagios-plugins-argo-0.1.12'
+            ]),
+            mock.call(['yum', '-y', 'install', 'nagios-plugins-http']),
+            mock.call(['yum', '-y', 'install', 'nagios-plugins-argo-0.1.12'])
+        ])
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    def test_transaction_of_single_package_from_cache_fails(
+            self, mock_check_call, mock_rpmdb
+    ):
+        mock_check_call.side_effect = mock_transaction_failure
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        failed = self.pkgs._transaction(
+            'install', [('nagios-plugins-http',)], cacheonly=True
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(mock_check_call.call_count, 2)
+        mock_check_call.assert_has_calls([
+            mock.call(['yum', '-y', '-C', 'install', 'nagios-plugins-http']),
+            mock.call(['yum', '-y', 'install', 'nagios-plugins-http'])
+        ])
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    def test_transaction_with_private_reposdir(
+            self, mock_check_call, mock_rpmdb
+    ):
+        pkgs = Packages(
+            data,
+            reposdir=['/var/lib/argo-poem-tools/repos.d', '/etc/yum.repos.d']
+        )
+        mock_check_call.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        failed = pkgs._transaction('install', [('nagios-plugins-http',)])
+        self.assertEqual(failed, [])
+        mock_check_call.assert_called_once_with([
+            'yum', '-y',
+            '--setopt=reposdir=/var/lib/argo-poem-tools/repos.d,'
+            '/etc/yum.repos.d',
+            'install', 'nagios-plugins-http'
+        ])
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    @mock.patch('argo_poem_tools.packages.Packages._get')
+    def test_install_packages_if_transaction_skips_package(
+            self, mock_get, mock_check_call, mock_lock, mock_rpmdb
+    ):
+        self.pkgs.versions_unlocked = True
+        mock_get.return_value = (
+            [('nagios-plugins-http',), ('nagios-plugins-globus', '0.1.5')],
+            [],
+            [],
+            [],
+            []
+        )
+        mock_check_call.side_effect = mock_func
+        mock_lock.side_effect = mock_func
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        info, warn = self.pkgs.install()
+        mock_check_call.assert_called_once_with([
+            'yum', '-y', 'install', 'nagios-plugins-http',
+            'nagios-plugins-globus-0.1.5'
+        ])
+        self.assertEqual(info, ['Packages installed: nagios-plugins-http'])
+        self.assertEqual(
+            warn, ['Packages not installed: nagios-plugins-globus-0.1.5']
+        )
+
     @mock.patch('argo_poem_tools.packages.Packages._failsafe_lock_versions')
     @mock.patch('argo_poem_tools.packages.subprocess.check_call')
     @mock.patch('argo_poem_tools.packages.Packages._get')
@@ -756,6 +1544,78 @@ class PackageTests(unittest.TestCase):
         self.assertFalse(mock_check_call.called)
         self.assertEqual(mock_lock.call_count, 1)
 
+    @mock.patch('argo_poem_tools.packages.rpmdb_cookie')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_call')
+    @mock.patch('argo_poem_tools.packages.subprocess.call')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_no_op_does_not_change_versionlocks(
+            self, mock_yumdb, mock_check_output, mock_call, mock_check_call,
+            mock_cookie
+    ):
+        mock_yumdb.return_value = mock_popen(mock_yum_list_available)
+        mock_check_output.return_value = mock_rpm_qa
+        mock_cookie.return_value = None
+        info, warn = self.pkgs.no_op()
+        self.assertTrue(info)
+        self.assertEqual(mock_check_output.call_count, 1)
+        self.assertEqual(mock_check_output.call_args[0][0][:2], ['rpm', '-qa'])
+        self.assertIn(
+            '--disableplugin=versionlock', mock_yumdb.call_args[0][0]
+        )
+        self.assertFalse(mock_call.called)
+        self.assertFalse(mock_check_call.called)
+
+    @mock.patch('argo_poem_tools.packages.rpmdb_cookie')
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    @mock.patch('argo_poem_tools.packages.subprocess.check_output')
+    def test_check(self, mock_check_output, mock_yumdb, mock_cookie):
+        mock_check_output.return_value = mock_rpm_qa
+        mock_cookie.return_value = None
+        install, upgrade, downgrade = self.pkgs.check()
+        self.assertEqual(install, [('nagios-plugins-globus', '0.1.5')])
+        self.assertEqual(upgrade, [])
+        self.assertEqual(
+            downgrade,
+            [
+                (
+                    ('nagios-plugins-fedcloud', '0.5.2'),
+                    ('nagios-plugins-fedcloud', '0.5.0')
+                ),
+                (
+                    ('nagios-plugins-argo', '0.1.13'),
+                    ('nagios-plugins-argo', '0.1.12')
+                )
+            ]
+        )
+        # only rpm is called
+        self.assertEqual(mock_check_output.call_count, 1)
+        self.assertFalse(mock_yumdb.called)
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    def test_check_if_upgrade_needed(self, mock_rpmdb):
+        mock_rpmdb.return_value = mock_installed_after_transaction
+        pkgs = Packages({
+            'argo-devel': {
+                'content': '[argo-devel]\n',
+                'packages': [
+                    {'name': 'nagios-plugins-igtf', 'version': '1.5.0'},
+                    {'name': 'nagios-plugins-http', 'version': 'present'}
+                ]
+            }
+        })
+        self.assertEqual(
+            pkgs.check(),
+            (
+                [],
+                [(
+                    ('nagios-plugins-igtf', '1.4.0'),
+                    ('nagios-plugins-igtf', '1.5.0')
+                )],
+                []
+            )
+        )
+
     @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
     @mock.patch('argo_poem_tools.packages.Packages._get')
     def test_no_op_run(self, mock_get, mock_lock):
@@ -783,7 +1643,7 @@ class PackageTests(unittest.TestCase):
         )
         mock_lock.side_effect = mock_func
         info, warn = self.pkgs.no_op()
-        self.assertEqual(mock_lock.call_count, 1)
+        self.assertFalse(mock_lock.called)
         self.assertEqual(
             info,
             [
@@ -796,6 +1656,13 @@ class PackageTests(unittest.TestCase):
             ]
         )
         self.assertEqual(warn, [])
+        self.assertEqual(
+            self.pkgs.counts,
+            {
+                'install': 1, 'upgrade': 2, 'downgrade': 1,
+                'different_version': 0, 'not_found': 0, 'failed': 0
+            }
+        )
 
     @mock.patch('argo_poem_tools.packages.Packages._lock_versions')
     @mock.patch('argo_poem_tools.packages.Packages._get')
@@ -823,7 +1690,7 @@ class PackageTests(unittest.TestCase):
             []
         )
         info, warn = self.pkgs.no_op()
-        self.assertEqual(mock_lock.call_count, 1)
+        self.assertFalse(mock_lock.called)
         self.assertEqual(
             info,
             [
@@ -856,7 +1723,7 @@ class PackageTests(unittest.TestCase):
         )
         mock_lock.side_effect = mock_func
         info, warn = self.pkgs.no_op()
-        self.assertEqual(mock_lock.call_count, 1)
+        self.assertFalse(mock_lock.called)
         self.assertEqual(
             info,
             [
@@ -893,7 +1760,7 @@ class PackageTests(unittest.TestCase):
         )
         mock_lock.side_effect = mock_func
         info, warn = self.pkgs.no_op()
-        self.assertEqual(mock_lock.call_count, 1)
+        self.assertFalse(mock_lock.called)
         self.assertEqual(
             info,
             [
@@ -950,15 +1817,15 @@ class PackageTests(unittest.TestCase):
     ):
         mock_rpm_qa1 = \
             """
-            nagios-plugins-2.3.3-2.el7.x86_64
-            nagios-plugins-file_age-2.3.3-2.el7.x86_64
-            nagios-plugins-argo-0.1.13-20200901060701.5869b94.el7.noarch
-            nagios-plugins-fedcloud-0.5.2-20200511071632.05e2501.el7.noarch
-            nagios-plugins-dummy-2.3.3-2.el7.x86_64
-            nagios-common-4.4.5-7.el7.x86_64
-            nagios-plugins-perl-2.3.3-2.el7.x86_64
-            nagios-plugins-http-2.3.3-2.el7.x86_64
-    
+            nagios-plugins 0 2.3.3 2.el7 x86_64
+            nagios-plugins-file_age 0 2.3.3 2.el7 x86_64
+            nagios-plugins-argo 0 0.1.13 20200901060701.5869b94.el7 noarch
+            nagios-plugins-fedcloud 0 0.5.2 20200511071632.05e2501.el7 noarch
+            nagios-plugins-dummy 0 2.3.3 2.el7 x86_64
+            nagios-common 0 4.4.5 7.el7 x86_64
+            nagios-plugins-perl 0 2.3.3 2.el7 x86_64
+            nagios-plugins-http 0 2.3.3 2.el7 x86_64
+
             """.encode('utf-8')
         mock_subprocess.side_effect = [mock_yum_versionlock_list, mock_rpm_qa1]
         mock_call.side_effect = mock_func
@@ -968,9 +1835,9 @@ class PackageTests(unittest.TestCase):
 
     @mock.patch('argo_poem_tools.packages.subprocess.call')
     @mock.patch('argo_poem_tools.packages.subprocess.check_output')
-    def test_lock_unlocked_versions_exception(self, mock_subprocess, mock_call):
+    def test_lock_unlocked_versions_failure(self, mock_subprocess, mock_call):
         mock_subprocess.side_effect = [mock_yum_versionlock_list, mock_rpm_qa]
-        mock_call.side_effect = mock_func_exception
+        mock_call.return_value = 1
         warn = self.pkgs._lock_versions()
         self.assertEqual(mock_call.call_count, 1)
         mock_call.assert_has_calls([
@@ -980,3 +1847,69 @@ class PackageTests(unittest.TestCase):
             )
         ], any_order=True)
         self.assertEqual(warn, 'Packages not locked: nagios-plugins-igtf')
+
+
+def mock_large_data(n):
+    return {
+        "argo-devel": {
+            "content": data["argo-devel"]["content"],
+            "packages": [
+                {
+                    "name": "argo-probe-{}".format(i),
+                    "version": "1.{}.0".format(i % 10) if i % 2 else "present"
+                } for i in range(n)
+            ]
+        }
+    }
+
+
+def mock_large_yum_list_available(n_names, n_versions):
+    lines = ['Loaded plugins: fastestmirror, ovl', 'Available Packages']
+    for i in range(n_names):
+        for j in range(n_versions):
+            lines.append(
+                'argo-probe-{}.noarch    1.{}.0-{}.el7    argo-devel'.format(
+                    i, j, 20200101000000 + i
+                )
+            )
+
+    return '\n'.join(lines).encode('utf-8')
+
+
+class PackageResolutionScaleTests(unittest.TestCase):
+    def setUp(self):
+        self.pkgs = Packages(mock_large_data(2000))
+        self.pkgs.versions_unlocked = True
+
+    @mock.patch('argo_poem_tools.packages.Packages._get_installed_packages')
+    @mock.patch('argo_poem_tools.packages.subprocess.Popen')
+    def test_get_with_large_list_of_available_packages(
+            self, mock_yumdb, mock_rpmdb
+    ):
+        mock_yumdb.return_value = mock_popen(
+            mock_large_yum_list_available(5000, 10)
+        )
+        mock_rpmdb.return_value = [
+            dict(
+                name='argo-probe-{}'.format(i), version='1.5.0',
+                release='{}.el7'.format(20200101000000 + i)
+            ) for i in range(0, 4000, 2)
+        ]
+        start = time.monotonic()
+        install, upgrade, downgrade, diff_ver, not_found = self.pkgs._get()
+        duration = time.monotonic() - start
+        self.assertLess(duration, 3)
+        self.assertEqual(len(self.pkgs.available_packages), 50000)
+        self.assertEqual(len(install), 1000)
+        self.assertEqual(
+            set(install),
+            set(('argo-probe-{}'.format(i), '1.{}.0'.format(i % 10))
+                for i in range(1, 2000, 2))
+        )
+        self.assertEqual(
+            upgrade,
+            [(('argo-probe-{}'.format(i),),) for i in range(0, 2000, 2)]
+        )
+        self.assertEqual(downgrade, [])
+        self.assertEqual(diff_ver, [])
+        self.assertEqual(not_found, [])
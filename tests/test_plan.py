@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+
+from argo_poem_tools.plan import Plan, PlanException
+
+mock_data = {
+    'argo-devel': {
+        'content': '[argo-devel]\nname=ARGO Product Repository\n',
+        'packages': [
+            {'name': 'nagios-plugins-argo', 'version': '0.1.12'},
+            {'name': 'nagios-plugins-http', 'version': 'present'}
+        ]
+    }
+}
+
+mock_resolved = (
+    [('nagios-plugins-http',)],
+    [
+        (
+            ('nagios-plugins-fedcloud', '0.4.0'),
+            ('nagios-plugins-fedcloud', '0.5.0')
+        ),
+        (('nagios-plugins-argo', '0.1.12'),)
+    ],
+    [(('nagios-plugins-igtf', '1.5.0'), ('nagios-plugins-igtf', '1.4.0'))],
+    ['nagios-plugins-globus-0.1.5'],
+    ['nagios-plugins-bdii-1.0.14']
+)
+
+
+class PlanTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'plan.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_and_load(self):
+        plan = Plan(
+            'fingerprint-1234', mock_data, ['nagios-plugins-egi (0.2.3)'],
+            True, mock_resolved
+        )
+        plan.save(self.filename)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['plan.json'])
+
+        loaded = Plan.load(self.filename)
+        self.assertEqual(loaded.fingerprint, 'fingerprint-1234')
+        self.assertEqual(loaded.resolved, mock_resolved)
+        self.assertEqual(
+            loaded.desired_state,
+            (mock_data, ['nagios-plugins-egi (0.2.3)'], True)
+        )
+        self.assertEqual(loaded.created, plan.created)
+
+    def test_load_unsupported_version(self):
+        Plan('fingerprint-1234', mock_data, [], False, mock_resolved).save(
+            self.filename
+        )
+        with open(self.filename, 'r') as f:
+            plan = json.load(f)
+
+        plan['version'] = 2
+        with open(self.filename, 'w') as f:
+            json.dump(plan, f)
+
+        with self.assertRaises(PlanException) as context:
+            Plan.load(self.filename)
+
+        self.assertIn('Unsupported version', str(context.exception))
+
+    def test_load_invalid_file(self):
+        with open(self.filename, 'w') as f:
+            f.write('{"version": 1}')
+
+        with self.assertRaises(PlanException):
+            Plan.load(self.filename)
+
+        with open(self.filename, 'w') as f:
+            f.write('not json')
+
+        with self.assertRaises(PlanException):
+            Plan.load(self.filename)
+
+    def test_load_nonexisting_file(self):
+        with self.assertRaises(PlanException):
+            Plan.load(os.path.join(self.tmpdir.name, 'nonexisting.json'))
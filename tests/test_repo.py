@@ -1,9 +1,14 @@
+import copy
 import os
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 from unittest import mock
 
 import requests
-from argo_poem_tools.repos import YUMRepos
+from argo_poem_tools.repos import MANIFEST, YUMRepos
 
 mock_data = {
     "data": {
@@ -127,9 +132,10 @@ OS_RELEASE_EL9 = \
 
 
 class MockResponse:
-    def __init__(self, dat, status_code):
+    def __init__(self, dat, status_code, headers=None):
         self.data = dat
         self.status_code = status_code
+        self.headers = headers if headers else dict()
         if status_code == 404:
             self.reason = 'Not Found'
 
@@ -154,6 +160,24 @@ def mock_request_ok(*args, **kwargs):
         return MockResponse(mock_data, 200)
 
 
+def mock_request_conditional(*args, **kwargs):
+    if kwargs['headers'].get('If-None-Match') == '"etag-1234"':
+        return MockResponse(None, 304)
+
+    if "repos_internal" in args[0]:
+        dat = mock_data_internal_metrics
+
+    else:
+        dat = mock_data
+
+    return MockResponse(
+        copy.deepcopy(dat), 200, headers={
+            'ETag': '"etag-1234"',
+            'Last-Modified': 'Mon, 04 Mar 2024 10:00:00 GMT'
+        }
+    )
+
+
 def mock_request_wrong_url(*args, **kwargs):
     return MockResponse(
         '<h1>Not Found</h1>\n'
@@ -225,7 +249,7 @@ class YUMReposTests(unittest.TestCase):
             os.remove('nordugrid-updates.repo')
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_el7(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_ok
         mock_sp.return_value = OS_RELEASE_EL7
@@ -246,7 +270,7 @@ class YUMReposTests(unittest.TestCase):
         )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_el9(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_ok
         mock_sp.return_value = OS_RELEASE_EL9
@@ -267,7 +291,7 @@ class YUMReposTests(unittest.TestCase):
         )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_including_internal_metrics(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_ok
         mock_sp.return_value = OS_RELEASE_EL9
@@ -354,7 +378,30 @@ class YUMReposTests(unittest.TestCase):
         )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
+    def test_get_data_including_internal_metrics_concurrently(
+            self, mock_request, mock_sp
+    ):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def mock_concurrent_request(*args, **kwargs):
+            # fails with BrokenBarrierError unless both requests are pending
+            barrier.wait()
+            return mock_request_ok(*args, **kwargs)
+
+        mock_request.side_effect = mock_concurrent_request
+        mock_sp.return_value = OS_RELEASE_EL9
+        data = self.repos1.get_data(include_internal=True)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(
+            sorted(data.keys()), ['argo-devel', 'nordugrid-updates']
+        )
+        session = self.repos1.session
+        self.repos1.get_data(include_internal=True)
+        self.assertIs(self.repos1.session, session)
+
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_hostname_http(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_ok
         mock_sp.return_value = OS_RELEASE_EL9
@@ -375,7 +422,7 @@ class YUMReposTests(unittest.TestCase):
         )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_hostname_http_including_internal(
             self, mock_request, mock_sp
     ):
@@ -463,7 +510,7 @@ class YUMReposTests(unittest.TestCase):
         )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_hostname_https(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_ok
         mock_sp.return_value = OS_RELEASE_EL9
@@ -484,7 +531,7 @@ class YUMReposTests(unittest.TestCase):
         )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_hostname_https_including_internal(
             self, mock_request, mock_sp
     ):
@@ -572,7 +619,130 @@ class YUMReposTests(unittest.TestCase):
         )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
+    def test_get_data_if_not_modified(self, mock_request, mock_sp):
+        mock_request.side_effect = mock_request_conditional
+        mock_sp.return_value = OS_RELEASE_EL9
+        with tempfile.TemporaryDirectory() as cache_dir:
+            repos = YUMRepos(
+                hostname='mock.url.com',
+                token='some-token-1234',
+                profiles=['TEST_PROFILE1', 'TEST_PROFILE2'],
+                repos_path=os.getcwd(),
+                cache_dir=cache_dir
+            )
+            data1 = repos.get_data()
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertEqual(
+                repos.cache_hits,
+                {'https://mock.url.com/api/v2/repos/rocky9': False}
+            )
+            data2 = repos.get_data()
+            self.assertEqual(
+                repos.cache_hits,
+                {'https://mock.url.com/api/v2/repos/rocky9': True}
+            )
+            self.assertEqual(mock_request.call_count, 2)
+            mock_request.assert_has_calls([
+                mock.call(
+                    'https://mock.url.com/api/v2/repos/rocky9',
+                    headers={
+                        'x-api-key': 'some-token-1234',
+                        'profiles': '[TEST_PROFILE1, TEST_PROFILE2]'
+                    },
+                    timeout=180
+                ),
+                mock.call(
+                    'https://mock.url.com/api/v2/repos/rocky9',
+                    headers={
+                        'x-api-key': 'some-token-1234',
+                        'profiles': '[TEST_PROFILE1, TEST_PROFILE2]',
+                        'If-None-Match': '"etag-1234"',
+                        'If-Modified-Since': 'Mon, 04 Mar 2024 10:00:00 GMT'
+                    },
+                    timeout=180
+                )
+            ])
+            self.assertEqual(data1, mock_data['data'])
+            self.assertEqual(data2, mock_data['data'])
+            self.assertEqual(
+                repos.missing_packages,
+                [
+                    'nagios-plugins-bdii (1.0.14)',
+                    'nagios-plugins-egi-notebooks (0.2.3)'
+                ]
+            )
+
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('requests.Session.get')
+    def test_get_data_including_internal_if_not_modified(
+            self, mock_request, mock_sp
+    ):
+        mock_request.side_effect = mock_request_conditional
+        mock_sp.return_value = OS_RELEASE_EL9
+        with tempfile.TemporaryDirectory() as cache_dir:
+            repos = YUMRepos(
+                hostname='mock.url.com',
+                token='some-token-1234',
+                profiles=['TEST_PROFILE1', 'TEST_PROFILE2'],
+                repos_path=os.getcwd(),
+                cache_dir=cache_dir
+            )
+            data1 = repos.get_data(include_internal=True)
+            missing1 = repos.missing_packages
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            data2 = repos.get_data(include_internal=True)
+            self.assertEqual(mock_request.call_count, 4)
+            for call in mock_request.call_args_list[2:]:
+                self.assertEqual(
+                    call[1]['headers']['If-None-Match'], '"etag-1234"'
+                )
+
+            self.assertEqual(data1, data2)
+            self.assertEqual(
+                [p['name'] for p in data2['argo-devel']['packages']],
+                [
+                    'argo-probe-ams-publisher', 'argo-probe-argo-tools',
+                    'argo-probe-oidc', 'nagios-plugins-fedcloud',
+                    'nagios-plugins-globus', 'nagios-plugins-igtf'
+                ]
+            )
+            self.assertEqual(repos.missing_packages, missing1)
+
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('requests.Session.get')
+    def test_get_data_cache_keyed_by_profiles(self, mock_request, mock_sp):
+        mock_request.side_effect = mock_request_conditional
+        mock_sp.return_value = OS_RELEASE_EL9
+        with tempfile.TemporaryDirectory() as cache_dir:
+            repos1 = YUMRepos(
+                hostname='mock.url.com',
+                token='some-token-1234',
+                profiles=['TEST_PROFILE1', 'TEST_PROFILE2'],
+                repos_path=os.getcwd(),
+                cache_dir=cache_dir
+            )
+            repos2 = YUMRepos(
+                hostname='mock.url.com',
+                token='some-token-1234',
+                profiles=['TEST_PROFILE1'],
+                repos_path=os.getcwd(),
+                cache_dir=cache_dir
+            )
+            repos1.get_data()
+            repos2.get_data()
+            mock_request.assert_called_with(
+                'https://mock.url.com/api/v2/repos/rocky9',
+                headers={
+                    'x-api-key': 'some-token-1234',
+                    'profiles': '[TEST_PROFILE1]'
+                },
+                timeout=180
+            )
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_server_error(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_server_error
         mock_sp.return_value = OS_RELEASE_EL9
@@ -581,7 +751,7 @@ class YUMReposTests(unittest.TestCase):
             self.assertEqual(err, '500 Server Error')
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_server_error_including_internal(
             self, mock_request, mock_sp
     ):
@@ -592,7 +762,7 @@ class YUMReposTests(unittest.TestCase):
             self.assertEqual(err, '500 Server Error')
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_wrong_url(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_wrong_url
         mock_sp.return_value = OS_RELEASE_EL9
@@ -601,7 +771,7 @@ class YUMReposTests(unittest.TestCase):
             self.assertEqual(err, '404 Not Found')
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_wrong_token(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_wrong_token
         mock_sp.return_value = OS_RELEASE_EL9
@@ -613,7 +783,7 @@ class YUMReposTests(unittest.TestCase):
             )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_no_profiles(self, mock_request, mock_sp):
         mock_request.side_effect = mock_request_wrong_profiles
         mock_sp.return_value = OS_RELEASE_EL9
@@ -624,7 +794,7 @@ class YUMReposTests(unittest.TestCase):
             )
 
     @mock.patch('argo_poem_tools.repos.subprocess.check_output')
-    @mock.patch('argo_poem_tools.repos.requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_data_if_json_without_details(
             self, mock_request, mock_sp
     ):
@@ -878,6 +1048,7 @@ class YUMReposTests(unittest.TestCase):
         mock_isfile.return_value = True
         file1 = os.path.join(os.getcwd(), 'argo-devel.repo')
         file2 = os.path.join(os.getcwd(), 'nordugrid-updates.repo')
+        self.repos5.changed_repos = ['argo-devel', 'nordugrid-updates']
         self.repos5.clean()
         self.assertEqual(mock_isdir.call_count, 1)
         mock_isdir.assert_called_with('/tmp' + os.getcwd())
@@ -895,15 +1066,243 @@ class YUMReposTests(unittest.TestCase):
         ], any_order=True)
         self.assertEqual(mock_rm.call_count, 1)
         mock_rm.assert_called_with('/tmp' + os.getcwd())
-        self.assertEqual(mock_call.call_count, 1)
-        mock_call.assert_called_with(['yum', 'clean', 'all'])
+        mock_call.assert_called_once_with([
+            'yum', 'clean', 'metadata', '--disablerepo=*',
+            '--enablerepo=argo-devel,nordugrid-updates'
+        ])
 
     @mock.patch('argo_poem_tools.repos.subprocess.call')
     @mock.patch('argo_poem_tools.repos.shutil.copy')
     @mock.patch('argo_poem_tools.repos.shutil.rmtree')
     def test_clean_if_override(self, mock_rmdir, mock_copy, mock_call):
+        self.repos1.changed_repos = ['argo-devel']
         self.repos1.clean()
         self.assertEqual(mock_rmdir.call_count, 0)
         self.assertEqual(mock_copy.call_count, 0)
-        self.assertEqual(mock_call.call_count, 1)
-        mock_call.assert_called_with(['yum', 'clean', 'all'])
+        self.assertFalse(mock_call.called)
+
+    @mock.patch(
+        'argo_poem_tools.repos.yum_is_dnf', mock.Mock(return_value=False)
+    )
+    @mock.patch('argo_poem_tools.repos.subprocess.call')
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('argo_poem_tools.repos.YUMRepos.get_data')
+    def test_expire_cache_only_for_changed_repos(
+            self, mock_get_data, mock_sp, mock_call
+    ):
+        mock_get_data.return_value = mock_data["data"]
+        mock_sp.return_value = OS_RELEASE_EL9
+        with open('argo-devel.repo', 'w') as f:
+            f.write(mock_data['data']['argo-devel']['content'])
+
+        self.repos1.create_file()
+        self.assertEqual(
+            self.repos1.repo_ids, ['argo-devel', 'nordugrid-updates']
+        )
+        self.assertEqual(self.repos1.changed_repos, ['nordugrid-updates'])
+        self.repos1.expire_cache()
+        mock_call.assert_called_once_with([
+            'yum', 'clean', 'metadata', '--disablerepo=*',
+            '--enablerepo=nordugrid-updates'
+        ])
+
+    @mock.patch(
+        'argo_poem_tools.repos.yum_is_dnf', mock.Mock(return_value=True)
+    )
+    @mock.patch('argo_poem_tools.repos.subprocess.call')
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('argo_poem_tools.repos.YUMRepos.get_data')
+    def test_expire_cache_with_dnf(self, mock_get_data, mock_sp, mock_call):
+        mock_get_data.return_value = mock_data["data"]
+        mock_sp.return_value = OS_RELEASE_EL9
+        with open('argo-devel.repo', 'w') as f:
+            f.write(mock_data['data']['argo-devel']['content'])
+
+        self.repos1.create_file()
+        self.repos1.expire_cache()
+        # dnf would clean metadata of all the repos, they are refreshed
+        mock_call.assert_called_once_with([
+            'yum', 'makecache', '--refresh', '--disablerepo=*',
+            '--enablerepo=nordugrid-updates'
+        ])
+
+    @mock.patch('argo_poem_tools.repos.subprocess.call')
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('argo_poem_tools.repos.YUMRepos.get_data')
+    def test_expire_cache_if_nothing_changed(
+            self, mock_get_data, mock_sp, mock_call
+    ):
+        mock_get_data.return_value = mock_data["data"]
+        mock_sp.return_value = OS_RELEASE_EL9
+        self.repos1.create_file()
+        repos = YUMRepos(
+            hostname='mock.url.com',
+            token='some-token-1234',
+            profiles=['TEST_PROFILE1', 'TEST_PROFILE2'],
+            repos_path=os.getcwd()
+        )
+        repos.create_file()
+        self.assertEqual(repos.changed_repos, [])
+        repos.expire_cache()
+        self.assertFalse(mock_call.called)
+
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('argo_poem_tools.repos.YUMRepos.get_data')
+    def test_create_file_skip_unchanged(self, mock_get_data, mock_sp):
+        mock_get_data.return_value = mock_data["data"]
+        mock_sp.return_value = OS_RELEASE_EL9
+        with open('argo-devel.repo', 'w') as f:
+            f.write(mock_data['data']['argo-devel']['content'])
+
+        os.utime('argo-devel.repo', ns=(0, 0))
+        listing = set(os.listdir(os.getcwd()))
+        files = self.repos1.create_file()
+        file1 = os.path.join(os.getcwd(), 'argo-devel.repo')
+        file2 = os.path.join(os.getcwd(), 'nordugrid-updates.repo')
+        self.assertEqual(files, [file1, file2])
+        self.assertEqual(self.repos1.changed_files, [file2])
+        self.assertEqual(os.stat('argo-devel.repo').st_mtime_ns, 0)
+        self.assertEqual(
+            set(os.listdir(os.getcwd())) - listing,
+            {'nordugrid-updates.repo'}
+        )
+        self.assertEqual(
+            oct(os.stat('nordugrid-updates.repo').st_mode & 0o777), '0o644'
+        )
+
+    @mock.patch('argo_poem_tools.files.os.replace')
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('argo_poem_tools.repos.YUMRepos.get_data')
+    def test_create_file_if_write_fails(
+            self, mock_get_data, mock_sp, mock_replace
+    ):
+        mock_get_data.return_value = mock_data["data"]
+        mock_sp.return_value = OS_RELEASE_EL9
+        mock_replace.side_effect = OSError('No space left on device')
+        with open('argo-devel.repo', 'w') as f:
+            f.write('test')
+
+        listing = set(os.listdir(os.getcwd()))
+        with self.assertRaises(OSError):
+            self.repos1.create_file()
+
+        with open('argo-devel.repo', 'r') as f:
+            self.assertEqual(f.read(), 'test')
+
+        self.assertEqual(set(os.listdir(os.getcwd())), listing)
+
+    @mock.patch(
+        'argo_poem_tools.repos.yum_is_dnf', mock.Mock(return_value=False)
+    )
+    @mock.patch('argo_poem_tools.repos.subprocess.call')
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('argo_poem_tools.repos.YUMRepos.get_data')
+    def test_create_file_in_private_reposdir(
+            self, mock_get_data, mock_sp, mock_call
+    ):
+        mock_get_data.return_value = mock_data["data"]
+        mock_sp.return_value = OS_RELEASE_EL9
+        with tempfile.TemporaryDirectory() as tmpdir:
+            system = os.path.join(tmpdir, 'yum.repos.d')
+            private = os.path.join(tmpdir, 'repos.d')
+            os.makedirs(system)
+            os.makedirs(private)
+            with open(os.path.join(system, 'argo-devel.repo'), 'w') as f:
+                f.write('test')
+
+            with open(os.path.join(private, 'removed.repo'), 'w') as f:
+                f.write('[removed]\n')
+
+            # repo files not written by the tool are left intact
+            with open(os.path.join(private, 'local.repo'), 'w') as f:
+                f.write('[local]\n')
+
+            with open(os.path.join(private, MANIFEST), 'w') as f:
+                f.write('argo-devel.repo\nremoved.repo\n')
+
+            repos = YUMRepos(
+                hostname='mock.url.com',
+                token='some-token-1234',
+                profiles=['TEST_PROFILE1', 'TEST_PROFILE2'],
+                repos_path=system,
+                private_reposdir=private
+            )
+            self.assertEqual(repos.reposdir, [private, system])
+            files = repos.create_file()
+            self.assertEqual(
+                files,
+                [
+                    os.path.join(private, 'argo-devel.repo'),
+                    os.path.join(private, 'nordugrid-updates.repo')
+                ]
+            )
+            self.assertEqual(
+                sorted(os.listdir(private)),
+                [
+                    MANIFEST, 'argo-devel.repo', 'local.repo',
+                    'nordugrid-updates.repo'
+                ]
+            )
+            with open(os.path.join(private, MANIFEST), 'r') as f:
+                self.assertEqual(
+                    f.read(), 'argo-devel.repo\nnordugrid-updates.repo\n'
+                )
+
+            self.assertEqual(os.listdir(system), ['argo-devel.repo'])
+            with open(os.path.join(system, 'argo-devel.repo'), 'r') as f:
+                self.assertEqual(f.read(), 'test')
+
+            repos.expire_cache()
+            mock_call.assert_called_once_with([
+                'yum', 'clean', 'metadata',
+                '--setopt=reposdir={},{}'.format(private, system),
+                '--disablerepo=*',
+                '--enablerepo=argo-devel,nordugrid-updates'
+            ])
+            repos.clean()
+            self.assertEqual(len(os.listdir(private)), 4)
+
+    @mock.patch('argo_poem_tools.repos.subprocess.check_output')
+    @mock.patch('requests.Session.get')
+    def test_get_cached_data(self, mock_request, mock_sp):
+        mock_request.side_effect = mock_request_ok
+        mock_sp.return_value = OS_RELEASE_EL9
+        with tempfile.TemporaryDirectory() as cache_dir:
+            repos = YUMRepos(
+                hostname='mock.url.com',
+                token='some-token-1234',
+                profiles=['TEST_PROFILE1', 'TEST_PROFILE2'],
+                repos_path=os.getcwd(),
+                cache_dir=cache_dir
+            )
+            self.assertIsNone(repos.get_cached_data())
+            data = repos.get_data()
+            self.assertIsNone(repos.get_cached_data(include_internal=True))
+
+            repos = YUMRepos(
+                hostname='mock.url.com',
+                token='some-token-1234',
+                profiles=['TEST_PROFILE1', 'TEST_PROFILE2'],
+                repos_path=os.getcwd(),
+                cache_dir=cache_dir
+            )
+            self.assertEqual(repos.get_cached_data(), data)
+            self.assertEqual(
+                repos.missing_packages,
+                [
+                    'nagios-plugins-bdii (1.0.14)',
+                    'nagios-plugins-egi-notebooks (0.2.3)'
+                ]
+            )
+            self.assertEqual(mock_request.call_count, 1)
+
+    def test_requests_not_imported_until_needed(self):
+        output = subprocess.check_output(
+            [
+                sys.executable, '-c',
+                'import sys; import argo_poem_tools.repos; '
+                'print("requests" in sys.modules)'
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        self.assertEqual(output.strip(), b'False')
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from argo_poem_tools.scheduler import Scheduler
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 0.
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conf = os.path.join(self.tmpdir.name, 'argo-poem-tools.conf')
+        with open(self.conf, 'w') as f:
+            f.write('[GENERAL]\n')
+
+        self.clock = MockClock()
+        self.patches = [
+            mock.patch(
+                'argo_poem_tools.scheduler.time.monotonic',
+                side_effect=self.clock.monotonic
+            ),
+            mock.patch(
+                'argo_poem_tools.scheduler.time.sleep',
+                side_effect=self.clock.sleep
+            )
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        self.scheduler = Scheduler(60, max_interval=300, watch=[self.conf])
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+        self.tmpdir.cleanup()
+
+    def test_wait_interval(self):
+        self.assertTrue(self.scheduler.wait())
+        self.assertEqual(self.clock.now, 60)
+
+    def test_backoff_if_nothing_changed(self):
+        self.scheduler.update(changed=False)
+        self.assertEqual(self.scheduler.current_interval, 120)
+        self.scheduler.update(changed=False)
+        self.scheduler.update(changed=False)
+        self.assertEqual(self.scheduler.current_interval, 300)
+        self.assertTrue(self.scheduler.wait())
+        self.assertEqual(self.clock.now, 300)
+        self.scheduler.update(changed=True)
+        self.assertEqual(self.scheduler.current_interval, 60)
+
+    def test_wait_if_watched_file_changed(self):
+        self.scheduler.update(changed=False)
+        self.scheduler.update(changed=False)
+
+        def modify(seconds):
+            self.clock.sleep(seconds)
+            if self.clock.now == 5:
+                os.utime(self.conf, ns=(0, 0))
+
+        with mock.patch(
+                'argo_poem_tools.scheduler.time.sleep', side_effect=modify
+        ):
+            self.assertTrue(self.scheduler.wait())
+
+        self.assertEqual(self.clock.now, 5)
+        self.assertEqual(self.scheduler.current_interval, 60)
+
+    def test_wait_if_watched_file_removed(self):
+        os.remove(self.conf)
+        self.assertTrue(self.scheduler.wait())
+        self.assertEqual(self.clock.now, 0)
+        self.assertTrue(self.scheduler.wait())
+        self.assertEqual(self.clock.now, 60)
+
+    def test_wait_if_stopped(self):
+        def stop(seconds):
+            self.clock.sleep(seconds)
+            self.scheduler.stop()
+
+        with mock.patch(
+                'argo_poem_tools.scheduler.time.sleep', side_effect=stop
+        ):
+            self.assertFalse(self.scheduler.wait())
+
+        self.assertEqual(self.clock.now, 1)
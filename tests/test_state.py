@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+
+from argo_poem_tools.state import RunState, pinned
+
+mock_data = {
+    "argo-devel": {
+        "content": "[argo-devel]\n"
+                   "name=ARGO Product Repository\n"
+                   "baseurl=http://rpm-repo.argo.grnet.gr/ARGO/devel/centos7/\n"
+                   "gpgcheck=0\n"
+                   "enabled=1\n",
+        "packages": [
+            {
+                "name": "nagios-plugins-fedcloud",
+                "version": "0.5.0"
+            },
+            {
+                "name": "nagios-plugins-argo",
+                "version": "present"
+            }
+        ]
+    }
+}
+
+mock_installed = [
+    dict(name='nagios-plugins-argo', epoch=0, version='0.1.13',
+         release='20200901060701.5869b94.el7', arch='noarch'),
+    dict(name='nagios-plugins-fedcloud', epoch=0, version='0.5.0',
+         release='20200511071632.05e2501.el7', arch='noarch')
+]
+
+mock_installed_upgraded = [
+    dict(mock_installed[0], version='0.1.14'), mock_installed[1]
+]
+
+
+class RunStateTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state = RunState(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fingerprint(self):
+        fingerprint1 = self.state.fingerprint(
+            mock_data, [], False, installed=mock_installed
+        )
+        fingerprint2 = self.state.fingerprint(
+            mock_data, [], False, installed=list(reversed(mock_installed))
+        )
+        self.assertEqual(fingerprint1, fingerprint2)
+        self.assertNotEqual(
+            fingerprint1,
+            self.state.fingerprint(
+                mock_data, [], True, installed=mock_installed
+            )
+        )
+        self.assertNotEqual(
+            fingerprint1,
+            self.state.fingerprint(
+                mock_data, [], False, installed=mock_installed_upgraded
+            )
+        )
+
+    def test_unchanged(self):
+        fingerprint = self.state.fingerprint(
+            mock_data, [], False, installed=mock_installed
+        )
+        self.assertFalse(self.state.unchanged(fingerprint))
+        self.state.save(fingerprint)
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.tmpdir.name, 'fingerprint'))
+        )
+        self.assertTrue(self.state.unchanged(fingerprint))
+        self.assertFalse(
+            self.state.unchanged(self.state.fingerprint(
+                mock_data, [], False, installed=mock_installed_upgraded
+            ))
+        )
+
+    def test_unchanged_if_no_fingerprint(self):
+        self.state.save(None)
+        self.assertFalse(
+            os.path.isfile(os.path.join(self.tmpdir.name, 'fingerprint'))
+        )
+        self.assertFalse(self.state.unchanged(None))
+
+    def test_pinned(self):
+        self.assertFalse(pinned(mock_data))
+        self.assertTrue(pinned({
+            'argo-devel': {
+                'content': mock_data['argo-devel']['content'],
+                'packages': [
+                    {'name': 'nagios-plugins-fedcloud', 'version': '0.5.0'}
+                ]
+            }
+        }))
+        self.assertTrue(pinned({}))
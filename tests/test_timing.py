@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from argo_poem_tools import timing
+
+
+class TimingTests(unittest.TestCase):
+    def setUp(self):
+        timing.reset()
+
+    def tearDown(self):
+        timing.reset()
+
+    def test_nested_spans(self):
+        with timing.span('packages'):
+            with timing.span('yum install', packages=2):
+                pass
+
+        with timing.span('expire'):
+            pass
+
+        spans = timing.get_spans()
+        self.assertEqual(
+            [(span['name'], span['depth'], span['parent']) for span in spans],
+            [
+                ('packages', 0, None),
+                ('yum install', 1, 'packages'),
+                ('expire', 0, None)
+            ]
+        )
+        self.assertEqual(spans[1]['attrs'], {'packages': 2})
+        self.assertNotIn('attrs', spans[0])
+        for span in spans:
+            self.assertGreaterEqual(span['duration'], 0)
+
+        self.assertLessEqual(spans[0]['start'], spans[1]['start'])
+
+    def test_span_closed_on_exception(self):
+        with self.assertRaises(ValueError):
+            with timing.span('poem'):
+                raise ValueError('error')
+
+        with timing.span('repos'):
+            pass
+
+        spans = timing.get_spans()
+        self.assertIsNotNone(spans[0]['duration'])
+        self.assertEqual(spans[1]['depth'], 0)
+
+    def test_inherit_in_other_thread(self):
+        def work():
+            with timing.span('rpm -qa'):
+                pass
+
+        with timing.span('poem'):
+            thread = threading.Thread(target=timing.inherit(work))
+            thread.start()
+            thread.join()
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+        spans = timing.get_spans()
+        self.assertEqual(spans[1]['name'], 'rpm -qa')
+        self.assertEqual(spans[1]['parent'], 'poem')
+        self.assertEqual(spans[1]['depth'], 1)
+        self.assertNotEqual(spans[1]['thread'], spans[0]['thread'])
+        self.assertEqual(spans[2]['parent'], None)
+        self.assertEqual(spans[2]['depth'], 0)
+
+    def test_reset(self):
+        with timing.span('poem'):
+            pass
+
+        timing.reset()
+        self.assertEqual(timing.get_spans(), [])
+
+    def test_summary(self):
+        with timing.span('poem'):
+            with timing.span('poem request'):
+                pass
+
+        with timing.span('packages'):
+            pass
+
+        with timing.span('packages'):
+            pass
+
+        summary = timing.summary()
+        self.assertRegex(
+            summary, r'^total \d+\.\d\d s; poem \d+\.\d\d s, '
+                     r'packages \d+\.\d\d s$'
+        )
+
+    def test_report(self):
+        with timing.span('packages'):
+            with timing.span('yum install'):
+                pass
+
+        lines = timing.report().split('\n')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].endswith('  packages'))
+        self.assertTrue(lines[2].endswith('    yum install'))
+        self.assertTrue(lines[3].startswith('Total: '))
+
+    def test_write_trace(self):
+        with timing.span('poem', url='https://poem.example.com'):
+            pass
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'timings.json')
+            timing.write_trace(filename)
+            self.assertEqual(os.listdir(tmpdir), ['timings.json'])
+
+            with open(filename, 'r') as f:
+                trace = json.load(f)
+
+        self.assertGreaterEqual(trace['total'], 0)
+        self.assertEqual(len(trace['spans']), 1)
+        self.assertEqual(trace['spans'][0]['name'], 'poem')
+        self.assertEqual(
+            trace['spans'][0]['attrs'], {'url': 'https://poem.example.com'}
+        )
@@ -0,0 +1,164 @@
+import subprocess
+import unittest
+from unittest import mock
+
+from argo_poem_tools.versionlock import VersionLockManager, \
+    _parse_locked_names
+
+mock_yum_versionlock_list = \
+"""
+Loaded plugins: fastestmirror, ovl, versionlock
+0:nagios-plugins-argo-0.1.12-20200811040245.d758e91.el7.*
+0:nagios-plugins-fedcloud-0.5.2-20201217023205.1b502c8.el7.*
+!0:nagios-plugins-igtf-1.4.0-3.el7.*
+versionlock list done
+""".encode('utf-8')
+
+mock_dnf_versionlock_list = \
+"""
+Last metadata expiration check: 0:12:43 ago on Mon 04 Mar 2024 10:00:00 CET.
+argo-probe-argo-tools-0:0.1.1-20230508101256.8b1a2b3.el9.*
+argo-probe-ams-publisher-0:0.3.3-20230404125611.1dc3df0.el9.*
+""".encode('utf-8')
+
+
+def mock_func(*args, **kwargs):
+    pass
+
+
+def mock_func_failure(*args, **kwargs):
+    return 1
+
+
+class VersionLockTests(unittest.TestCase):
+    def setUp(self):
+        self.versionlock = VersionLockManager()
+
+    def test_parse_yum_versionlock_list(self):
+        self.assertEqual(
+            _parse_locked_names(mock_yum_versionlock_list.decode('utf-8')),
+            {'nagios-plugins-argo', 'nagios-plugins-fedcloud'}
+        )
+
+    def test_parse_dnf_versionlock_list(self):
+        self.assertEqual(
+            _parse_locked_names(mock_dnf_versionlock_list.decode('utf-8')),
+            {'argo-probe-argo-tools', 'argo-probe-ams-publisher'}
+        )
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.check_output')
+    def test_list_only_once(self, mock_versionlock):
+        mock_versionlock.return_value = mock_yum_versionlock_list
+        self.assertEqual(
+            self.versionlock.list(),
+            {'nagios-plugins-argo', 'nagios-plugins-fedcloud'}
+        )
+        self.assertEqual(
+            self.versionlock.list(),
+            {'nagios-plugins-argo', 'nagios-plugins-fedcloud'}
+        )
+        mock_versionlock.assert_called_once_with(
+            ['yum', 'versionlock', 'list']
+        )
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.call')
+    @mock.patch('argo_poem_tools.versionlock.subprocess.check_output')
+    def test_add(self, mock_versionlock, mock_call):
+        mock_versionlock.return_value = mock_yum_versionlock_list
+        mock_call.side_effect = mock_func
+        self.versionlock.list()
+        failed = self.versionlock.add([
+            'nagios-plugins-argo', 'nagios-plugins-igtf', 'nagios-plugins-http'
+        ])
+        self.assertEqual(failed, [])
+        mock_call.assert_called_once_with(
+            [
+                'yum', 'versionlock', 'add', 'nagios-plugins-igtf',
+                'nagios-plugins-http'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self.assertEqual(
+            self.versionlock.list(),
+            {
+                'nagios-plugins-argo', 'nagios-plugins-fedcloud',
+                'nagios-plugins-igtf', 'nagios-plugins-http'
+            }
+        )
+        self.assertEqual(mock_versionlock.call_count, 1)
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.call')
+    @mock.patch('argo_poem_tools.versionlock.subprocess.check_output')
+    def test_add_nothing_new(self, mock_versionlock, mock_call):
+        mock_versionlock.return_value = mock_yum_versionlock_list
+        self.versionlock.list()
+        self.assertEqual(self.versionlock.add(['nagios-plugins-argo']), [])
+        self.assertFalse(mock_call.called)
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.call')
+    def test_add_if_list_not_read(self, mock_call):
+        mock_call.side_effect = mock_func
+        failed = self.versionlock.add(
+            ['nagios-plugins-argo', 'nagios-plugins-igtf']
+        )
+        self.assertEqual(failed, [])
+        mock_call.assert_called_once_with(
+            [
+                'yum', 'versionlock', 'add', 'nagios-plugins-argo',
+                'nagios-plugins-igtf'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self.assertIsNone(self.versionlock.locked)
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.call')
+    @mock.patch('argo_poem_tools.versionlock.subprocess.check_output')
+    def test_add_failure(self, mock_versionlock, mock_call):
+        mock_versionlock.return_value = mock_yum_versionlock_list
+        mock_call.side_effect = mock_func_failure
+        self.versionlock.list()
+        failed = self.versionlock.add(['nagios-plugins-igtf'])
+        self.assertEqual(failed, ['nagios-plugins-igtf'])
+        self.assertEqual(
+            self.versionlock.list(),
+            {'nagios-plugins-argo', 'nagios-plugins-fedcloud'}
+        )
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.call')
+    @mock.patch('argo_poem_tools.versionlock.subprocess.check_output')
+    def test_delete(self, mock_versionlock, mock_call):
+        mock_versionlock.return_value = mock_yum_versionlock_list
+        mock_call.side_effect = mock_func
+        self.versionlock.list()
+        failed = self.versionlock.delete(
+            ['nagios-plugins-argo', 'nagios-plugins-fedcloud',
+             'nagios-plugins-http']
+        )
+        self.assertEqual(failed, [])
+        mock_call.assert_called_once_with(
+            [
+                'yum', 'versionlock', 'delete', 'nagios-plugins-argo',
+                'nagios-plugins-fedcloud'
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self.assertEqual(self.versionlock.list(), set())
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.call')
+    @mock.patch('argo_poem_tools.versionlock.subprocess.check_output')
+    def test_delete_failure(self, mock_versionlock, mock_call):
+        mock_versionlock.return_value = mock_yum_versionlock_list
+        mock_call.side_effect = mock_func_failure
+        self.versionlock.list()
+        failed = self.versionlock.delete(['nagios-plugins-argo'])
+        self.assertEqual(failed, ['nagios-plugins-argo'])
+        self.assertEqual(
+            self.versionlock.list(),
+            {'nagios-plugins-argo', 'nagios-plugins-fedcloud'}
+        )
+
+    @mock.patch('argo_poem_tools.versionlock.subprocess.call')
+    def test_add_without_yum(self, mock_call):
+        mock_call.side_effect = FileNotFoundError
+        failed = self.versionlock.add(['nagios-plugins-igtf'])
+        self.assertEqual(failed, ['nagios-plugins-igtf'])